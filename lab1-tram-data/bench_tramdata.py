@@ -0,0 +1,195 @@
+# Benchmarks for the Lab 1 data layer on synthetic networks (extra feature)
+#
+#   python bench_tramdata.py                  default scales
+#   python bench_tramdata.py 5000,100,50 ...  scales as stops,lines,line length
+#
+# For every scale a synthetic tramstops.json/tramlines.txt pair is written
+# to a temporary directory, and each operation is reported with its time
+# per call and the peak memory allocated while it runs.
+
+import io
+import os
+import sys
+import random
+import tempfile
+import time
+import tracemalloc
+
+import tramdata as td
+
+# (number of stops, number of lines, stops per line)
+SCALES = [(100, 10, 20), (1000, 50, 40), (10000, 200, 60)]
+
+# calls per query benchmark
+REPEAT = 1000
+
+
+def make_synthetic_network(directory, nstops, nlines, line_length, seed=0):
+
+    # Write tramstops.json and tramlines.txt in the formats of ./data
+    # and return their paths. Stops are spread around Gothenburg and
+    # every line visits line_length distinct random stops.
+    rng = random.Random(seed)
+    names = [f"Hållplats {i} Östra" if i % 7 == 0 else f"Stop {i}" for i in range(nstops)]
+
+    stops = {}
+    for name in names:
+        stops[name] = {
+            "town": "Göteborg",
+            "position": [f"{57.60 + 0.2 * rng.random():.7f}",
+                         f"{11.85 + 0.3 * rng.random():.7f}"],
+        }
+
+    stopfile = os.path.join(directory, "tramstops.json")
+    with open(stopfile, "w", encoding="utf-8") as f:
+        td.json.dump(stops, f, indent=4)
+
+    linefile = os.path.join(directory, "tramlines.txt")
+    with open(linefile, "w", encoding="utf-8") as f:
+        for line in range(1, nlines + 1):
+            f.write(f"{line}:\n")
+            minutes = 10 * 60
+            for name in rng.sample(names, min(line_length, nstops)):
+                f.write(f"{name:<26}{minutes // 60:02d}:{minutes % 60:02d}\n")
+                minutes += rng.randint(0, 3)
+            f.write("\n")
+
+    return stopfile, linefile
+
+
+def measure(fn, repeat=1):
+
+    # Seconds per call, then peak traced memory of one more call.
+    # Timing runs without tracemalloc, which would slow it down.
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    seconds = (time.perf_counter() - start) / repeat
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def cycle(items):
+    # Endless iterator over items, for varying query arguments
+    while True:
+        yield from items
+
+
+def bench_scale(nstops, nlines, line_length, directory, repeat=REPEAT):
+
+    # Return (operation, seconds per call, peak bytes) rows for one scale
+    stopfile, linefile = make_synthetic_network(directory, nstops, nlines, line_length)
+    tramfile = os.path.join(directory, "tramnetwork.json")
+
+    with open(linefile, encoding="utf-8") as f:
+        text = f.read()
+
+    rows = []
+
+    def run(name, fn, n=1):
+        seconds, peak = measure(fn, n)
+        rows.append((name, seconds, peak))
+
+    run("build_tram_lines", lambda: td.build_tram_lines(io.StringIO(text)))
+    run("build_tram_network",
+        lambda: td.build_tram_network(stopfile, linefile, tramfile=tramfile))
+
+    tramdict = td.load_tram_network(tramfile)
+    stopdict = tramdict["stops"]
+    linedict = tramdict["lines"]
+    timedict = tramdict["times"]
+
+    def build_index():
+        tramdict.pop("index", None)
+        td.network_index(tramdict)
+
+    run("network_index", build_index)
+    index = tramdict["index"]
+
+    rng = random.Random(1)
+    names = list(stopdict)
+    lines = list(linedict)
+    pairs = cycle([(rng.choice(names), rng.choice(names)) for _ in range(repeat)])
+    singles = cycle([rng.choice(names) for _ in range(repeat)])
+    on_line = []
+    for _ in range(repeat):
+        line = rng.choice(lines)
+        on_line.append((line, rng.choice(linedict[line]), rng.choice(linedict[line])))
+    on_line = cycle(on_line)
+    raws = cycle([td.normalize_stop_name(rng.choice(names))[2:-1] for _ in range(repeat)])
+
+    def between(index=None):
+        a, b = next(pairs)
+        td.lines_between_stops(linedict, a, b, index)
+
+    def line_time(index=None):
+        line, a, b = next(on_line)
+        td.time_between_stops(linedict, timedict, line, a, b, index)
+
+    def distance(index=None):
+        a, b = next(pairs)
+        td.distance_between_stops(stopdict, a, b, index)
+
+    run("lines_via_stop", lambda: td.lines_via_stop(linedict, next(singles)), repeat)
+    run("lines_via_stop (index)",
+        lambda: td.lines_via_stop(linedict, next(singles), index["lines"]), repeat)
+    run("lines_between_stops", between, repeat)
+    run("lines_between_stops (index)", lambda: between(index["lines"]), repeat)
+    run("time_between_stops", line_time, repeat)
+    run("time_between_stops (index)", lambda: line_time(index["times"]), repeat)
+    run("distance_between_stops", distance, repeat)
+    run("distance_between_stops (index)", lambda: distance(index["geo"]), repeat)
+    run("resolve_stop_name", lambda: td.resolve_stop_name(stopdict, next(raws)), repeat)
+    run("resolve_stop_name (index)",
+        lambda: td.resolve_stop_name(stopdict, next(raws), index["names"]), repeat)
+
+    queries = []
+    for _ in range(repeat):
+        a, b = next(pairs)
+        line, c, d = next(on_line)
+        queries.append(rng.choice([
+            f"via {a}",
+            f"between {a} and {b}",
+            f"time with {line} from {c} to {d}",
+            f"distance from {a} to {b}",
+        ]))
+    queries = cycle(queries)
+
+    def cold_query():
+        td.clear_query_cache(tramdict)
+        td.answer_query(tramdict, next(queries))
+
+    run("answer_query (cold cache)", cold_query, repeat)
+    for _ in range(repeat):
+        td.answer_query(tramdict, next(queries))
+    run("answer_query (warm cache)", lambda: td.answer_query(tramdict, next(queries)), repeat)
+
+    return rows
+
+
+def report(scale, rows, out=sys.stdout):
+    nstops, nlines, line_length = scale
+    print(f"\n{nstops} stops, {nlines} lines, {line_length} stops per line", file=out)
+    print(f"{'operation':34} {'time/call':>12} {'peak memory':>12}", file=out)
+    for name, seconds, peak in rows:
+        if seconds >= 1e-3:
+            shown = f"{seconds * 1e3:9.2f} ms"
+        else:
+            shown = f"{seconds * 1e6:9.2f} us"
+        print(f"{name:34} {shown:>12} {peak / 1024:9.1f} KiB", file=out)
+
+
+def main(args):
+    scales = [tuple(int(x) for x in arg.split(",")) for arg in args] or SCALES
+    for scale in scales:
+        with tempfile.TemporaryDirectory() as directory:
+            rows = bench_scale(*scale, directory)
+        report(scale, rows)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -1,3 +1,7 @@
+import contextlib
+import io
+import os
+import tempfile
 import unittest
 from tramdata import *
 
@@ -52,6 +56,198 @@ class TestTramData(unittest.TestCase):
         self.assertEqual(r1, r2)
         self.assertEqual(r1, r3)
 
+    def test_build_lines_from_stream(self):
+        # the parser reads a file object block by block
+        text = "1:\nA  10:00\nB  10:02\n\n2:\nB  10:00\nC  10:05\n"
+        counts = []
+        linedict, timedict = build_tram_lines(io.StringIO(text), progress=counts.append)
+        self.assertEqual(linedict, {'1': ['A', 'B'], '2': ['B', 'C']})
+        self.assertEqual(timedict, {'A': {'B': 2}, 'B': {'C': 5}})
+        self.assertEqual(counts[-1], 7)
+
+    def test_build_lines_merge(self):
+        # merging replaces parsed lines and keeps known times
+        linedict = {'1': ['A', 'B'], '3': ['X', 'Y']}
+        timedict = {'A': {'B': 2}, 'X': {'Y': 1}}
+        build_tram_lines(iter(["1:", "A 10:00", "C 10:04"]), linedict, timedict)
+        self.assertEqual(linedict, {'1': ['A', 'C'], '3': ['X', 'Y']})
+        self.assertEqual(timedict['A'], {'B': 2, 'C': 4})
+        self.assertEqual(timedict['X'], {'Y': 1})
+
+    def test_line_index_matches_scan(self):
+        # the bitset index gives the same answers as scanning the lines
+        index = build_line_index(self.linedict)
+        stops = sorted(self.stopdict)
+        for stop in stops:
+            self.assertEqual(lines_via_stop(self.linedict, stop, index),
+                             lines_via_stop(self.linedict, stop))
+        for stop2 in stops:
+            self.assertEqual(lines_between_stops(self.linedict, "Chalmers", stop2, index),
+                             lines_between_stops(self.linedict, "Chalmers", stop2))
+
+    def test_time_index_matches_walk(self):
+        # prefix sums give the same times as walking the segments
+        timedict = self.tramdict["times"]
+        index = build_time_index(self.linedict, timedict)
+        self.assertEqual(index["missing"], [])
+        for line, stops in self.linedict.items():
+            for stop in stops:
+                self.assertEqual(
+                    time_between_stops(self.linedict, timedict, line, stops[0], stop, index),
+                    time_between_stops(self.linedict, timedict, line, stops[0], stop))
+
+    def test_time_index_missing_segment(self):
+        # a missing segment is found once, when the index is built
+        linedict = {'1': ['A', 'B', 'C', 'D']}
+        timedict = {'A': {'B': 2}, 'C': {'D': 3}}
+        index = build_time_index(linedict, timedict)
+        self.assertEqual(index["missing"], [('1', 'B', 'C')])
+        self.assertEqual(time_between_stops(linedict, timedict, '1', 'B', 'A', index), 2)
+        self.assertEqual(time_between_stops(linedict, timedict, '1', 'C', 'D', index), 3)
+        self.assertIsNone(time_between_stops(linedict, timedict, '1', 'A', 'D', index))
+
+    def test_geo_index_matches_scalar(self):
+        # array lookups agree with the scalar haversine; the matrix
+        # is only built by the first lookup
+        index = build_geo_index(self.stopdict)
+        self.assertIsNone(index.matrix)
+        self.assertIsNone(network_index(self.tramdict)["geo"].matrix)
+        for stop in ["Chalmers", "Valand", "Östra Sjukhuset", "Opaltorget"]:
+            self.assertAlmostEqual(
+                distance_between_stops(self.stopdict, "Järntorget", stop, index),
+                distance_between_stops(self.stopdict, "Järntorget", stop), places=3)
+        self.assertIsNotNone(index.matrix)
+
+    def test_geo_batch_distances(self):
+        # one-to-many and many-to-many agree with each other
+        coords = geo.StopCoordinates(self.stopdict)
+        row = coords.distances_from("Chalmers")
+        matrix = coords.distance_matrix(["Chalmers"])
+        self.assertEqual(matrix.shape, (1, len(self.stopdict)))
+        self.assertAlmostEqual(float(abs(row - matrix[0]).max()), 0.0)
+        self.assertAlmostEqual(row[coords.ids["Järntorget"]], 1.628, places=3)
+
+    def test_binary_round_trip(self):
+        # the binary file gives back the same dictionaries
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'tramnetwork.bin')
+            trambin.write_tram_binary(self.tramdict, path)
+            binary = trambin.TramBinary(path)
+            self.assertEqual(binary.to_tramdict(), self.tramdict)
+            self.assertEqual(binary.stop_name(0), next(iter(self.stopdict)))
+            del binary
+
+    def test_binary_round_trip_keeps_strings(self):
+        # position strings, missing towns and other keys come back as written
+        tramdict = {
+            "stops": {
+                "A": {"town": "Göteborg", "position": ["57.700000", "11.9"]},
+                "B": {"position": ["57.71", "11.95"], "platform": "C"},
+                "C": {"town": "Mölndal"},
+            },
+            "lines": {"1": ["A", "B", "D"]},
+            "times": {"A": {"B": 2}, "B": {"D": 3}},
+        }
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'tramnetwork.bin')
+            trambin.write_tram_binary(tramdict, path)
+            binary = trambin.TramBinary(path)
+            self.assertEqual(binary.to_tramdict(), tramdict)
+            self.assertEqual(binary.stop_info(1), tramdict["stops"]["B"])
+            self.assertEqual(binary.positions[0].tolist(), [57.7, 11.9])
+            del binary
+
+    def test_binary_load_builds_nothing(self):
+        # loading the binary copy maps the file and builds no dict per
+        # stop; entries are made on lookup and answer like the JSON
+        with tempfile.TemporaryDirectory() as tmp:
+            tramfile = os.path.join(tmp, 'tramnetwork.json')
+            with open(tramfile, 'w', encoding='utf-8') as f:
+                json.dump(self.tramdict, f, ensure_ascii=False)
+            trambin.write_tram_binary(self.tramdict, binary_file(tramfile))
+            loaded = load_tram_network(tramfile)
+            self.assertIsInstance(loaded["stops"], trambin.StopEntries)
+            self.assertEqual(loaded["lines"]._stops, {})
+            self.assertIsNone(loaded["times"]._index)
+            self.assertIsNone(loaded["stops"].binary._names)
+            self.assertEqual(loaded["stops"]["Chalmers"], self.stopdict["Chalmers"])
+            self.assertEqual(loaded["times"], self.tramdict["times"])
+            for query in ["via Chalmers", "between Chalmers and Valand",
+                          "time with 6 from Chalmers to Järntorget",
+                          "distance from Chalmers to Järntorget"]:
+                self.assertEqual(answer_query(loaded, query), answer_query(self.tramdict, query))
+            del loaded
+
+    def test_name_index_matches_scan(self):
+        # the trigram index resolves names exactly like the full scan
+        index = build_name_index(self.stopdict)
+        for raw in ["chalmers", "frolunda", "JÄRNTORGET", "torg", "ga", "x", "", "xyz",
+                    "centralstationen", "Brunnsparken", "sahlgrenska"]:
+            self.assertEqual(resolve_stop_name(self.stopdict, raw, index),
+                             resolve_stop_name(self.stopdict, raw), msg=raw)
+
+    def test_batch_answers_in_order(self):
+        # batch mode writes one JSON answer per query, in input order
+        queries = ["via Chalmers", "", "between Chalmers and Valand", "nonsense",
+                   "distance from Chalmers to Järntorget"]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'queries.txt')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write("\n".join(queries))
+            out = io.StringIO()
+            self.assertEqual(batch(path, TRAM_FILE, out, workers=2), 4)
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([r["query"] for r in rows], [q for q in queries if q])
+        self.assertEqual([r["answer"] for r in rows],
+                         [['6', '7', '8', '10', '13'], ['7', '10'], "sorry, try again", 1.628])
+
+    def test_query_plans(self):
+        # queries compile to plans with resolved stop names
+        self.assertEqual(compile_query(self.tramdict, "via chalmers"), Via("Chalmers"))
+        self.assertEqual(compile_query(self.tramdict, "time with 6 from chalmers to järntorget"),
+                         Time("6", "Chalmers", "Järntorget"))
+        self.assertEqual(compile_query(self.tramdict, "between chalmers"),
+                         Failed("sorry, try again"))
+        self.assertEqual(compile_query(self.tramdict, "via nowhere"),
+                         Failed("unknown arguments"))
+
+    def test_query_cache_stats(self):
+        # repeated queries are answered from the caches
+        clear_query_cache(self.tramdict)
+        for _ in range(3):
+            ans = answer_query(self.tramdict, "via Chalmers")
+            ans.append('99')
+        answer_query(self.tramdict, "via chalmers")
+        stats = query_cache_stats(self.tramdict)
+        self.assertEqual(stats["plans"]["hits"], 2)
+        self.assertEqual(stats["plans"]["misses"], 2)
+        self.assertEqual(stats["answers"]["hits"], 3)
+        self.assertEqual(answer_query(self.tramdict, "via Chalmers"), ['6', '7', '8', '10', '13'])
+
+    def test_cached_answer_prints_the_same(self):
+        # a cache hit prints the diagnostics of the first evaluation again
+        clear_query_cache(self.tramdict)
+        query = "time with 6 from Chalmers to Valand"
+        printed = []
+        for _ in range(2):
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out):
+                ans = answer_query(self.tramdict, query)
+            printed.append(out.getvalue())
+        self.assertIn("stops not on this line", printed[0])
+        self.assertEqual(printed[0], printed[1])
+        self.assertEqual(query_cache_stats(self.tramdict)["answers"]["hits"], 1)
+
+    def test_lru_cache_bound(self):
+        cache = LRUCache(maxsize=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.stats()["size"], 2)
+
 if __name__ == '__main__':
     unittest.main()
 
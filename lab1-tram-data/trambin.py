@@ -0,0 +1,431 @@
+# Compact binary version of tramnetwork.json (extra feature)
+#
+# File layout, little endian:
+#   header     magic b"TRAMBIN\0", format version (u32), number of sections (u32)
+#   directory  per section: name (8 bytes), dtype (4 bytes), offset (u64), count (u64)
+#   sections   raw arrays, each starting on an 8 byte boundary
+#
+# Sections:
+#   meta                 [number of stops in the stop table]
+#   stopoff, stopstr     string table of stop names (offsets + utf-8 bytes);
+#                        stops only named on lines come after the stop table
+#   townoff, townstr     string table of towns, one per stop in the stop table
+#   pos                  (lat, lon) float64 pairs, one per stop in the stop table
+#                        (NaN without a position)
+#   posoff, posstr       the position strings as written in the JSON file,
+#                        two per stop in the stop table
+#   flags                per stop in the stop table: HAS_TOWN | HAS_POSITION
+#                        (town and position strings present)
+#   extraoff, extrastr   per stop in the stop table, a JSON object of any
+#                        other keys ("" if none), so that to_tramdict()
+#                        gives back exactly the dictionaries written
+#   lineoff, linestr     string table of line numbers
+#   seqptr, seq          stop ids of each line: seq[seqptr[i]:seqptr[i + 1]]
+#   time_a, time_b, time_min
+#                        segment time table, one row per timedict entry
+#
+# TramBinary.tramdict() serves the three dictionaries as read-only
+# views of the file (StopEntries, LineStops, SegmentTimes): an entry is
+# only built when it is looked up, so loading costs no more than the
+# memory map. to_tramdict() builds them all, for export and tests.
+# TramBinary.from_tramdict() packs dictionaries into the same arrays in
+# memory, so a network read from JSON can drop its stop dicts too.
+
+import io
+import json
+import mmap
+import struct
+from collections.abc import Mapping
+
+import numpy as np
+
+MAGIC = b"TRAMBIN\0"
+VERSION = 2
+
+# bits of the flags section
+HAS_TOWN = 1
+HAS_POSITION = 2
+
+HEADER = struct.Struct("<8sII")
+ENTRY = struct.Struct("<8s4sQQ")
+ALIGN = 8
+
+
+def pack_strings(strings):
+    # String table: offsets (n + 1) into one utf-8 blob.
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype="<u4")
+    offsets[1:] = np.cumsum([len(b) for b in encoded])
+    return offsets, np.frombuffer(b"".join(encoded), dtype="u1")
+
+
+def write_tram_binary(tramdict, path):
+    # Write the network in the binary format; returns the file size.
+    _, sections = tram_sections(tramdict)
+    return write_sections(path, sections)
+
+
+def tram_sections(tramdict):
+    # The sections of the format as (name, array) pairs, and the stop
+    # names in stop id order.
+    stopdict = tramdict["stops"]
+    linedict = tramdict["lines"]
+    timedict = tramdict["times"]
+
+    names = list(stopdict)
+    ids = {name: i for i, name in enumerate(names)}
+
+    def stop_id(name):
+        # stops only named on lines or in times get ids after the table
+        if name not in ids:
+            ids[name] = len(names)
+            names.append(name)
+        return ids[name]
+
+    n_table = len(names)
+    pos = np.full((n_table, 2), np.nan, dtype="<f8")
+    flags = np.zeros(n_table, dtype="u1")
+    towns = []
+    posstrs = []
+    extras = []
+    for i, name in enumerate(names[:n_table]):
+        extra = dict(stopdict[name])
+        town = extra.pop("town", None)
+        if isinstance(town, str):
+            flags[i] |= HAS_TOWN
+        elif town is not None:
+            extra["town"] = town
+        towns.append(town if isinstance(town, str) else "")
+
+        position = extra.pop("position", None)
+        if position is not None and len(position) == 2:
+            pos[i] = [float(position[0]), float(position[1])]
+        if isinstance(position, list) and len(position) == 2 and all(
+                isinstance(x, str) for x in position):
+            flags[i] |= HAS_POSITION
+            posstrs.extend(position)
+        else:
+            if position is not None:
+                extra["position"] = position
+            posstrs.extend(["", ""])
+        extras.append(json.dumps(extra, ensure_ascii=False) if extra else "")
+
+    lines = list(linedict)
+    seqptr = np.zeros(len(lines) + 1, dtype="<u4")
+    seq = []
+    for i, line in enumerate(lines):
+        seq.extend(stop_id(s) for s in linedict[line])
+        seqptr[i + 1] = len(seq)
+
+    time_a = []
+    time_b = []
+    time_min = []
+    for a, inner in timedict.items():
+        for b, minutes in inner.items():
+            time_a.append(stop_id(a))
+            time_b.append(stop_id(b))
+            time_min.append(minutes)
+
+    stopoff, stopstr = pack_strings(names)
+    townoff, townstr = pack_strings(towns)
+    posoff, posstr = pack_strings(posstrs)
+    extraoff, extrastr = pack_strings(extras)
+    lineoff, linestr = pack_strings(lines)
+
+    sections = [
+        ("meta", np.array([n_table], dtype="<u8")),
+        ("stopoff", stopoff),
+        ("stopstr", stopstr),
+        ("townoff", townoff),
+        ("townstr", townstr),
+        ("pos", pos.ravel()),
+        ("posoff", posoff),
+        ("posstr", posstr),
+        ("flags", flags),
+        ("extraoff", extraoff),
+        ("extrastr", extrastr),
+        ("lineoff", lineoff),
+        ("linestr", linestr),
+        ("seqptr", seqptr),
+        ("seq", np.array(seq, dtype="<u4")),
+        ("time_a", np.array(time_a, dtype="<u4")),
+        ("time_b", np.array(time_b, dtype="<u4")),
+        ("time_min", np.array(time_min, dtype="<i4")),
+    ]
+    return names, sections
+
+
+def write_sections(path, sections):
+    # Write named numpy arrays as one aligned, versioned file.
+    with open(path, "wb") as f:
+        return _write_sections(f, sections)
+
+
+def pack_sections(sections):
+    # The bytes write_sections() would write.
+    f = io.BytesIO()
+    _write_sections(f, sections)
+    return f.getvalue()
+
+
+def _write_sections(f, sections):
+    offset = HEADER.size + ENTRY.size * len(sections)
+    directory = []
+    for name, array in sections:
+        offset = -(-offset // ALIGN) * ALIGN
+        directory.append((name, array, offset))
+        offset += array.nbytes
+
+    f.write(HEADER.pack(MAGIC, VERSION, len(sections)))
+    for name, array, start in directory:
+        f.write(ENTRY.pack(name.encode("ascii"), array.dtype.str.encode("ascii"),
+                           start, array.size))
+    for name, array, start in directory:
+        f.write(b"\0" * (start - f.tell()))
+        f.write(array.tobytes())
+    return f.tell()
+
+
+def read_sections(buffer):
+    # Map section name -> numpy view into buffer (no copying).
+    magic, version, count = HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise ValueError("not a tram network binary file")
+    if version != VERSION:
+        raise ValueError(f"unsupported tram network binary version: {version}")
+
+    sections = {}
+    for k in range(count):
+        name, dtype, offset, size = ENTRY.unpack_from(buffer, HEADER.size + ENTRY.size * k)
+        name = name.rstrip(b"\0").decode("ascii")
+        dtype = np.dtype(dtype.rstrip(b"\0").decode("ascii"))
+        sections[name] = np.frombuffer(buffer, dtype=dtype, count=size, offset=offset)
+    return sections
+
+
+def stop_info(flags, town, lat, lon, extra):
+    # A stopdict entry from its parts in the file.
+    info = {}
+    if flags & HAS_TOWN:
+        info["town"] = town
+    if flags & HAS_POSITION:
+        info["position"] = [lat, lon]
+    if extra:
+        info.update(json.loads(extra))
+    return info
+
+
+class TramBinary:
+    # Read-only view of a binary network file.
+    # The file is memory-mapped, so processes loading the same file
+    # share its pages, and the arrays below are views into the map.
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._attach(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    @classmethod
+    def from_tramdict(cls, tramdict):
+        # The dictionaries packed into the format in memory, no file.
+        _, sections = tram_sections(tramdict)
+        binary = cls.__new__(cls)
+        binary._attach(pack_sections(sections))
+        return binary
+
+    def _attach(self, buffer):
+        self.buffer = buffer
+        self.sections = read_sections(buffer)
+
+        s = self.sections
+        self.n_stops = int(s["meta"][0])
+        self.positions = s["pos"].reshape(-1, 2)
+        self.flags = s["flags"]
+        self.seqptr = s["seqptr"]
+        self.seq = s["seq"]
+        self.time_a = s["time_a"]
+        self.time_b = s["time_b"]
+        self.time_min = s["time_min"]
+
+        # all stop names and {name: stop id}, decoded on first use
+        self._names = None
+        self._ids = None
+
+    def _string(self, table, i):
+        offsets = self.sections[table + "off"]
+        blob = self.sections[table + "str"]
+        return blob[offsets[i]:offsets[i + 1]].tobytes().decode("utf-8")
+
+    def _strings(self, table):
+        offsets = self.sections[table + "off"].tolist()
+        blob = self.sections[table + "str"].tobytes()
+        return [blob[a:b].decode("utf-8") for a, b in zip(offsets, offsets[1:])]
+
+    def stop_name(self, i):
+        return self._string("stop", i)
+
+    def stop_names(self):
+        return self._strings("stop")
+
+    @property
+    def names(self):
+        # stop_names(), decoded once
+        if self._names is None:
+            self._names = self.stop_names()
+        return self._names
+
+    @property
+    def stop_ids(self):
+        # {stop name: stop id}, for every stop named in the file
+        if self._ids is None:
+            self._ids = {name: i for i, name in enumerate(self.names)}
+        return self._ids
+
+    def line_names(self):
+        return self._strings("line")
+
+    def towns(self):
+        # Town of each stop of the stop table ("" without one).
+        return self._strings("town")
+
+    def stop_info(self, i):
+        # The stopdict entry of stop i of the stop table.
+        return stop_info(self.flags[i], self._string("town", i), self._string("pos", 2 * i),
+                         self._string("pos", 2 * i + 1), self._string("extra", i))
+
+    def line_stops(self, i):
+        # Stop ids of line number i, as an array view.
+        return self.seq[self.seqptr[i]:self.seqptr[i + 1]]
+
+    def tramdict(self):
+        # The dictionaries that tramnetwork.json holds, as views of the
+        # file that build entries on lookup (see the top of this file).
+        return {"stops": StopEntries(self), "lines": LineStops(self),
+                "times": SegmentTimes(self)}
+
+    def to_tramdict(self):
+        # Rebuild the dictionaries that tramnetwork.json holds, in full.
+        names = self.stop_names()
+        towns = self._strings("town")
+        posstrs = self._strings("pos")
+        extras = self._strings("extra")
+
+        stopdict = {}
+        for i, flags in enumerate(self.flags.tolist()):
+            stopdict[names[i]] = stop_info(flags, towns[i], posstrs[2 * i],
+                                           posstrs[2 * i + 1], extras[i])
+
+        linedict = {}
+        seqptr = self.seqptr.tolist()
+        seq = self.seq.tolist()
+        for i, line in enumerate(self.line_names()):
+            linedict[line] = [names[k] for k in seq[seqptr[i]:seqptr[i + 1]]]
+
+        timedict = {}
+        for a, b, minutes in zip(self.time_a.tolist(), self.time_b.tolist(),
+                                 self.time_min.tolist()):
+            timedict.setdefault(names[a], {})[names[b]] = minutes
+
+        return {"stops": stopdict, "lines": linedict, "times": timedict}
+
+
+def stop_entries(stopdict):
+    # stopdict packed into the arrays of the format, as a StopEntries
+    # view: the same entries, rebuilt on lookup, in a fraction of the
+    # memory of the dicts.
+    return TramBinary.from_tramdict({"stops": stopdict, "lines": {}, "times": {}}).tramdict()["stops"]
+
+
+class StopEntries(Mapping):
+    # Read-only stopdict of a TramBinary: the entry of a stop is
+    # rebuilt from the file each time it is looked up.
+
+    def __init__(self, binary):
+        self.binary = binary
+
+    def __getitem__(self, stop):
+        i = self.binary.stop_ids.get(stop)
+        if i is None or i >= self.binary.n_stops:
+            raise KeyError(stop)
+        return self.binary.stop_info(i)
+
+    def __contains__(self, stop):
+        i = self.binary.stop_ids.get(stop)
+        return i is not None and i < self.binary.n_stops
+
+    def __iter__(self):
+        return iter(self.binary.names[:self.binary.n_stops])
+
+    def __len__(self):
+        return self.binary.n_stops
+
+
+class LineStops(Mapping):
+    # Read-only linedict of a TramBinary: the stops of a line are
+    # listed on its first lookup.
+
+    def __init__(self, binary):
+        self.binary = binary
+        self.lines = binary.line_names()
+        self.ids = {line: i for i, line in enumerate(self.lines)}
+        self._stops = {}
+
+    def __getitem__(self, line):
+        if line not in self._stops:
+            names = self.binary.names
+            self._stops[line] = [names[k] for k in self.binary.line_stops(self.ids[line]).tolist()]
+        return self._stops[line]
+
+    def __contains__(self, line):
+        return line in self.ids
+
+    def __iter__(self):
+        return iter(self.lines)
+
+    def __len__(self):
+        return len(self.lines)
+
+
+class SegmentTimes(Mapping):
+    # Read-only timedict of a TramBinary: times[a] is built on lookup
+    # from the rows of the time table that start at stop a.
+
+    def __init__(self, binary):
+        self.binary = binary
+        self._index = None
+
+    def _rows(self, stop):
+        # Rows of the time table starting at stop, in file order. The
+        # rows are grouped by first stop on the first lookup.
+        if self._index is None:
+            rows = np.argsort(self.binary.time_a, kind="stable")
+            counts = np.bincount(self.binary.time_a, minlength=len(self.binary.names))
+            self._index = (rows, np.concatenate(([0], np.cumsum(counts))))
+        rows, ptr = self._index
+        a = self.binary.stop_ids.get(stop)
+        if a is None:
+            return rows[:0]
+        return rows[ptr[a]:ptr[a + 1]]
+
+    def __getitem__(self, stop):
+        rows = self._rows(stop)
+        if not len(rows):
+            raise KeyError(stop)
+        names = self.binary.names
+        return {names[b]: minutes for b, minutes in zip(self.binary.time_b[rows].tolist(),
+                                                        self.binary.time_min[rows].tolist())}
+
+    def __contains__(self, stop):
+        return len(self._rows(stop)) > 0
+
+    def _firsts(self):
+        # ids of the first stops, in the order they first appear
+        a = self.binary.time_a
+        _, first = np.unique(a, return_index=True)
+        return a[np.sort(first)].tolist()
+
+    def __iter__(self):
+        names = self.binary.names
+        return (names[a] for a in self._firsts())
+
+    def __len__(self):
+        return len(np.unique(self.binary.time_a))
@@ -1,16 +1,34 @@
 # Lab 1 – Tram data processing (submission version)
 
+import contextlib
+import io
+import os
 import sys
 import json
 import math
+import time
+import multiprocessing
+from collections import OrderedDict, deque, namedtuple
+
+import geo
+import trambin
 
 # files given
 STOP_FILE = './data/tramstops.json'
 LINE_FILE = './data/tramlines.txt'
 
-# file to give
+# file to give, with its binary copy ./tramnetwork.bin (see trambin.py)
 TRAM_FILE = './tramnetwork.json'
 
+# largest network for which all stop distances are precomputed
+DISTANCE_MATRIX_LIMIT = 5000
+
+# queries per task in batch mode
+BATCH_CHUNK = 1000
+
+# entries kept in each of the query plan and answer caches
+QUERY_CACHE_SIZE = 10000
+
 
 
 def build_tram_stops(jsonobject):
@@ -20,88 +38,265 @@ def build_tram_stops(jsonobject):
 
 
 
-def build_tram_lines(lines):
-
-    # Build line and time dictionaries
-    linedict = {}
-    timedict = {}
+def iter_line_blocks(lines, progress=None):
 
-    current_line = None   
-    prev_stop = None      
-    prev_minutes = None   
+    # Yield one (line, segments) block per line header, reading lazily
+    # from any file object or iterator of text lines.
+    # segments is a list of runs of (stop, minutes); a blank line inside
+    # a block starts a new run, so no time is taken across it.
+    current_line = None
+    segments = []
+    run = []
+    count = 0
 
     for raw in lines:
-        
+        count += 1
         line = raw.rstrip("\n")
 
         if not line.strip():
-            prev_stop = None
-            prev_minutes = None
+            if run:
+                segments.append(run)
+                run = []
             continue
 
         stripped = line.strip()
 
         if stripped.endswith(":"):
-            # new line number
-            current_line = stripped[:-1].strip()  
-            linedict[current_line] = []
-            prev_stop = None
-            prev_minutes = None
+            # new line number: hand over the finished block
+            if run:
+                segments.append(run)
+                run = []
+            if current_line is not None:
+                yield current_line, segments
+                if progress is not None:
+                    progress(count)
+            current_line = stripped[:-1].strip()
+            segments = []
             continue
 
         stop_part, time_part = line.rstrip().rsplit(" ", 1)
         stop_name = stop_part.rstrip()
-        time_str = time_part.strip()  
+        time_str = time_part.strip()
 
         hour, minute = map(int, time_str.split(":"))
         total_minutes = hour * 60 + minute
 
         if current_line is None:
             raise ValueError("Stop found before line number.")
-        linedict[current_line].append(stop_name)
+        run.append((stop_name, total_minutes))
+
+    if run:
+        segments.append(run)
+    if current_line is not None:
+        yield current_line, segments
+        if progress is not None:
+            progress(count)
+
 
-        if prev_stop is not None:
-            delta = total_minutes - prev_minutes
 
-            a, b = sorted([prev_stop, stop_name])
-            if a not in timedict:
-                timedict[a] = {}
-            if b not in timedict[a]:
-                timedict[a][b] = delta
+def build_tram_lines(lines, linedict=None, timedict=None, progress=None):
 
-        prev_stop = stop_name
-        prev_minutes = total_minutes
+    # Build line and time dictionaries.
+    # Pass existing dictionaries to merge the parsed lines into them:
+    # a line in the input replaces the stored line, known times are kept.
+    if linedict is None:
+        linedict = {}
+    if timedict is None:
+        timedict = {}
+
+    for current_line, segments in iter_line_blocks(lines, progress):
+        stops = []
+
+        for run in segments:
+            prev_stop = None
+            prev_minutes = None
+
+            for stop_name, total_minutes in run:
+                stops.append(stop_name)
+
+                if prev_stop is not None:
+                    delta = total_minutes - prev_minutes
+
+                    a, b = sorted([prev_stop, stop_name])
+                    if a not in timedict:
+                        timedict[a] = {}
+                    if b not in timedict[a]:
+                        timedict[a][b] = delta
+
+                prev_stop = stop_name
+                prev_minutes = total_minutes
+
+        linedict[current_line] = stops
 
     return linedict, timedict
 
 
 
-def build_tram_network(stopfile, linefile):
-    
+def report_progress(count):
+    # Progress callback used by init: number of input lines parsed so far.
+    print(f"\rparsed {count} lines", end="", file=sys.stderr, flush=True)
+
+
+
+def build_tram_network(stopfile, linefile, tramdict=None, progress=None, tramfile=TRAM_FILE):
+
+    # Pass an existing tramdict to merge the files into that network.
+    # The result is written to tramfile and its binary copy.
     with open(stopfile, encoding="utf-8") as f:
         raw_stops = json.load(f)
     stopdict = build_tram_stops(raw_stops)
 
-    with open(linefile, encoding="utf-8") as f:
-        lines = f.readlines()
-    linedict, timedict = build_tram_lines(lines)
+    if tramdict is None:
+        tramdict = {"stops": {}, "lines": {}, "times": {}}
+    # indexes of the old network are stale now
+    tramdict.pop("index", None)
+    tramdict["stops"].update(stopdict)
 
-    tramdict = {
-        "stops": stopdict,
-        "lines": linedict,
-        "times": timedict,
-    }
+    # the file object is read lazily, one line block at a time
+    with open(linefile, encoding="utf-8") as f:
+        build_tram_lines(f, tramdict["lines"], tramdict["times"], progress)
 
-    with open(TRAM_FILE, "w", encoding="utf-8") as f:
+    with open(tramfile, "w", encoding="utf-8") as f:
         json.dump(tramdict, f, ensure_ascii=False, indent=2)
 
+    trambin.write_tram_binary(tramdict, binary_file(tramfile))
+
     return tramdict
 
 
 
-def lines_via_stop(linedict, stop):
+def binary_file(tramfile):
+    # The binary network file written next to a JSON network file
+    return os.path.splitext(tramfile)[0] + ".bin"
+
+
+
+def load_tram_network(tramfile=TRAM_FILE):
+
+    # Load a network, preferring the memory-mapped binary copy
+    # unless the JSON file has been written after it.
+    binfile = binary_file(tramfile)
+    if os.path.exists(binfile) and (
+            not os.path.exists(tramfile)
+            or os.path.getmtime(binfile) >= os.path.getmtime(tramfile)):
+        try:
+            # views of the mapped file, see trambin.TramBinary.tramdict()
+            return trambin.TramBinary(binfile).tramdict()
+        except ValueError:
+            # older format version: read the JSON file instead
+            if not os.path.exists(tramfile):
+                raise
+
+    with open(tramfile, encoding="utf-8") as f:
+        return json.load(f)
+
+
+
+def build_line_index(linedict):
+
+    # Map each stop to a bitset (an int) of the lines passing it.
+    # Bit i stands for lines[i], and lines are sorted numerically,
+    # so decoding a bitset gives the lines already in order.
+    lines = sorted(linedict.keys(), key=int)
+    bits = {}
+
+    for i, line in enumerate(lines):
+        bit = 1 << i
+        for stop in linedict[line]:
+            bits[stop] = bits.get(stop, 0) | bit
+
+    return {"lines": lines, "bits": bits}
+
+
+
+def lines_from_bits(lineindex, bits):
+
+    # Decode a line bitset into the sorted list of line numbers
+    lines = lineindex["lines"]
+    result = []
+
+    while bits:
+        low = bits & -bits
+        result.append(lines[low.bit_length() - 1])
+        bits ^= low
+
+    return result
+
+
+
+def build_time_index(linedict, timedict):
+
+    # Per line: stop -> position and prefix sums of segment minutes,
+    # so the time between two stops on a line is one subtraction.
+    # A missing segment counts 0 minutes in "cum" and 1 in "gaps";
+    # a query across it sees the gap count change.
+    lines = {}
+    missing = []
+
+    for line, stops in linedict.items():
+        pos = {}
+        for i, stop in enumerate(stops):
+            pos.setdefault(stop, i)
+
+        cum = [0]
+        gaps = [0]
+        for s1, s2 in zip(stops, stops[1:]):
+            a, b = sorted([s1, s2])
+            delta = timedict.get(a, {}).get(b)
+            if delta is None:
+                missing.append((line, s1, s2))
+                cum.append(cum[-1])
+                gaps.append(gaps[-1] + 1)
+            else:
+                cum.append(cum[-1] + delta)
+                gaps.append(gaps[-1])
+
+        lines[line] = (pos, cum, gaps)
+
+    return {"lines": lines, "missing": missing}
+
+
+
+def build_geo_index(stopdict):
+
+    # Stop coordinates as float arrays. The condensed distance matrix
+    # is left to the first distance lookup (see distance_between_stops),
+    # so processes that never ask for a distance never build it.
+    if isinstance(stopdict, trambin.StopEntries):
+        # positions straight from the mapped file, nothing parsed
+        binary = stopdict.binary
+        return geo.StopCoordinates.from_arrays(list(stopdict), binary.positions[:, 0],
+                                               binary.positions[:, 1])
+    return geo.StopCoordinates(stopdict)
+
+
+
+def network_index(tramdict):
+
+    # Indexes over the network, built once and kept in the tramdict.
+    # Rebuilding the network gives a new tramdict and so new indexes.
+    index = tramdict.get("index")
+    if index is None:
+        index = {
+            "lines": build_line_index(tramdict["lines"]),
+            "times": build_time_index(tramdict["lines"], tramdict["times"]),
+            "geo": build_geo_index(tramdict["stops"]),
+            "names": build_name_index(tramdict["stops"]),
+            # query string -> plan, plan -> answer
+            "plans": LRUCache(),
+            "answers": LRUCache(),
+        }
+        tramdict["index"] = index
+    return index
+
+
+
+def lines_via_stop(linedict, stop, lineindex=None):
 
     # Return all lines that pass the given stop
+    if lineindex is not None:
+        return lines_from_bits(lineindex, lineindex["bits"].get(stop, 0))
+
     result = []
 
     for line, stops in linedict.items():
@@ -113,7 +308,11 @@ def lines_via_stop(linedict, stop):
 
 
 
-def lines_between_stops(linedict, stop1, stop2):
+def lines_between_stops(linedict, stop1, stop2, lineindex=None):
+    if lineindex is not None:
+        bits = lineindex["bits"]
+        return lines_from_bits(lineindex, bits.get(stop1, 0) & bits.get(stop2, 0))
+
     result = []
 
     for line, stops in linedict.items():
@@ -125,13 +324,27 @@ def lines_between_stops(linedict, stop1, stop2):
 
 
 
-def time_between_stops(linedict, timedict, line, stop1, stop2):
+def time_between_stops(linedict, timedict, line, stop1, stop2, timeindex=None):
 
     # check that the line exists
     if line not in linedict:
         print("unknown line")
         return None
 
+    if timeindex is not None:
+        pos, cum, gaps = timeindex["lines"][line]
+        i1 = pos.get(stop1)
+        i2 = pos.get(stop2)
+        if i1 is None or i2 is None:
+            print("stops not on this line")
+            return None
+        if i1 > i2:
+            i1, i2 = i2, i1
+        # missing segment times were listed when the index was built
+        if gaps[i2] != gaps[i1]:
+            return None
+        return cum[i2] - cum[i1]
+
     stops = linedict[line]
 
     # both stops must be on this line
@@ -172,11 +385,21 @@ def time_between_stops(linedict, timedict, line, stop1, stop2):
 
 
 
-def distance_between_stops(stopdict, stop1, stop2):
+def distance_between_stops(stopdict, stop1, stop2, geoindex=None):
     if stop1 not in stopdict or stop2 not in stopdict:
         print("unknown stop")
         return None
 
+    if geoindex is not None:
+        for name in (stop1, stop2):
+            if name in geoindex.bad:
+                raise ValueError(f"Bad position data for stop: {name} -> {stopdict[name]}")
+        # the matrix pays off once there are many lookups, and is kept
+        # only for networks small enough to hold it in memory
+        if geoindex.matrix is None and len(geoindex) <= DISTANCE_MATRIX_LIMIT:
+            geoindex.build_matrix()
+        return round(geoindex.distance(stop1, stop2), 3)
+
     def get_lat_lon(name):
         info = stopdict[name]
 
@@ -215,13 +438,24 @@ def normalize_stop_name(name):
 
 
 # extra feature 2
-def resolve_stop_name(stopdict, raw):
+def resolve_stop_name(stopdict, raw, nameindex=None):
     # Return the real stop name if it matches case/åäö-insensitive
     if raw in stopdict:
         return raw
 
     norm = normalize_stop_name(raw)
 
+    if nameindex is not None:
+        exact_matches = nameindex["exact"].get(norm, [])
+        if len(exact_matches) == 1:
+            return exact_matches[0]
+
+        substring_matches = find_substring_matches(nameindex, norm)
+        if len(substring_matches) == 1:
+            return substring_matches[0]
+
+        return None
+
     exact_matches = []
     for real in stopdict.keys():
         if normalize_stop_name(real) == norm:
@@ -242,12 +476,113 @@ def resolve_stop_name(stopdict, raw):
 
 
 
-def answer_query(tramdict, query):
+def build_name_index(stopdict):
+
+    # Normalized stop names, computed once:
+    # "exact" maps a normalized name to its stops,
+    # "grams" maps a trigram to the ids of the names containing it.
+    names = list(stopdict)
+    normed = [normalize_stop_name(name) for name in names]
+    exact = {}
+    grams = {}
+
+    for i, norm in enumerate(normed):
+        exact.setdefault(norm, []).append(names[i])
+        for k in range(len(norm) - 2):
+            grams.setdefault(norm[k:k + 3], set()).add(i)
+
+    return {"names": names, "normed": normed, "exact": exact, "grams": grams}
 
-    # Parse a query string and return the answer value
+
+
+def find_substring_matches(nameindex, norm, limit=2):
+
+    # Stops whose normalized name contains norm, at most limit of them
+    # (two are enough to know that a name is ambiguous).
+    names = nameindex["names"]
+    normed = nameindex["normed"]
+
+    if len(norm) < 3:
+        # too short for trigrams: scan the precomputed names
+        candidates = range(len(names))
+    else:
+        postings = []
+        for k in range(len(norm) - 2):
+            posting = nameindex["grams"].get(norm[k:k + 3])
+            if not posting:
+                return []
+            postings.append(posting)
+        postings.sort(key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates &= posting
+            if not candidates:
+                return []
+        candidates = sorted(candidates)
+
+    result = []
+    for i in candidates:
+        if norm in normed[i]:
+            result.append(names[i])
+            if len(result) >= limit:
+                break
+    return result
+
+
+
+# query plans: a parsed query with its stop names already resolved
+Via = namedtuple("Via", "stop")
+Between = namedtuple("Between", "stop1 stop2")
+Time = namedtuple("Time", "line stop1 stop2")
+Distance = namedtuple("Distance", "stop1 stop2")
+# a query that cannot be answered, with its fixed answer
+Failed = namedtuple("Failed", "answer")
+
+
+
+class LRUCache:
+
+    # Bounded mapping that forgets the least recently used entry,
+    # counting hits and misses so the size can be tuned.
+    def __init__(self, maxsize=QUERY_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        try:
+            value = self.data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self.data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self.data[key] = value
+        self.data.move_to_end(key)
+        if len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def clear(self):
+        self.data.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses,
+                "size": len(self.data), "maxsize": self.maxsize}
+
+
+
+def compile_query(tramdict, query):
+
+    # Parse a query string into a plan
     stopdict = tramdict["stops"]
     linedict = tramdict["lines"]
-    timedict = tramdict["times"]
+    index = network_index(tramdict)
 
     q = query.strip()
     ql = q.lower()
@@ -255,26 +590,26 @@ def answer_query(tramdict, query):
     # via <stop>
     if ql.startswith("via "):
         raw_stop = q[4:].strip()
-        stop = resolve_stop_name(stopdict, raw_stop)
+        stop = resolve_stop_name(stopdict, raw_stop, index["names"])
         if stop is None:
-            return "unknown arguments"
-        return lines_via_stop(linedict, stop)
+            return Failed("unknown arguments")
+        return Via(stop)
 
     # between <stop1> and <stop2>
     if ql.startswith("between "):
         and_pos = ql.find(" and ")
         if and_pos == -1:
-            return "sorry, try again"
+            return Failed("sorry, try again")
 
         raw_stop1 = q[len("between "):and_pos].strip()
         raw_stop2 = q[and_pos + len(" and "):].strip()
 
-        stop1 = resolve_stop_name(stopdict, raw_stop1)
-        stop2 = resolve_stop_name(stopdict, raw_stop2)
+        stop1 = resolve_stop_name(stopdict, raw_stop1, index["names"])
+        stop2 = resolve_stop_name(stopdict, raw_stop2, index["names"])
 
         if stop1 is None or stop2 is None:
-            return "unknown arguments"
-        return lines_between_stops(linedict, stop1, stop2)
+            return Failed("unknown arguments")
+        return Between(stop1, stop2)
 
     # time with <line> from <stop1> to <stop2>
     if ql.startswith("time with "):
@@ -283,7 +618,7 @@ def answer_query(tramdict, query):
 
         from_pos = rest_l.find(" from ")
         if from_pos == -1:
-            return "sorry, try again"
+            return Failed("sorry, try again")
 
         line = rest[:from_pos].strip()
         rest2 = rest[from_pos + len(" from "):]
@@ -291,21 +626,17 @@ def answer_query(tramdict, query):
 
         to_pos = rest2_l.find(" to ")
         if to_pos == -1:
-            return "sorry, try again"
+            return Failed("sorry, try again")
 
         raw_stop1 = rest2[:to_pos].strip()
         raw_stop2 = rest2[to_pos + len(" to "):].strip()
 
-        stop1 = resolve_stop_name(stopdict, raw_stop1)
-        stop2 = resolve_stop_name(stopdict, raw_stop2)
+        stop1 = resolve_stop_name(stopdict, raw_stop1, index["names"])
+        stop2 = resolve_stop_name(stopdict, raw_stop2, index["names"])
 
         if line not in linedict or stop1 is None or stop2 is None:
-            return "unknown arguments"
-
-        t = time_between_stops(linedict, timedict, line, stop1, stop2)
-        if t is None:
-            return "unknown arguments"
-        return t
+            return Failed("unknown arguments")
+        return Time(line, stop1, stop2)
 
     # distance from <stop1> to <stop2>
     if ql.startswith("distance from "):
@@ -314,30 +645,113 @@ def answer_query(tramdict, query):
 
         to_pos = rest_l.find(" to ")
         if to_pos == -1:
-            return "sorry, try again"
+            return Failed("sorry, try again")
 
         raw_stop1 = rest[:to_pos].strip()
         raw_stop2 = rest[to_pos + len(" to "):].strip()
 
-        stop1 = resolve_stop_name(stopdict, raw_stop1)
-        stop2 = resolve_stop_name(stopdict, raw_stop2)
+        stop1 = resolve_stop_name(stopdict, raw_stop1, index["names"])
+        stop2 = resolve_stop_name(stopdict, raw_stop2, index["names"])
 
         if stop1 is None or stop2 is None:
+            return Failed("unknown arguments")
+        return Distance(stop1, stop2)
+
+    # other
+    return Failed("sorry, try again")
+
+
+
+def evaluate_plan(tramdict, plan):
+
+    # Return the answer value of a query plan
+    stopdict = tramdict["stops"]
+    linedict = tramdict["lines"]
+    timedict = tramdict["times"]
+    index = network_index(tramdict)
+
+    if isinstance(plan, Failed):
+        return plan.answer
+
+    if isinstance(plan, Via):
+        return lines_via_stop(linedict, plan.stop, index["lines"])
+
+    if isinstance(plan, Between):
+        return lines_between_stops(linedict, plan.stop1, plan.stop2, index["lines"])
+
+    if isinstance(plan, Time):
+        t = time_between_stops(linedict, timedict, plan.line, plan.stop1, plan.stop2,
+                               index["times"])
+        if t is None:
             return "unknown arguments"
+        return t
 
-        d = distance_between_stops(stopdict, stop1, stop2)
+    if isinstance(plan, Distance):
+        d = distance_between_stops(stopdict, plan.stop1, plan.stop2, index["geo"])
         if d is None:
             return "unknown arguments"
         return d
 
-    # other
     return "sorry, try again"
 
 
 
+def answer_query(tramdict, query):
+
+    # Parse a query string and return the answer value.
+    # Plans and answers are memoized in the network index. An answer is
+    # cached with what its evaluation printed (e.g. "stops not on this
+    # line"), which is printed again on every hit, so a repeated query
+    # shows the same output.
+    index = network_index(tramdict)
+    q = query.strip()
+
+    plan = index["plans"].get(q)
+    if plan is None:
+        plan = compile_query(tramdict, q)
+        index["plans"].put(q, plan)
+
+    if isinstance(plan, Failed):
+        return plan.answer
+
+    cached = index["answers"].get(plan)
+    if cached is None:
+        printed = io.StringIO()
+        with contextlib.redirect_stdout(printed):
+            answer = evaluate_plan(tramdict, plan)
+        cached = (answer, printed.getvalue())
+        index["answers"].put(plan, cached)
+    answer, text = cached
+    if text:
+        sys.stdout.write(text)
+
+    # callers get their own copy of a cached list
+    if isinstance(answer, list):
+        return list(answer)
+    return answer
+
+
+
+def query_cache_stats(tramdict):
+    # Hit/miss counts of the plan and answer caches
+    index = network_index(tramdict)
+    return {"plans": index["plans"].stats(), "answers": index["answers"].stats()}
+
+
+
+def clear_query_cache(tramdict):
+    index = network_index(tramdict)
+    index["plans"].clear()
+    index["answers"].clear()
+
+
+
 def dialogue(tramfile=TRAM_FILE):
-    with open(tramfile, encoding="utf-8") as f:
-        tramdict = json.load(f)
+    tramdict = load_tram_network(tramfile)
+    index = network_index(tramdict)
+
+    for line, s1, s2 in index["times"]["missing"]:
+        print("no time data between", s1, "and", s2, "on line", line, file=sys.stderr)
 
     while True:
         try:
@@ -367,8 +781,90 @@ def dialogue(tramfile=TRAM_FILE):
 
 
 
+# batch mode: each worker process loads the network once
+_batch_tramdict = None
+
+
+
+def _init_batch_worker(tramfile):
+    global _batch_tramdict
+    _batch_tramdict = load_tram_network(tramfile)
+    network_index(_batch_tramdict)
+    # the answers already say "unknown arguments"; drop the diagnostic
+    # prints so they neither corrupt nor flood the JSONL output
+    sys.stdout = open(os.devnull, "w")
+
+
+
+def _answer_chunk(queries):
+    return [answer_query(_batch_tramdict, q) for q in queries]
+
+
+
+def read_query_chunks(lines, size=BATCH_CHUNK):
+    # Group non-empty query lines into lists of at most size queries
+    chunk = []
+    for line in lines:
+        query = line.strip()
+        if not query:
+            continue
+        chunk.append(query)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+
+def batch(queryfile="-", tramfile=TRAM_FILE, out=None, workers=None):
+
+    # Answer every query in queryfile ("-" for stdin) with a pool of
+    # workers and write one JSON object per query, in input order.
+    # Only a few chunks are in flight at a time, so memory stays bounded.
+    out = out or sys.stdout
+    workers = workers or os.cpu_count() or 1
+    max_pending = 4 * workers
+
+    count = 0
+    start = time.perf_counter()
+
+    f = sys.stdin if queryfile == "-" else open(queryfile, encoding="utf-8")
+    try:
+        with multiprocessing.Pool(workers, _init_batch_worker, (tramfile,)) as pool:
+            pending = deque()
+
+            def write_oldest():
+                queries, result = pending.popleft()
+                for query, answer in zip(queries, result.get()):
+                    out.write(json.dumps({"query": query, "answer": answer},
+                                         ensure_ascii=False) + "\n")
+                return len(queries)
+
+            for chunk in read_query_chunks(f):
+                pending.append((chunk, pool.apply_async(_answer_chunk, (chunk,))))
+                if len(pending) >= max_pending:
+                    count += write_oldest()
+            while pending:
+                count += write_oldest()
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"{count} queries in {elapsed:.2f} s ({count / elapsed:.0f} queries/s)",
+          file=sys.stderr)
+    return count
+
+
+
 if __name__ == '__main__':
-    if sys.argv[1:] == ['init']:
-        build_tram_network(STOP_FILE,LINE_FILE)
+    if sys.argv[1:2] == ['batch']:
+        # tramdata.py batch [<file> [<workers>]]
+        args = sys.argv[2:]
+        batch(args[0] if args else "-", workers=int(args[1]) if args[1:] else None)
+    elif sys.argv[1:] == ['init']:
+        build_tram_network(STOP_FILE, LINE_FILE, progress=report_progress)
+        print(file=sys.stderr)
     else:
         dialogue()
\ No newline at end of file
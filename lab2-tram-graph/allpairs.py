@@ -0,0 +1,234 @@
+# All-pairs shortest path tables (extra feature)
+#
+# Costs between every pair of stops and a predecessor matrix, so one
+# route is a table lookup plus a walk back along the predecessors:
+#   cost[i, j]   cost of a shortest path from stop i to stop j (inf if none)
+#   pred[i, j]   the stop before j on that path (-1 for j == i or no path)
+# Small networks use a vectorized Floyd-Warshall in NumPy, larger ones
+# one Dijkstra per source spread over a process pool.
+# Tables are saved as .npz files named after the network content hash,
+# with compact costs (see compact_cost()): float32, or for integer
+# costs the smallest integer type, where -1 stands for no path.
+
+import glob
+import multiprocessing
+import os
+
+import numpy as np
+
+from graphs import dijkstra_tree
+
+# above this many stops, run Dijkstra per source instead of Floyd-Warshall
+FLOYD_LIMIT = 1000
+
+# sources per pool task
+SOURCE_CHUNK = 64
+
+
+class AllPairs:
+
+    def __init__(self, names, cost, pred, integer=True):
+        self.names = list(names)
+        self.ids = {name: i for i, name in enumerate(self.names)}
+        self.cost = cost
+        self.pred = pred
+        self.integer = integer
+
+    def __len__(self):
+        return len(self.names)
+
+    def distance(self, source, target):
+        # Cost of a shortest path, or None if target is unreachable.
+        c = self.cost[self.ids[source], self.ids[target]]
+        if unreachable(c):
+            return None
+        return int(c) if self.integer else float(c)
+
+    def path(self, source, target):
+        # Stops on a shortest path, or None if target is unreachable.
+        i = self.ids[source]
+        j = self.ids[target]
+        if unreachable(self.cost[i, j]):
+            return None
+        row = self.pred[i]
+        path = [j]
+        while j != i:
+            j = int(row[j])
+            path.append(j)
+        path.reverse()
+        return [self.names[k] for k in path]
+
+    def shortest_path(self, source, target):
+        # (path, cost) or (None, None), like graphs.shortest_path().
+        if source not in self.ids or target not in self.ids:
+            return None, None
+        path = self.path(source, target)
+        if path is None:
+            return None, None
+        return path, self.distance(source, target)
+
+    def compact_cost(self):
+        # The costs in the smallest type that keeps them exact enough:
+        # float32, or an integer type with -1 for no path.
+        if not self.integer:
+            return self.cost.astype(np.float32)
+        finite = np.isfinite(self.cost)
+        top = self.cost[finite].max(initial=0)
+        cost_type = np.int16 if top < 2 ** 15 else np.int32 if top < 2 ** 31 else np.int64
+        return np.where(finite, self.cost, -1).astype(cost_type)
+
+    def save(self, path):
+        # Compact costs and predecessors in the smallest int type that
+        # holds a stop id. The file is written next to path and swapped
+        # in, so a reader never sees half a table.
+        pred_type = np.int16 if len(self.names) < 2 ** 15 else np.int32
+        partial = path + ".tmp"
+        with open(partial, "wb") as f:
+            np.savez(f, names=np.array(self.names), cost=self.compact_cost(),
+                     pred=self.pred.astype(pred_type), integer=np.array(self.integer))
+        os.replace(partial, path)
+
+    @classmethod
+    def load(cls, path):
+        # Costs stay in their stored type.
+        with np.load(path) as data:
+            return cls(data["names"].tolist(), data["cost"], data["pred"],
+                       bool(data["integer"]))
+
+
+def unreachable(c):
+    # No path: inf in a float cost table, -1 in an integer one.
+    return c < 0 or c == np.inf
+
+
+def edge_matrices(graph, weight="weight"):
+    # (names, cost, pred) before any relaxation: edge costs, 0 on the
+    # diagonal, inf elsewhere; pred[i, j] = i along every edge.
+    names = graph.vertices()
+    ids = {name: i for i, name in enumerate(names)}
+    n = len(names)
+    cost = np.full((n, n), np.inf)
+    pred = np.full((n, n), -1, dtype=np.int32)
+    for a, b in graph.edges():
+        i, j = ids[a], ids[b]
+        c = graph[a][b][weight]
+        if c < cost[i, j]:
+            cost[i, j] = cost[j, i] = c
+            pred[i, j] = i
+            pred[j, i] = j
+    np.fill_diagonal(cost, 0)
+    np.fill_diagonal(pred, -1)
+    return names, cost, pred
+
+
+def floyd_warshall(graph, weight="weight"):
+    # Floyd-Warshall with one NumPy pass over the whole matrix per
+    # intermediate stop k: O(n^3) work, O(n^2) memory.
+    names, cost, pred = edge_matrices(graph, weight)
+    for k in range(len(names)):
+        via = cost[:, k, None] + cost[None, k, :]
+        better = via < cost
+        cost = np.where(better, via, cost)
+        pred = np.where(better, pred[k][None, :], pred)
+    return names, cost, pred
+
+
+# graph, weight and stop ids of a pool worker, see _init_worker()
+_worker = {}
+
+
+def _init_worker(graph, weight, names):
+    _worker["graph"] = graph
+    _worker["weight"] = weight
+    _worker["ids"] = {name: i for i, name in enumerate(names)}
+
+
+def _dijkstra_rows(sources):
+    # cost and pred rows for a chunk of source ids
+    graph = _worker["graph"]
+    ids = _worker["ids"]
+    names = list(ids)
+    rows = []
+    for i in sources:
+        cost = np.full(len(ids), np.inf)
+        pred = np.full(len(ids), -1, dtype=np.int32)
+        dist, before = dijkstra_tree(graph, names[i], weight=_worker["weight"])
+        for v, d in dist.items():
+            cost[ids[v]] = d
+            if before[v] is not None:
+                pred[ids[v]] = ids[before[v]]
+        rows.append((i, cost, pred))
+    return rows
+
+
+def dijkstra_all(graph, weight="weight", workers=None):
+    # One Dijkstra per source, chunks of sources run in a process pool.
+    names = graph.vertices()
+    n = len(names)
+    cost = np.empty((n, n))
+    pred = np.empty((n, n), dtype=np.int32)
+    chunks = [range(k, min(k + SOURCE_CHUNK, n)) for k in range(0, n, SOURCE_CHUNK)]
+    with multiprocessing.Pool(workers, _init_worker, (graph, weight, names)) as pool:
+        for rows in pool.imap_unordered(_dijkstra_rows, chunks):
+            for i, c, p in rows:
+                cost[i] = c
+                pred[i] = p
+    return names, cost, pred
+
+
+def build_all_pairs(graph, weight="weight", workers=None):
+    # All-pairs table of graph with the edge attribute weight as cost.
+    if len(graph) <= FLOYD_LIMIT:
+        names, cost, pred = floyd_warshall(graph, weight)
+    else:
+        names, cost, pred = dijkstra_all(graph, weight, workers)
+    integer = all(float(graph[a][b][weight]).is_integer() for a, b in graph.edges())
+    return AllPairs(names, cost, pred, integer)
+
+
+def cache_file(directory, weight, content_hash):
+    return os.path.join(directory, f"allpairs_{weight}_{content_hash}.npz")
+
+
+# (directory, weight) -> (path, table): only the table of the current
+# network version is kept
+_loaded = {}
+
+
+def load_all_pairs(directory, weight, content_hash):
+    # The stored table for weight and this network version, or None if
+    # it has not been built. A loaded table stays in memory until one
+    # for another version is loaded or stored.
+    path = cache_file(directory, weight, content_hash)
+    entry = _loaded.get((directory, weight))
+    if entry is None or entry[0] != path:
+        if not os.path.exists(path):
+            return None
+        _loaded[(directory, weight)] = (path, AllPairs.load(path))
+    return _loaded[(directory, weight)][1]
+
+
+def load_or_build(graph, weight, directory, content_hash, workers=None):
+    # As load_all_pairs(), building and storing the table if it is
+    # missing (for offline use, not in web requests).
+    table = load_all_pairs(directory, weight, content_hash)
+    if table is None:
+        table = build_all_pairs(graph, weight, workers)
+        store(table, directory, weight, content_hash)
+        _loaded[(directory, weight)] = (cache_file(directory, weight, content_hash), table)
+    return table
+
+
+def store(table, directory, weight, content_hash):
+    # Save table in directory, then remove tables of older network
+    # versions, on disk and in memory; the current one is never missing
+    # in between.
+    os.makedirs(directory, exist_ok=True)
+    path = cache_file(directory, weight, content_hash)
+    table.save(path)
+    if (directory, weight) in _loaded and _loaded[(directory, weight)][0] != path:
+        del _loaded[(directory, weight)]
+    for old in glob.glob(cache_file(directory, weight, "*")):
+        if old != path:
+            os.remove(old)
+    return path
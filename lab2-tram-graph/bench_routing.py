@@ -0,0 +1,127 @@
+# Settled-vertex benchmark: Dijkstra vs bidirectional vs A* (extra feature)
+# (bidirectional also on the frozen CSR graph)
+#
+#   python bench_routing.py                  Gothenburg + default synthetic sizes
+#   python bench_routing.py 20 40 ...        synthetic grids of side x side stops
+#
+# For each network and metric, random stop pairs are routed with every
+# algorithm; the costs must agree, and the mean number of settled
+# (expanded) vertices and the mean time per query are reported.
+
+import sys
+import random
+import time
+
+from trams import TramNetwork, readTramNetwork, td
+from graphs import dijkstra_tree, shortest_path, astar_path
+
+# synthetic grid sides (side * side stops)
+SIDES = [20, 40, 80]
+
+# stop pairs per network
+QUERIES = 200
+
+# spacing of synthetic stops (degrees) and tram speed (km per minute)
+SPACING = 0.004
+SPEED = 0.4
+
+
+def synthetic_tramdict(side, nlines=None, seed=0):
+
+    # A tramdict for a side x side grid of stops around Gothenburg.
+    # Lines are monotone staircase walks from the west or south edge
+    # across the grid, and segment times follow the distance.
+    rng = random.Random(seed)
+    nlines = nlines or 2 * side
+
+    stops = {}
+    for i in range(side):
+        for j in range(side):
+            stops[f"S{i}-{j}"] = {
+                "town": "Göteborg",
+                "position": [f"{57.65 + i * SPACING:.7f}", f"{11.90 + j * SPACING * 1.8:.7f}"],
+            }
+    tramdict = {"stops": stops, "lines": {}, "times": {}}
+    coords = td.geo.StopCoordinates(stops)
+
+    for line in range(1, nlines + 1):
+        # main direction (east or north) and a random sideways drift
+        if rng.random() < 0.5:
+            i, j = rng.randrange(side), 0
+            main, drift = (0, 1), (rng.choice([-1, 1]), 0)
+        else:
+            i, j = 0, rng.randrange(side)
+            main, drift = (1, 0), (0, rng.choice([-1, 1]))
+        route = [f"S{i}-{j}"]
+        while True:
+            di, dj = main if rng.random() < 0.7 else drift
+            i, j = i + di, j + dj
+            if not (0 <= i < side and 0 <= j < side):
+                break
+            route.append(f"S{i}-{j}")
+        if len(route) < 2:
+            continue
+        tramdict["lines"][str(line)] = route
+        for s1, s2 in zip(route, route[1:]):
+            a, b = sorted([s1, s2])
+            minutes = max(1, round(coords.distance(a, b) / SPEED))
+            tramdict["times"].setdefault(a, {})[b] = minutes
+
+    # keep only stops that some line visits
+    used = {s for route in tramdict["lines"].values() for s in route}
+    tramdict["stops"] = {s: info for s, info in stops.items() if s in used}
+    return tramdict
+
+
+def bench_network(name, network, queries=QUERIES, seed=1):
+
+    # Print mean settled vertices and time per query for each algorithm
+    rng = random.Random(seed)
+    stops = network.vertices()
+    pairs = [(rng.choice(stops), rng.choice(stops)) for _ in range(queries)]
+
+    print(f"\n{name}: {len(network)} stops, {network.number_of_edges()} edges, "
+          f"{queries} queries")
+    print(f"{'metric':10} {'algorithm':20} {'settled':>10} {'time/query':>12}")
+
+    frozen = network.freeze()
+    heuristics = {"weight": network.time_heuristic, "distance": network.distance_heuristic}
+
+    for metric, label in [("weight", "time"), ("distance", "distance")]:
+        algorithms = [
+            ("dijkstra", lambda s, t, st: dijkstra_tree(network, s, weight=metric, target=t, stats=st)[0].get(t)),
+            ("bidirectional", lambda s, t, st: shortest_path(network, s, t, metric, st)[1]),
+            ("bidirectional (csr)", lambda s, t, st: frozen.shortest_path(s, t, metric, st)[1]),
+            ("a*", lambda s, t, st: astar_path(network, s, t, metric, heuristics[metric](t), st)[1]),
+        ]
+        reference = None
+        for algo, run in algorithms:
+            settled = 0
+            costs = []
+            start = time.perf_counter()
+            for s, t in pairs:
+                stats = {}
+                costs.append(run(s, t, stats))
+                settled += stats["settled"]
+            elapsed = time.perf_counter() - start
+
+            if reference is None:
+                reference = costs
+            else:
+                for c1, c2 in zip(reference, costs):
+                    assert (c1 is None and c2 is None) or abs(c1 - c2) < 1e-9, (algo, c1, c2)
+
+            print(f"{label:10} {algo:20} {settled / queries:10.1f} "
+                  f"{elapsed / queries * 1e3:9.3f} ms")
+
+
+def main(args):
+    sides = [int(arg) for arg in args] or SIDES
+    if not args:
+        bench_network("Gothenburg", readTramNetwork())
+    for side in sides:
+        bench_network(f"synthetic grid {side}x{side}", TramNetwork(synthetic_tramdict(side)))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
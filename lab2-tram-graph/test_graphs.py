@@ -1,5 +1,9 @@
+import shutil
 import unittest
-from graphs import Graph, WeightedGraph, dijkstra
+from graphs import Graph, WeightedGraph, dijkstra, dijkstra_tree, path_to, shortest_path, astar_path
+from graphs import MaskedGraph, k_shortest_paths, DynamicShortestPaths
+from graphs import build_dot, geo_positions, cached_rendering
+import random
 
 class TestGraphs(unittest.TestCase):
 
@@ -32,5 +36,188 @@ class TestGraphs(unittest.TestCase):
         paths = dijkstra(WG, 1, cost=lambda u, v: WG.get_weight(u, v))
         self.assertEqual(paths[3], [1, 2, 3])
 
+    def test_dijkstra_weight_attribute(self):
+        # Reading the weight attribute gives the same paths as a cost function.
+        WG = WeightedGraph([(1, 2), (2, 3), (1, 3)])
+        WG.set_weight(1, 2, 1)
+        WG.set_weight(2, 3, 1)
+        WG.set_weight(1, 3, 5)
+        self.assertEqual(dijkstra(WG, 1, weight="weight"),
+                         dijkstra(WG, 1, cost=lambda u, v: WG.get_weight(u, v)))
+        self.assertEqual(dijkstra(WG, 1, weight="weight")[3], [1, 2, 3])
+
+    def test_dijkstra_tree_early_exit(self):
+        # With a target the search stops once the target is settled.
+        G = Graph([(1, 2), (2, 3), (3, 4)])
+        dist, pred = dijkstra_tree(G, 1, target=2)
+        self.assertEqual(dist, {1: 0, 2: 1})
+        self.assertEqual(path_to(pred, 2), [1, 2])
+        self.assertIsNone(path_to(pred, 4))
+        # 3 was reached but not settled
+        self.assertIsNone(path_to(pred, 3))
+
+    def test_missing_weight_falls_back_to_cost(self):
+        # Edges without the weight attribute use the cost function.
+        WG = WeightedGraph([(1, 2), (2, 3)])
+        WG.set_weight(1, 2, 4)
+        for graph in (WG, WG.freeze()):
+            dist, _ = dijkstra_tree(graph, 1, cost=lambda u, v: 2, weight="weight")
+            self.assertEqual(dist, {1: 0, 2: 4, 3: 6})
+            dist, _ = dijkstra_tree(graph, 1, weight="weight")
+            self.assertEqual(dist, {1: 0, 2: 4})
+
+    def test_bidirectional_shortest_path(self):
+        # The bidirectional search returns the same cost as Dijkstra.
+        WG = WeightedGraph([(1, 2), (2, 3), (1, 3), (3, 4), (4, 5), (2, 5)])
+        for (a, b), w in zip(WG.edges(), [2, 7, 1, 3, 1, 9]):
+            WG.set_weight(a, b, w)
+        for t in WG.vertices():
+            dist, pred = dijkstra_tree(WG, 1, weight="weight")
+            path, cost = shortest_path(WG, 1, t, "weight")
+            self.assertEqual(cost, dist[t])
+            self.assertEqual(sum(WG.get_weight(a, b) for a, b in zip(path, path[1:])), cost)
+
+    def test_bidirectional_unreachable(self):
+        G = Graph([(1, 2), (3, 4)])
+        self.assertEqual(shortest_path(G, 1, 4, lambda u, v: 1), (None, None))
+        self.assertEqual(shortest_path(G, 1, 1, lambda u, v: 1), ([1], 0))
+
+    def test_astar_matches_dijkstra(self):
+        # With an admissible heuristic A* finds the Dijkstra cost.
+        WG = WeightedGraph([(1, 2), (2, 3), (1, 3), (3, 4), (4, 5), (2, 5)])
+        for (a, b), w in zip(WG.edges(), [2, 7, 1, 3, 1, 9]):
+            WG.set_weight(a, b, w)
+        for t in WG.vertices():
+            dist, pred = dijkstra_tree(WG, 1, weight="weight", target=t)
+            lower = lambda v: 1 if v not in (t, 3) else 0
+            path, cost = astar_path(WG, 1, t, "weight", lower)
+            self.assertEqual(cost, dist[t])
+            self.assertEqual(path[-1], t)
+        self.assertEqual(astar_path(Graph([(1, 2), (3, 4)]), 1, 4, lambda u, v: 1), (None, None))
+
+    def test_frozen_graph(self):
+        # The CSR copy has the same edges and routes to the same costs.
+        WG = WeightedGraph([(1, 2), (2, 3), (1, 3), (3, 4), (4, 5), (2, 5)])
+        for (a, b), w in zip(WG.edges(), [2, 7, 1, 3, 1, 9]):
+            WG.set_weight(a, b, w)
+        WG.add_vertex(6)
+        FG = WG.freeze()
+        self.assertEqual(len(FG), 6)
+        self.assertEqual(FG.number_of_edges(), 6)
+        self.assertEqual(sorted(map(sorted, FG.edges())), sorted(map(sorted, WG.edges())))
+        self.assertEqual(FG.get_weight(5, 4), WG.get_weight(4, 5))
+        # whole number weights stay integers
+        self.assertIsInstance(FG.get_weight(5, 4), int)
+        self.assertIsInstance(FG[5][4]["weight"], int)
+        self.assertFalse(FG.has_edge(1, 4))
+        for t in WG.vertices():
+            expected = shortest_path(WG, 1, t, "weight")
+            self.assertEqual(shortest_path(FG, 1, t, "weight"), expected)
+            self.assertEqual(FG.shortest_path(1, t, "weight"), expected)
+            self.assertEqual(dijkstra_tree(FG.by_id(), 0, weight="weight")[0].get(FG.ids[t]),
+                             expected[1])
+
+    def test_k_shortest_paths(self):
+        # All loopless 1 -> 5 paths, cheapest first, without repeats.
+        WG = WeightedGraph([(1, 2), (2, 3), (1, 3), (3, 4), (4, 5), (2, 5)])
+        for (a, b), w in zip(WG.edges(), [2, 7, 1, 3, 1, 9]):
+            WG.set_weight(a, b, w)
+        paths = WG.k_shortest_paths(1, 5, 10)
+        costs = [cost for _, cost in paths]
+        self.assertEqual(costs, sorted(costs))
+        self.assertEqual(len({tuple(path) for path, _ in paths}), len(paths))
+        self.assertEqual(len(paths), 4)
+        for path, cost in paths:
+            self.assertEqual(len(set(path)), len(path))
+            self.assertEqual(sum(WG.get_weight(a, b) for a, b in zip(path, path[1:])), cost)
+        self.assertEqual(paths[0], shortest_path(WG, 1, 5))
+        self.assertEqual(k_shortest_paths(Graph([(1, 2), (3, 4)]), 1, 4, 3, lambda u, v: 1), [])
+
+    def test_masked_graph(self):
+        # Masked vertices and edges are routed around.
+        G = Graph([(1, 2), (2, 3), (1, 4), (4, 3)])
+        unit = lambda u, v: 1
+        self.assertEqual(shortest_path(MaskedGraph(G, vertices=[2]), 1, 3, unit), ([1, 4, 3], 2))
+        self.assertEqual(shortest_path(MaskedGraph(G, edges=[(3, 4)]), 1, 3, unit), ([1, 2, 3], 2))
+        self.assertEqual(shortest_path(MaskedGraph(G, [2], [(4, 3)]), 1, 3, unit), (None, None))
+
+    def test_dynamic_shortest_paths(self):
+        # After every closure or weight change the repaired trees are
+        # exactly what a new Dijkstra gives.
+        rng = random.Random(0)
+        WG = WeightedGraph()
+        for i in range(6):
+            for j in range(6):
+                if i < 5:
+                    WG.set_weight((i, j), (i + 1, j), rng.randint(1, 9))
+                if j < 5:
+                    WG.set_weight((i, j), (i, j + 1), rng.randint(1, 9))
+        edges = WG.edges()
+        dyn = DynamicShortestPaths(WG, [(0, 0), (3, 2)])
+        for _ in range(200):
+            a, b = rng.choice(edges)
+            w = None if rng.random() < 0.3 else rng.randint(0, 9)
+            before = {t: dyn.distance((0, 0), t) for t in WG.vertices()}
+            changed = dyn.update_edge(a, b, w)
+            for source in [(0, 0), (3, 2)]:
+                dist, _ = dijkstra_tree(WG, source, weight="weight")
+                self.assertEqual(dyn.trees[source][0], dist)
+                for t, d in dist.items():
+                    path = dyn.path(source, t)
+                    self.assertEqual(sum(WG.get_weight(x, y) for x, y in zip(path, path[1:])), d)
+            for t in WG.vertices():
+                if dyn.distance((0, 0), t) != before[t]:
+                    self.assertIn(t, changed[(0, 0)])
+
+    def test_geo_pinned_dot(self):
+        # Vertices with a position are pinned there for neato.
+        G = Graph([("a", "b")])
+        G.set_vertex_value("a", {"position": ["57.70", "11.97"]})
+        self.assertIsNone(geo_positions(G))
+        G.set_vertex_value("b", {"position": ["57.71", "11.98"]})
+        positions = geo_positions(G)
+        self.assertGreater(positions["b"][1], positions["a"][1])
+        dot = build_dot(G, positions=positions)
+        self.assertEqual(dot.engine, "neato")
+        self.assertIn("!", dot.source)
+
+    def test_cached_rendering_recolors(self):
+        # Colouring rewrites the cached SVG; no new layout is made.
+        G = Graph([("a", "b")])
+        rendering = cached_rendering(G)
+        self.assertIs(cached_rendering(G), rendering)
+        rendering._svg = (
+            '<svg><g id="node1" class="node">\n<title>a</title>\n'
+            '<ellipse fill="none" stroke="black" cx="1"/>\n</g>\n'
+            '<g id="node2" class="node">\n<title>b &amp; c</title>\n'
+            '<ellipse fill="none" stroke="black" cx="2"/>\n</g></svg>'
+        )
+        svg = rendering.colored({"b & c": "orange"})
+        self.assertIn('<title>b &amp; c</title>\n<ellipse fill="none" stroke="orange"', svg)
+        self.assertIn('<title>a</title>\n<ellipse fill="none" stroke="black"', svg)
+        self.assertEqual(rendering.colored(), rendering._svg)
+        G.add_edge("b", "d")
+        self.assertIsNot(cached_rendering(G), rendering)
+        # same number of vertices and edges, other edges
+        rendering = cached_rendering(G)
+        G.remove_edge("b", "d")
+        G.add_edge("a", "d")
+        self.assertIsNot(cached_rendering(G), rendering)
+
+    @unittest.skipIf(shutil.which("neato") is None, "Graphviz is not installed")
+    def test_cached_rendering_with_neato(self):
+        # A real layout: every node is found in the SVG and recoloured,
+        # and moving a stop makes a new layout.
+        G = Graph([("a", "b"), ("b", "c")])
+        for v, lat in [("a", 57.70), ("b", 57.71), ("c", 57.72)]:
+            G.set_vertex_value(v, {"position": [lat, 11.97]})
+        rendering = cached_rendering(G)
+        self.assertEqual(sorted(rendering._split()[1]), ["a", "b", "c"])
+        svg = rendering.colored({"b": "orange"})
+        self.assertEqual(svg.count('stroke="orange"'), 1)
+        self.assertIs(cached_rendering(G), rendering)
+        G.set_vertex_value("c", {"position": [57.72, 12.00]})
+        self.assertIsNot(cached_rendering(G), rendering)
+
 if __name__ == "__main__":
     unittest.main()
@@ -1,6 +1,9 @@
+import json
 import unittest
-from trams import readTramNetwork
-from graphs import dijkstra
+from trams import TRAM_FILE, TramNetwork, readTramNetwork
+from trambin import StopEntries
+from graphs import dijkstra, shortest_path
+import allpairs
 
 
 class TestTrams(unittest.TestCase):
@@ -22,6 +25,10 @@ class TestTrams(unittest.TestCase):
         # This is from Lab1 documentation: ['6', '7', '8', '10', '13']
         self.assertEqual(lines, ['6', '7', '8', '10', '13'])
 
+    def test_lines_between_chalmers_valand(self):
+        # Same answer as the Lab1 example.
+        self.assertEqual(self.G.lines_between_stops("Chalmers", "Valand"), ['7', '10'])
+
     def test_shortest_path_stations_count(self):
         # When using the fewest stops as cost, the path from Chalmers to Järntorget should have at least two stops.
         paths = dijkstra(self.G, "Chalmers", cost=lambda u, v: 1)
@@ -30,6 +37,28 @@ class TestTrams(unittest.TestCase):
         self.assertIsInstance(path, list)
         self.assertGreater(len(path), 1)
 
+    def test_stop_records(self):
+        # Positions are parsed once into slotted stop records, which
+        # are also the vertex values.
+        stop = self.G.get_vertex_value("Chalmers")
+        self.assertIs(stop, self.G.stops["Chalmers"])
+        self.assertFalse(hasattr(stop, "__dict__"))
+        lat, lon = self.G.stopdict["Chalmers"]["position"]
+        self.assertEqual(self.G.position("Chalmers"), (float(lat), float(lon)))
+        min_lat, max_lat, min_lon, max_lon = self.G.extreme_position()
+        self.assertTrue(min_lat <= stop.lat <= max_lat and min_lon <= stop.lon <= max_lon)
+
+    def test_stop_dicts_not_kept(self):
+        # The JSON stop dicts are packed into arrays; the records are
+        # the only per-stop objects, and the entries read back the same.
+        with open(TRAM_FILE, encoding="utf-8") as f:
+            tramdict = json.load(f)
+        G = TramNetwork(tramdict)
+        self.assertIsInstance(G.stopdict, StopEntries)
+        self.assertIs(G.tramdict["stops"], G.stopdict)
+        self.assertEqual(dict(G.stopdict), tramdict["stops"])
+        self.assertEqual(G.content_hash(), self.G.content_hash())
+
     def test_transition_times_non_negative(self):
         # All transition times on edges should be non-negative.
         positive_count = 0
@@ -45,6 +74,26 @@ class TestTrams(unittest.TestCase):
         # There should be at least one edge with a strictly positive transition time.
         self.assertGreater(positive_count, 0, "no strictly positive transition times found")
 
+    def test_all_pairs_matches_dijkstra(self):
+        # Floyd-Warshall and the per-source Dijkstra pool agree, and
+        # paths rebuilt from the predecessors have the tabled cost.
+        floyd = allpairs.build_all_pairs(self.G, "distance")
+        names, cost, _ = allpairs.dijkstra_all(self.G, "distance", workers=2)
+        self.assertEqual(names, floyd.names)
+        self.assertTrue((abs(cost - floyd.cost) < 1e-9).all())
+
+        table = allpairs.build_all_pairs(self.G, "weight")
+        for target in ["Järntorget", "Opaltorget", "Angered Centrum"]:
+            path, minutes = table.shortest_path("Chalmers", target)
+            self.assertEqual(minutes, shortest_path(self.G, "Chalmers", target)[1])
+            self.assertEqual(minutes, sum(self.G.get_weight(a, b) for a, b in zip(path, path[1:])))
+
+    def test_content_hash(self):
+        # Same data, same hash; any change gives a new hash.
+        self.assertEqual(self.G.content_hash(), readTramNetwork().content_hash())
+        other = readTramNetwork()
+        other.timedict["Chalmers"] = dict(other.timedict.get("Chalmers", {}), Valand=99)
+        self.assertNotEqual(self.G.content_hash(), other.content_hash())
 
 
 if __name__ == '__main__':
@@ -1,13 +1,20 @@
 import sys
+import hashlib
 import json
 
-sys.path.append('../lab1-group-148')
+sys.path.append('../lab1-tram-data')
 
 import tramdata as td
+from geo import stop_table
+from trambin import StopEntries, stop_entries
 from graphs import WeightedGraph, view_shortest, dijkstra
+import allpairs
 
 
-TRAM_FILE = '../lab1-group-148/tramnetwork.json'
+TRAM_FILE = '../lab1-tram-data/tramnetwork.json'
+
+# all-pairs tables, one file per metric and network version
+ALLPAIRS_DIR = './cache'
 
 
 class TramNetwork(WeightedGraph):
@@ -15,15 +22,26 @@ class TramNetwork(WeightedGraph):
         # tramdict: the dictionary loaded from tramnetwork.json
         super().__init__()
 
-        self.tramdict = tramdict
+        # The stop records below are the only per-stop objects kept.
+        # stopdict is a view of the stop table in the arrays of the
+        # lab 1 binary format (see trambin.py), either the mapped file
+        # or the JSON dicts packed once here; an entry is rebuilt
+        # exactly as in the file only when it is looked up.
         self.stopdict = tramdict["stops"]
+        if not isinstance(self.stopdict, StopEntries):
+            self.stopdict = stop_entries(self.stopdict)
         self.linedict = tramdict["lines"]
         self.timedict = tramdict["times"]
+        self.tramdict = {"stops": self.stopdict, "lines": self.linedict, "times": self.timedict}
+
+        # stop records with the positions parsed (see geo.Stop), as
+        # the vertex values
+        self.stops = stop_table(self.stopdict)
 
         # Build the graph structure:    
-        for stop_name, info in self.stopdict.items():
+        for stop_name, stop in self.stops.items():
             self.add_vertex(stop_name)
-            self.set_vertex_value(stop_name, info)
+            self.set_vertex_value(stop_name, stop)
 
         # create edges between adjacent stops and set weights
         for line, stops in self.linedict.items():
@@ -36,32 +54,95 @@ class TramNetwork(WeightedGraph):
                 if existing is None or minutes < existing:
                     self.set_weight(s1, s2, minutes)
 
+        # stop -> line bitset, built once for the line queries
+        self.lineindex = td.build_line_index(self.linedict)
+
+        # stop coordinates as float arrays and precomputed distances
+        self.geoindex = td.build_geo_index(self.stopdict)
+
+        # geographic length of every edge (not rounded like
+        # geo_distance()), for routing by distance
+        for a, b in self.edges():
+            self[a][b]["distance"] = self.geoindex.distance(a, b)
+
+        # (max speed, 0-minute length), see max_speed()
+        self._speed = None
+
+        # see content_hash()
+        self._hash = None
+
 
     def position(self, stop):
-        # Return (lat, lon) as floats for a given stop.
-        info = self.stopdict[stop]
-        lat_str, lon_str = info["position"]
-        return float(lat_str), float(lon_str)
+        # Return (lat, lon) as floats for a given stop (NaN if it has none).
+        stop = self.stops[stop]
+        return stop.lat, stop.lon
 
     def transition_time(self, stop1, stop2):
         # Returns None if there is no direct edge.
-        if not self.has_edge(stop1, stop2):
-            return None
-        a, b = sorted([stop1, stop2])
-        return self.timedict[a][b]
+        return self.get_weight(stop1, stop2)
 
     def geo_distance(self, stop1, stop2):
         # Geographic distance in km, reusing Lab1 distance_between_stops().
-        return td.distance_between_stops(self.stopdict, stop1, stop2)
+        return td.distance_between_stops(self.stopdict, stop1, stop2, self.geoindex)
+
+    def max_speed(self):
+        # Highest speed (km per minute) over edges with a positive time,
+        # and the total length of edges that take 0 minutes.
+        # Computed once; the network does not change after loading.
+        if self._speed is None:
+            speed = 0.0
+            free = 0.0
+            for a, b in self.edges():
+                minutes = self.transition_time(a, b)
+                km = self[a][b]["distance"]
+                if minutes > 0:
+                    speed = max(speed, km / minutes)
+                else:
+                    free += km
+            self._speed = (speed, free)
+        return self._speed
+
+    def distance_heuristic(self, target):
+        # A* lower bound for routing by "distance": the straight line.
+        # The small margin absorbs float32 rounding of the edge lengths.
+        return lambda v: self.geoindex.distance(v, target) * (1 - 1e-6)
+
+    def time_heuristic(self, target):
+        # A* lower bound for routing by time: straight-line distance at
+        # the highest speed seen on any edge. 0-minute edges may cover
+        # some distance for free, so their total length is taken off.
+        speed, free = self.max_speed()
+        if speed == 0:
+            return lambda v: 0
+        return lambda v: max(0.0, self.geoindex.distance(v, target) - free) / speed * (1 - 1e-6)
+
+    def freeze(self, weights=("weight", "distance")):
+        # Read-only CSR copy with time ("weight") and km ("distance")
+        # arrays, for routing without the networkx dicts.
+        return super().freeze(weights)
+
+    def content_hash(self):
+        # SHA-256 of the stops, lines and times, identifying this
+        # version of the network (e.g. for cached tables).
+        if self._hash is None:
+            # the dictionaries may be views of a binary file (trambin.py)
+            data = json.dumps([dict(self.stopdict), dict(self.linedict), dict(self.timedict)],
+                              sort_keys=True, ensure_ascii=False)
+            self._hash = hashlib.sha256(data.encode("utf-8")).hexdigest()
+        return self._hash
+
+    def all_pairs(self, metric="weight"):
+        # All-pairs costs and predecessors for metric ("weight" for
+        # time, "distance" for km), computed once per network version.
+        return allpairs.load_or_build(self, metric, ALLPAIRS_DIR, self.content_hash())
 
     def lines_via_stop(self, stop):
         # List all line numbers (strings) that pass this stop, sorted numerically.
-        result = []
-        for line, stops in self.linedict.items():
-            if stop in stops:
-                result.append(line)
-        result.sort(key=int)
-        return result
+        return td.lines_via_stop(self.linedict, stop, self.lineindex)
+
+    def lines_between_stops(self, stop1, stop2):
+        # List all line numbers that pass both stops.
+        return td.lines_between_stops(self.linedict, stop1, stop2, self.lineindex)
 
     def stops_on_line(self, line):
         # Return list of stops on a given line.
@@ -69,34 +150,29 @@ class TramNetwork(WeightedGraph):
 
     def all_stops(self):
         # Return all stop names, sorted.
-        return sorted(self.stopdict.keys())
+        return sorted(self.stops)
 
     def all_lines(self):
         # Return all line numbers, sorted numerically.
         return sorted(self.linedict.keys(), key=int)
 
     def extreme_position(self):
-        # Return (min_lat, max_lat, min_lon, max_lon) over all stops.
-        lats = []
-        lons = []
-        for stop in self.stopdict:
-            lat, lon = self.position(stop)
-            lats.append(lat)
-            lons.append(lon)
+        # Return (min_lat, max_lat, min_lon, max_lon) over all stops
+        # that have a position.
+        lats = [stop.lat for stop in self.stops.values() if stop.lat == stop.lat]
+        lons = [stop.lon for stop in self.stops.values() if stop.lon == stop.lon]
         return min(lats), max(lats), min(lons), max(lons)
 
 
 
 def readTramNetwork(tramfile=TRAM_FILE):
-    # Read tram network JSON file and return a TramNetwork instance.
-    with open(tramfile, encoding='utf-8') as f:
-        tramdict = json.load(f)
-    return TramNetwork(tramdict)
+    # Read tram network file (binary copy if there is one) and return a TramNetwork instance.
+    return TramNetwork(td.load_tram_network(tramfile))
 
 def demo():
     G = readTramNetwork()
     a, b = input('from,to ').split(',')
-    view_shortest(G, a, b)
+    view_shortest(G, a, b, table=G.all_pairs("weight"), geo=True)
 
 
 def demo_fastest_time():
@@ -5,4 +5,4 @@ from .models import Route
 class RouteForm(forms.ModelForm):
     class Meta:
         model = Route
-        fields = ('dep', 'dest',)
+        fields = ('dep', 'dest', 'k', 'depart',)
@@ -0,0 +1,36 @@
+# python manage.py betweenness [--km] [--workers N] [--top N] [--svg FILE]
+#
+# Betweenness of every stop and segment of the tram network (see
+# utils/betweenness.py); prints the busiest and optionally colours the
+# tram map by stop load.
+
+from django.core.management.base import BaseCommand
+
+from tram.utils.trams import readTramNetwork
+from tram.utils.betweenness import betweenness, render_load
+
+
+class Command(BaseCommand):
+    help = "Rank stops and segments by shortest path betweenness"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--km", action="store_true",
+                            help="route by distance instead of time")
+        parser.add_argument("--workers", type=int, default=None)
+        parser.add_argument("--top", type=int, default=10)
+        parser.add_argument("--svg", default=None, help="write the coloured map here")
+
+    def handle(self, *args, **options):
+        network = readTramNetwork()
+        weight = "distance" if options["km"] else "weight"
+        stops, segments = betweenness(network, weight, workers=options["workers"])
+
+        top = options["top"]
+        self.stdout.write("stops:")
+        for stop, score in sorted(stops.items(), key=lambda x: -x[1])[:top]:
+            self.stdout.write(f"  {score:10.1f}  {stop}")
+        self.stdout.write("segments:")
+        for (a, b), score in sorted(segments.items(), key=lambda x: -x[1])[:top]:
+            self.stdout.write(f"  {score:10.1f}  {a} - {b}")
+        if options["svg"]:
+            self.stdout.write(render_load(stops, options["svg"]))
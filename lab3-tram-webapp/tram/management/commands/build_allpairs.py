@@ -0,0 +1,33 @@
+# python manage.py build_allpairs [--workers N]
+#
+# Offline job: compute the all-pairs time and distance tables of the
+# tram network and save them under its content hash, so that web
+# requests only load them.
+
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from tram.utils.trams import ALLPAIRS_DIR, readTramNetwork
+from tram.utils import allpairs
+
+
+class Command(BaseCommand):
+    help = "Build the all-pairs shortest path tables used for route queries"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=None,
+                            help="processes for per-source Dijkstra on large networks")
+
+    def handle(self, *args, **options):
+        network = readTramNetwork()
+        digest = network.content_hash()
+        for metric in ["weight", "distance"]:
+            start = time.perf_counter()
+            table = allpairs.build_all_pairs(network, metric, options["workers"])
+            path = allpairs.store(table, ALLPAIRS_DIR, metric, digest)
+            self.stdout.write(
+                f"{metric}: {len(table)} stops in {time.perf_counter() - start:.2f} s "
+                f"-> {os.path.basename(path)}"
+            )
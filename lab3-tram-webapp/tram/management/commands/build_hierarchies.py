@@ -0,0 +1,29 @@
+# python manage.py build_hierarchies
+#
+# Offline preprocessing: contract the tram network once per routing
+# metric and save the hierarchies, so that web requests only load them.
+
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from tram.utils.trams import HIERARCHY_FILES, readTramNetwork
+from tram.utils.hierarchy import build_hierarchy
+
+
+class Command(BaseCommand):
+    help = "Build the contraction hierarchies used for route queries"
+
+    def handle(self, *args, **options):
+        network = readTramNetwork()
+        for metric, path in HIERARCHY_FILES.items():
+            start = time.perf_counter()
+            hierarchy = build_hierarchy(network, metric, network.content_hash())
+            size = hierarchy.save(path)
+            shortcuts = sum(1 for m in hierarchy.mid.values() if m >= 0) // 2
+            self.stdout.write(
+                f"{metric}: {len(hierarchy)} stops, {shortcuts} shortcuts, "
+                f"{size} bytes in {time.perf_counter() - start:.2f} s "
+                f"-> {os.path.basename(path)}"
+            )
@@ -0,0 +1,21 @@
+# python manage.py build_snapshot [--out FILE]
+#
+# Write the built tram network as one file that every server worker
+# memory-maps instead of building its own (see utils/snapshot.py).
+# Run it again after changing the network file.
+
+from django.core.management.base import BaseCommand
+
+from tram.utils.trams import readTramNetwork, TRAM_SNAPSHOT_FILE
+from tram.utils.snapshot import write_snapshot
+
+
+class Command(BaseCommand):
+    help = "Write the shared network snapshot"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--out", default=TRAM_SNAPSHOT_FILE)
+
+    def handle(self, *args, **options):
+        size = write_snapshot(readTramNetwork(), options["out"])
+        self.stdout.write(f"{options['out']}: {size} bytes")
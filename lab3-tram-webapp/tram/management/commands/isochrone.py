@@ -0,0 +1,41 @@
+# python manage.py isochrone <stop> [<stop> ...] --minutes N [--km]
+#
+# Colour the tram map by how far every stop is from the given stops,
+# within a budget, and write the SVG to images/generated.
+
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from tram.utils.trams import readTramNetwork
+from tram.utils.isochrones import isochrones, reachable_stops, render_isochrone
+
+
+class Command(BaseCommand):
+    help = "Render the stops reachable from some origins within a budget"
+
+    def add_arguments(self, parser):
+        parser.add_argument("origins", nargs="+")
+        parser.add_argument("--minutes", type=float, default=10,
+                            help="budget (km with --km)")
+        parser.add_argument("--km", action="store_true",
+                            help="measure by distance instead of time")
+
+    def handle(self, *args, **options):
+        network = readTramNetwork()
+        origins = []
+        for raw in options["origins"]:
+            stop = network.resolve_stop_name(raw)
+            if stop is None:
+                raise CommandError(f"Unknown stop name: {raw}")
+            origins.append(stop)
+
+        budget = options["minutes"]
+        weight = "distance" if options["km"] else "weight"
+        matrix, frozen = isochrones(network, [(origins, budget)], weight)
+        outfile = os.path.join(settings.BASE_DIR,
+                               'tram/templates/tram/images/generated/isochrone.svg')
+        render_isochrone(frozen, matrix[0], budget, outfile)
+        self.stdout.write(f"{len(reachable_stops(frozen, matrix[0]))} stops within "
+                          f"{budget:g} {'km' if options['km'] else 'minutes'} -> {outfile}")
@@ -0,0 +1,37 @@
+# python manage.py resilience [--stops] [--km] [--workers N] [--top N] [--out FILE]
+#
+# Remove every segment (or stop) of the tram network in turn and write
+# a report ranking them by the harm done (see utils/resilience.py).
+
+import sys
+
+from django.core.management.base import BaseCommand
+
+from tram.utils.trams import readTramNetwork
+from tram.utils.resilience import resilience, write_report
+
+
+class Command(BaseCommand):
+    help = "Rank segments (or stops) by the impact of closing them"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--stops", action="store_true",
+                            help="remove stops instead of segments")
+        parser.add_argument("--km", action="store_true",
+                            help="measure by distance instead of time")
+        parser.add_argument("--workers", type=int, default=None)
+        parser.add_argument("--top", type=int, default=None,
+                            help="only report the most critical N")
+        parser.add_argument("--out", default=None, help="report file (default stdout)")
+
+    def handle(self, *args, **options):
+        network = readTramNetwork()
+        weight = "distance" if options["km"] else "weight"
+        impacts = resilience(network, options["stops"], weight, options["workers"])
+
+        unit = "km" if options["km"] else "minutes"
+        if options["out"]:
+            with open(options["out"], "w", encoding="utf-8") as f:
+                write_report(impacts, f, unit, options["top"])
+        else:
+            write_report(impacts, sys.stdout, unit, options["top"])
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:56
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tram', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='route',
+            name='k',
+            field=models.PositiveSmallIntegerField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(10)]),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tram', '0002_route_k'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='route',
+            name='depart',
+            field=models.TimeField(blank=True, null=True),
+        ),
+    ]
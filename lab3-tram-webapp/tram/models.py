@@ -1,8 +1,16 @@
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 
 class Route(models.Model):
     dep = models.CharField(max_length=200)
     dest = models.CharField(max_length=200)
+    # optional number of alternative routes to show
+    k = models.PositiveSmallIntegerField(
+        null=True, blank=True,
+        validators=[MinValueValidator(1), MaxValueValidator(10)],
+    )
+    # optional departure time (HH:MM) for a timetable route
+    depart = models.TimeField(null=True, blank=True)
 
     def __str__(self):
         return self.dep + '-' + self.dest
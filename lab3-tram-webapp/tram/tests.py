@@ -1,3 +1,492 @@
-from django.test import TestCase
+import json
+import os
+import random
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+
+from django.test import SimpleTestCase
+
+from .utils.trams import TRAM_FILE, TramNetwork, readTramNetwork
+from .utils.connections import Timetable, clock, journey_stops
+from .utils.graphs import shortest_path, dijkstra_tree
+from .utils.hierarchy import ContractionHierarchy, build_hierarchy, load_hierarchy
+from .utils.allpairs import AllPairs, build_all_pairs, cache_file, load_all_pairs, load_or_build, store
+from .utils.allpairs import _loaded as allpairs_cache
+from .utils.raptor import Raptor
+from .utils.tramviz import route_options, show_alternatives
+from .utils.isochrones import isochrones, reachable_stops, render_isochrone
+from .utils.resilience import resilience
+from .utils.betweenness import betweenness, render_load
+from .utils.snapshot import NetworkSnapshot, write_snapshot, shared_network
+from .utils.trambin import StopEntries, TramBinary, write_tram_binary
+
+
+class StopTableTests(SimpleTestCase):
+
+    def test_stop_records(self):
+        # Stops are slotted records with the positions parsed once;
+        # position() and extreme_positions() read them.
+        network = readTramNetwork()
+        self.assertEqual(list(network.stops), list(network.stopdict))
+        for i, (name, info) in enumerate(network.stopdict.items()):
+            stop = network.stops[name]
+            self.assertEqual((stop.id, stop.name, stop.town), (i, name, info["town"]))
+            lat, lon = info["position"]
+            self.assertEqual(network.position(name), (float(lat), float(lon)))
+        self.assertFalse(hasattr(stop, "__dict__"))
+        self.assertIs(network.get_vertex_value(name), stop)
+
+        lats = [float(info["position"][0]) for info in network.stopdict.values()]
+        lons = [float(info["position"][1]) for info in network.stopdict.values()]
+        self.assertEqual(network.extreme_positions(), (min(lons), min(lats), max(lons), max(lats)))
+        self.assertEqual(network.resolve_stop_name("chalmers"), "Chalmers")
+
+    def test_stop_dicts_not_kept(self):
+        # A network read from JSON packs the stop dicts into arrays; the
+        # records are the only per-stop objects, and the entries, the
+        # hash and the snapshot come out as from the dicts.
+        with open(TRAM_FILE, encoding="utf-8") as f:
+            tramdict = json.load(f)
+        network = TramNetwork(tramdict)
+        self.assertIsInstance(network.stopdict, StopEntries)
+        self.assertIs(network.tramdict["stops"], network.stopdict)
+        self.assertEqual(dict(network.stopdict), tramdict["stops"])
+        self.assertEqual(network.content_hash(), readTramNetwork().content_hash())
+        for a, b in network.edges():
+            a, b = sorted([a, b])
+            self.assertEqual(network.transition_time(a, b), tramdict["times"][a][b])
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "tramnetwork.snap")
+            write_snapshot(network, path)
+            snapshot = NetworkSnapshot(path)
+            self.assertEqual(dict(snapshot.stopdict), tramdict["stops"])
+            del snapshot
+
+
+class DistanceTests(SimpleTestCase):
+
+    def test_no_matrix_above_limit(self):
+        # Large networks compute distances one at a time; edge lengths
+        # never need the matrix.
+        with mock.patch("tram.utils.trams.DISTANCE_MATRIX_LIMIT", 10):
+            network = readTramNetwork()
+            self.assertIsNone(network.coords.matrix)
+            a, b = list(network.edges())[0]
+            km = network.geo_distance(a, b)
+            self.assertIsNone(network.coords.matrix)
+        self.assertAlmostEqual(km, network[a][b]["distance"])
+        small = readTramNetwork()
+        self.assertAlmostEqual(small.geo_distance(a, b), km, places=5)
+        self.assertIsNotNone(small.coords.matrix)
+
+
+class TimetableTests(SimpleTestCase):
+
+    def setUp(self):
+        self.network = readTramNetwork()
+        self.timetable = self.network.timetable()
+
+    def test_earliest_arrival_on_one_line(self):
+        # line 6 from Chalmers to Järntorget takes 10 minutes;
+        # a long change time keeps the journey on one trip
+        legs = self.timetable.earliest_arrival("Chalmers", "Järntorget", 10 * 60 + 30,
+                                               changetime=60)
+        self.assertEqual(len(legs), 1)
+        self.assertEqual(legs[-1].arr_time - legs[0].dep_time, 10)
+        self.assertEqual(journey_stops(legs)[0], "Chalmers")
+        self.assertEqual(journey_stops(legs)[-1], "Järntorget")
+
+    def test_change_between_trips(self):
+        # A-B on line 1, B-C on line 2; changing costs changetime
+        runs = [("1", ["A", "B"], [0, 5]), ("2", ["B", "C"], [0, 5])]
+        timetable = Timetable(runs, 0, 60, 10)
+        legs = timetable.earliest_arrival("A", "C", 0)
+        self.assertEqual([leg.line for leg in legs], ["1", "2"])
+        self.assertEqual(clock(legs[-1].arr_time), "00:15")
+        legs = timetable.earliest_arrival("A", "C", 0, changetime=6)
+        self.assertEqual(legs[-1].arr_time, 25)
+
+    def test_profile_and_arrive_by(self):
+        runs = [("1", ["A", "B"], [0, 5]), ("2", ["B", "C"], [0, 5])]
+        timetable = Timetable(runs, 0, 60, 10)
+        self.assertEqual(timetable.profile("A", "C", 0, 20),
+                         [(0, 15), (10, 25), (20, 35)])
+        legs = timetable.arrive_by("A", "C", 30)
+        self.assertEqual(legs[0].dep_time, 10)
+        self.assertIsNone(timetable.arrive_by("A", "C", 10))
+
+
+class TimetableRouteTests(SimpleTestCase):
+
+    def test_route_form_with_depart(self):
+        response = self.client.post("/route/", {"dep": "Chalmers", "dest": "Järntorget",
+                                                "depart": "10:30"})
+        self.assertEqual(response.status_code, 200)
+        timepath = response.context["timepath"]
+        self.assertTrue(timepath.startswith("Quickest leaving 10:30: Chalmers"), timepath)
+        self.assertIn("Scheduled: line", timepath)
+
+        response = self.client.post("/route/", {"dep": "Chalmers", "dest": "Järntorget",
+                                                "depart": "25:99"})
+        self.assertIn("depart", response.context["form"].errors)
+
+
+class HierarchyTests(SimpleTestCase):
+
+    def setUp(self):
+        self.network = readTramNetwork()
+
+    def test_matches_dijkstra(self):
+        rng = random.Random(0)
+        stops = self.network.vertices()
+        for metric in ["weight", "distance"]:
+            hierarchy = build_hierarchy(self.network, metric)
+            for _ in range(200):
+                s, t = rng.choice(stops), rng.choice(stops)
+                path, cost = hierarchy.shortest_path(s, t)
+                expected = shortest_path(self.network, s, t, metric)[1]
+                self.assertAlmostEqual(cost, expected, places=6)
+                # shortcuts are unpacked into real edges
+                self.assertEqual((path[0], path[-1]), (s, t))
+                length = sum(self.network[a][b][metric] for a, b in zip(path, path[1:]))
+                self.assertAlmostEqual(length, cost, places=6)
+
+    def test_save_and_load(self):
+        hierarchy = build_hierarchy(self.network, "weight")
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "hierarchy.bin")
+            hierarchy.save(path)
+            loaded = ContractionHierarchy.load(path)
+        self.assertEqual(loaded.names, hierarchy.names)
+        self.assertEqual(loaded.shortest_path("Chalmers", "Järntorget"),
+                         hierarchy.shortest_path("Chalmers", "Järntorget"))
+        self.assertIsInstance(loaded.shortest_path("Chalmers", "Järntorget")[1], int)
+
+    def test_load_only_matching_files(self):
+        # Requests never build: a missing file or one for another network
+        # gives None, and routing falls back to searching the graph.
+        content_hash = self.network.content_hash()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "hierarchy.bin")
+            self.assertIsNone(load_hierarchy(self.network, path, content_hash))
+            build_hierarchy(self.network, "weight").save(path)
+            self.assertIsNone(load_hierarchy(self.network, path, content_hash))
+            build_hierarchy(self.network, "weight", content_hash).save(path)
+            os.utime(path, (0, 0))
+            self.assertEqual(os.listdir(directory), ["hierarchy.bin"])
+            loaded = load_hierarchy(self.network, path, content_hash)
+            self.assertIs(load_hierarchy(self.network, path, content_hash), loaded)
+            self.assertIsNone(load_hierarchy(self.network, path, "other"))
+            self.assertEqual(loaded.shortest_path("Chalmers", "Järntorget"),
+                             shortest_path(self.network, "Chalmers", "Järntorget", "weight"))
+            smaller = readTramNetwork()
+            smaller.remove_node("Chalmers")
+            self.assertIsNone(load_hierarchy(smaller, path, content_hash))
+            # a rewritten file replaces the loaded hierarchy
+            build_hierarchy(self.network, "weight", content_hash).save(path)
+            self.assertIsNot(load_hierarchy(self.network, path, content_hash), loaded)
+
+    def test_concurrent_queries(self):
+        # queries keep no state on the shared hierarchy
+        hierarchy = build_hierarchy(self.network, "weight")
+        pairs = [("Chalmers", "Järntorget"), ("Opaltorget", "Angered Centrum")] * 50
+        expected = [hierarchy.shortest_path(s, t) for s, t in pairs]
+        with ThreadPoolExecutor(4) as pool:
+            self.assertEqual(list(pool.map(lambda p: hierarchy.shortest_path(*p), pairs)), expected)
+
+
+class AllPairsTests(SimpleTestCase):
+
+    def test_matches_dijkstra_after_save(self):
+        network = readTramNetwork()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "table.npz")
+            build_all_pairs(network, "weight").save(path)
+            table = AllPairs.load(path)
+        for target in ["Järntorget", "Opaltorget", "Angered Centrum"]:
+            path, minutes = table.shortest_path("Chalmers", target)
+            self.assertEqual(minutes, shortest_path(network, "Chalmers", target)[1])
+            self.assertIsInstance(minutes, int)
+            self.assertEqual((path[0], path[-1]), ("Chalmers", target))
+
+    def test_stored_only_by_build(self):
+        # Requests only load tables; store() swaps the new table in and
+        # then removes the one of the older network version.
+        network = readTramNetwork()
+        digest = network.content_hash()
+        with tempfile.TemporaryDirectory() as directory:
+            with mock.patch("tram.utils.trams.ALLPAIRS_DIR", directory):
+                self.assertIsNone(network.all_pairs("weight"))
+                store(build_all_pairs(network, "weight"), directory, "weight", "old")
+                old = load_all_pairs(directory, "weight", "old")
+                store(build_all_pairs(network, "weight"), directory, "weight", digest)
+                current = cache_file(directory, "weight", digest)
+                self.assertEqual(os.listdir(directory), [os.path.basename(current)])
+                self.assertIsNone(load_all_pairs(directory, "weight", "old"))
+                table = network.all_pairs("weight")
+                self.assertIsNot(table, old)
+                self.assertEqual(allpairs_cache[(directory, "weight")], (current, table))
+        self.assertEqual(table.cost.dtype, np.int16)
+        self.assertEqual(table.distance("Chalmers", "Järntorget"),
+                         shortest_path(network, "Chalmers", "Järntorget")[1])
+        distances = build_all_pairs(network, "distance")
+        self.assertEqual(distances.compact_cost().dtype, np.float32)
+
+
+class RaptorTests(SimpleTestCase):
+
+    def test_pareto_time_and_transfers(self):
+        # line 1 goes A-B-D-C; changing at B to line 2 is faster
+        # if the change time is short enough
+        raptor = Raptor({"1": ["A", "B", "D", "C"], "2": ["B", "C"]},
+                        {"A": {"B": 5}, "B": {"D": 10, "C": 4}, "C": {"D": 10}})
+        journeys = raptor.journeys("A", "C", change=3)
+        self.assertEqual([(j.cost, j.transfers) for j in journeys], [(25, 0), (12, 1)])
+        self.assertEqual([ride.line for ride in journeys[1].rides], ["1", "2"])
+        self.assertEqual(journeys[1].rides[1].stops, ["B", "C"])
+        # a long change is never worth it
+        journeys = raptor.journeys("A", "C", change=30)
+        self.assertEqual([(j.cost, j.transfers) for j in journeys], [(25, 0)])
+
+    def test_matches_dijkstra_without_change_cost(self):
+        network = readTramNetwork()
+        raptor = network.raptor()
+        for metric, weight in [("time", "weight"), ("distance", "distance")]:
+            pareto = raptor.pareto("Chalmers", metric, change=0)
+            for target in ["Järntorget", "Opaltorget", "Angered Centrum"]:
+                best = min(cost for cost, _ in pareto[target])
+                expected = shortest_path(network, "Chalmers", target, weight)[1]
+                self.assertAlmostEqual(best, expected, places=6)
+
+    @mock.patch.dict("tram.utils.tramviz._options", clear=True)
+    def test_route_options_searched_once(self):
+        # Repeated requests for a pair reuse its journeys.
+        network = readTramNetwork()
+        with mock.patch.object(Raptor, "journeys", autospec=True,
+                               side_effect=Raptor.journeys) as journeys:
+            first = route_options(network, "Chalmers", "Järntorget")
+            self.assertIs(route_options(network, "Chalmers", "Järntorget"), first)
+        self.assertEqual(journeys.call_count, 2)
+        self.assertEqual(first[0], network.raptor().journeys("Chalmers", "Järntorget"))
+
+
+class AlternativesTests(SimpleTestCase):
+
+    def test_show_alternatives(self):
+        alternatives = show_alternatives("Chalmers", "Angered Centrum", 5)
+        self.assertEqual(len(alternatives), 5)
+        minutes = [int(text.rsplit(", ", 1)[1].split()[0]) for text in alternatives]
+        self.assertEqual(minutes, sorted(minutes))
+        self.assertEqual(show_alternatives("Chalmers", "Nowhere at all", 5), [])
+
+    def test_route_form_with_k(self):
+        response = self.client.post("/route/", {"dep": "Chalmers", "dest": "Valand", "k": "3"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["alternatives"]), 3)
+
+
+class IsochroneTests(SimpleTestCase):
+
+    def test_budget_and_pool(self):
+        network = readTramNetwork()
+        queries = [(["Chalmers"], 5), (["Chalmers", "Angered Centrum"], 12), (["Nowhere"], 5)]
+        matrix, frozen = isochrones(network, queries)
+        self.assertEqual(matrix.shape, (3, len(network)))
+
+        reached = reachable_stops(frozen, matrix[0])
+        dist, _ = dijkstra_tree(network, "Chalmers", weight="weight")
+        self.assertEqual(reached, {v: d for v, d in dist.items() if d <= 5})
+        self.assertEqual(reachable_stops(frozen, matrix[2]), {})
+
+        pooled, _ = isochrones(network, queries * 2, workers=2)
+        self.assertTrue((pooled[:3] == matrix).all())
+
+    def test_render(self):
+        network = readTramNetwork()
+        matrix, frozen = isochrones(network, [(["Chalmers"], 6)])
+        with tempfile.TemporaryDirectory() as directory:
+            outfile = render_isochrone(frozen, matrix[0], 6, os.path.join(directory, "iso.svg"))
+            with open(outfile, encoding="utf-8") as f:
+                svg = f.read()
+        self.assertIn('fill="darkgreen"', svg)
+        self.assertIn('fill="white"', svg)
+
+
+class ResilienceTests(SimpleTestCase):
+
+    def test_matches_removal(self):
+        # The ranked impacts agree with removing the segment and
+        # running Dijkstra from every stop.
+        network = readTramNetwork()
+        impacts = resilience(network, workers=1)
+        self.assertEqual(len(impacts), network.number_of_edges())
+        ranked = [(i.unreachable, i.mean_increase) for i in impacts]
+        self.assertEqual(ranked, sorted(ranked, reverse=True))
+
+        for impact in [impacts[0], impacts[len(impacts) // 2]]:
+            _, a, b = impact.what
+            closed = readTramNetwork()
+            closed.remove_edge(a, b)
+            lost = 0
+            extra = []
+            for s in closed.vertices():
+                before, _ = dijkstra_tree(network, s, weight="weight")
+                after, _ = dijkstra_tree(closed, s, weight="weight")
+                lost += len(before) - len(after)
+                extra.extend(after[t] - before[t] for t in after if t != s)
+            self.assertEqual(impact.unreachable, lost // 2)
+            self.assertAlmostEqual(impact.mean_increase, sum(extra) / len(extra))
+
+    def test_stop_matches_removal(self):
+        # The same for the most critical stop, from every other stop.
+        network = readTramNetwork()
+        impact = resilience(network, stops=True, workers=1)[0]
+        _, v = impact.what
+        closed = readTramNetwork()
+        closed.remove_node(v)
+        lost = 0
+        extra = []
+        for s in closed.vertices():
+            before, _ = dijkstra_tree(network, s, weight="weight")
+            after, _ = dijkstra_tree(closed, s, weight="weight")
+            lost += len(before) - 1 - len(after)
+            extra.extend(after[t] - before[t] for t in after if t != s)
+        self.assertEqual(impact.unreachable, lost // 2)
+        self.assertAlmostEqual(impact.mean_increase, sum(extra) / len(extra))
+
+    def test_stops_in_pool(self):
+        network = readTramNetwork()
+        impacts = resilience(network, stops=True, workers=2)
+        self.assertEqual(len(impacts), len(network))
+        self.assertEqual(impacts, resilience(network, stops=True, workers=1))
+
+
+class BetweennessTests(SimpleTestCase):
+
+    def test_matches_networkx(self):
+        # by distance (no 0-cost segments, where tie handling differs)
+        import networkx as nx
+        network = readTramNetwork()
+        stops, segments = betweenness(network, "distance", workers=1)
+        expected = nx.betweenness_centrality(network, weight="distance", normalized=False)
+        for stop, score in expected.items():
+            self.assertAlmostEqual(stops[stop], score)
+        expected = nx.edge_betweenness_centrality(network, weight="distance", normalized=False)
+        self.assertEqual(len(segments), len(expected))
+        for (a, b), score in segments.items():
+            self.assertAlmostEqual(score, expected.get((a, b), expected.get((b, a))))
+
+    def test_pool_and_demand(self):
+        network = readTramNetwork()
+        serial = betweenness(network, workers=1)
+        pooled = betweenness(network, workers=2)
+        for one, other in zip(serial, pooled):
+            self.assertEqual(one.keys(), other.keys())
+            for key in one:
+                self.assertAlmostEqual(one[key], other[key])
+
+        # one demand pair loads just its (unique) shortest path
+        path, _ = shortest_path(network, "Chalmers", "Järntorget", "distance")
+        stops, segments = betweenness(network, "distance", {("Chalmers", "Järntorget"): 5}, workers=1)
+        self.assertEqual({s for s, x in stops.items() if x}, set(path[1:-1]))
+        self.assertTrue(all(stops[s] == 5 for s in path[1:-1]))
+        loaded = {frozenset(seg) for seg, x in segments.items() if x == 5}
+        self.assertEqual(loaded, {frozenset(seg) for seg in zip(path, path[1:])})
+        self.assertEqual(sum(segments.values()), 5 * (len(path) - 1))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            outfile = render_load(serial[0], os.path.join(tmp, "load.svg"))
+            self.assertTrue(os.path.getsize(outfile) > 0)
+
+
+class SnapshotTests(SimpleTestCase):
+
+    def setUp(self):
+        self.network = readTramNetwork()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "tramnetwork.snap")
+        write_snapshot(self.network, self.path)
+        self.snapshot = NetworkSnapshot(self.path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_same_queries(self):
+        network, snapshot = self.network, self.snapshot
+        self.assertEqual(sorted(snapshot.vertices()), sorted(network.vertices()))
+        self.assertEqual(snapshot.number_of_edges(), network.number_of_edges())
+        for a, b in network.edges():
+            self.assertEqual(snapshot.transition_time(a, b), network.transition_time(a, b))
+            self.assertAlmostEqual(snapshot.geo_distance(a, b), network.geo_distance(a, b))
+            self.assertEqual(snapshot.lines_between_stops(a, b), network.lines_between_stops(a, b))
+        for stop in network.vertices():
+            self.assertEqual(snapshot.lines_via_stop(stop), network.lines_via_stop(stop))
+        for raw in ["chalmers", "Chalm", "torget", "ko", "nowhere", "Brunnsparken"]:
+            self.assertEqual(snapshot.resolve_stop_name(raw), network.resolve_stop_name(raw))
+        self.assertEqual(snapshot.all_stops(), network.all_stops())
+        self.assertEqual(snapshot.all_lines(), network.all_lines())
+        self.assertEqual(snapshot.stops_on_line("6"), network.stops_on_line("6"))
+        self.assertEqual(snapshot.extreme_positions(), network.extreme_positions())
+        self.assertEqual(snapshot.position("Chalmers"), network.position("Chalmers"))
+        self.assertEqual(repr(snapshot.stops["Chalmers"]), repr(network.stops["Chalmers"]))
+        self.assertEqual(snapshot.content_hash(), network.content_hash())
+        self.assertEqual(dict(snapshot.stopdict), network.stopdict)
+        # edge minutes are read from the mapped array, as Python ints
+        _, _, minutes = snapshot.views("weight")
+        self.assertIs(minutes.obj, snapshot.weights["weight"])
+        self.assertIsInstance(minutes[0], int)
+
+    def test_same_routes(self):
+        network, snapshot = self.network, self.snapshot
+        stops = network.vertices()
+        random.seed(24)
+        for _ in range(50):
+            a, b = random.sample(stops, 2)
+            for metric in ["weight", "distance"]:
+                stored = load_or_build(network, metric, self.tmp.name, network.content_hash())
+                # costs in km are stored as float32
+                self.assertAlmostEqual(snapshot.all_pairs(metric).distance(a, b),
+                                       stored.distance(a, b), places=5)
+                self.assertEqual(shortest_path(snapshot, a, b, metric)[1],
+                                 shortest_path(network, a, b, metric)[1])
+            self.assertEqual(snapshot.raptor().journeys(a, b), network.raptor().journeys(a, b))
+        # the routers only rebuild lines and times; stops stay in the file
+        self.assertIs(snapshot.tramdict["stops"], snapshot.stopdict)
+        self.assertEqual(snapshot.tramdict["lines"], network.linedict)
+        self.assertEqual(snapshot.tramdict["times"], network.timedict)
+        self.assertEqual(snapshot.k_shortest_paths("Chalmers", "Järntorget", 3),
+                         network.k_shortest_paths("Chalmers", "Järntorget", 3))
+
+    def test_binary_load_builds_no_dicts(self):
+        # readTramNetwork() on the binary copy reads it through views
+        # and never rebuilds the full dictionaries
+        path = os.path.join(self.tmp.name, "tramnetwork.bin")
+        write_tram_binary(self.network.tramdict, path)
+        with mock.patch("tram.utils.trams.TRAM_BIN_FILE", path), \
+                mock.patch.object(TramBinary, "to_tramdict", side_effect=AssertionError):
+            loaded = readTramNetwork()
+        self.assertIsInstance(loaded.stopdict, StopEntries)
+        self.assertEqual(loaded.content_hash(), self.network.content_hash())
+        self.assertEqual(sorted(loaded.edges()), sorted(self.network.edges()))
+        for a, b in self.network.edges():
+            self.assertEqual(loaded.transition_time(a, b), self.network.transition_time(a, b))
+        self.assertEqual(loaded.raptor().journeys("Chalmers", "Opaltorget"),
+                         self.network.raptor().journeys("Chalmers", "Opaltorget"))
+
+    def test_attached_once(self):
+        self.assertIs(shared_network(self.path), shared_network(self.path))
+        self.assertIsInstance(shared_network(self.path), NetworkSnapshot)
+
+    def test_fallback_read_once(self):
+        # without a snapshot the network file is read once per process,
+        # and the missing snapshot is logged once
+        missing = os.path.join(self.tmp.name, "missing.snap")
+        with self.assertLogs("tram.utils.snapshot", "WARNING") as logs:
+            network = shared_network(missing)
+            self.assertIs(shared_network(missing), network)
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn("missing", logs.output[0])
+        self.assertEqual(network.content_hash(), self.network.content_hash())
@@ -0,0 +1,178 @@
+# Betweenness and load of stops and segments (extra feature)
+#
+# Brandes' algorithm with Dijkstra, on the frozen CSR graph
+# (graphs.FrozenGraph): from every source, count the shortest paths
+# to each stop (sigma), then walk the stops back in order of distance
+# and pass each stop's dependency on to its predecessors,
+#   delta(v) += sigma(v) / sigma(w) * (demand(s, w) + delta(w))
+# for every shortest path edge v -> w. The edge share is the segment's
+# load. Without a demand matrix every ordered pair of stops counts 1
+# and the scores are halved, as networkx does for undirected graphs.
+# Sources are split over a process pool; partial sums are NumPy arrays.
+#
+# A segment costing 0 (a few 0-minute segments in the timetable) puts
+# both of its stops at the same distance; only the stop settled first
+# counts as a predecessor of the other, so paths are never counted
+# around the segment in both directions.
+
+import heapq
+import multiprocessing
+import os
+from itertools import count
+
+import numpy as np
+from django.conf import settings
+
+from .color_tram_svg import color_svg_network
+
+# sources per pool task
+SOURCE_CHUNK = 32
+
+# colours for render_load(), from least to most loaded quarter
+LOAD_COLORS = ["white", "yellow", "orange", "red"]
+
+
+def segment_index(frozen):
+    # For every CSR position, the index of its undirected segment, and
+    # the segments as (stop id, stop id) with the smaller id first.
+    indptr = frozen.indptr.tolist()
+    indices = frozen.indices.tolist()
+    index = np.empty(len(indices), dtype=np.int32)
+    segments = []
+    ids = {}
+    for v in range(len(frozen)):
+        for k in range(indptr[v], indptr[v + 1]):
+            key = (min(v, indices[k]), max(v, indices[k]))
+            if key not in ids:
+                ids[key] = len(segments)
+                segments.append(key)
+            index[k] = ids[key]
+    return index, segments
+
+
+def brandes(frozen, sources, weight="weight", demand=None, segment_of=None):
+    # Partial (stop, segment) scores from the given source ids, as
+    # float arrays; demand is an n x n array or None (all ones).
+    n = len(frozen)
+    indptr, indices, costs = frozen.views(weight)
+    if segment_of is None:
+        segment_of, segments = segment_index(frozen)
+    segment_of = segment_of.tolist()
+
+    stop_scores = np.zeros(n)
+    segment_scores = np.zeros(max(segment_of, default=-1) + 1)
+
+    for s in sources:
+        dist = {}
+        best = {s: 0}
+        sigma = [0] * n
+        sigma[s] = 1
+        # shortest path predecessors of w: (v, CSR position of v -> w)
+        preds = {s: []}
+        order = []
+        # ties pop in the order they were reached
+        tie = count()
+        heap = [(0, next(tie), s)]
+        while heap:
+            d, _, v = heapq.heappop(heap)
+            if v in dist:
+                continue
+            dist[v] = d
+            order.append(v)
+            for k in range(indptr[v], indptr[v + 1]):
+                w = indices[k]
+                nd = d + costs[k]
+                if w in dist:
+                    continue
+                if w not in best or nd < best[w]:
+                    best[w] = nd
+                    sigma[w] = sigma[v]
+                    preds[w] = [(v, k)]
+                    heapq.heappush(heap, (nd, next(tie), w))
+                elif nd == best[w]:
+                    sigma[w] += sigma[v]
+                    preds[w].append((v, k))
+
+        row = demand[s].tolist() if demand is not None else None
+        delta = [0.0] * n
+        for w in reversed(order):
+            pull = (row[w] if row is not None else 1.0) + delta[w]
+            if w == s:
+                continue
+            share = pull / sigma[w]
+            for v, k in preds[w]:
+                c = sigma[v] * share
+                delta[v] += c
+                segment_scores[segment_of[k]] += c
+            stop_scores[w] += delta[w]
+    return stop_scores, segment_scores
+
+
+# frozen network, weight, demand and segment index of a pool worker
+_worker = {}
+
+
+def _init_worker(frozen, weight, demand, segment_of):
+    _worker.update(frozen=frozen, weight=weight, demand=demand, segment_of=segment_of)
+
+
+def _run_chunk(sources):
+    return brandes(_worker["frozen"], sources, _worker["weight"],
+                   _worker["demand"], _worker["segment_of"])
+
+
+def betweenness(network, weight="weight", demand=None, workers=None):
+    # Scores of every stop and segment of network as
+    # ({stop: score}, {(stop1, stop2): score}).
+    # demand: optional {(origin, destination): trips} or an n x n array
+    # in the order of network.freeze().names.
+    frozen = network.freeze()
+    n = len(frozen)
+    if isinstance(demand, dict):
+        matrix = np.zeros((n, n))
+        for (a, b), trips in demand.items():
+            matrix[frozen.ids[a], frozen.ids[b]] += trips
+        demand = matrix
+
+    segment_of, segments = segment_index(frozen)
+    chunks = [range(k, min(k + SOURCE_CHUNK, n)) for k in range(0, n, SOURCE_CHUNK)]
+    stop_scores = np.zeros(n)
+    segment_scores = np.zeros(len(segments))
+    if workers == 1:
+        parts = (brandes(frozen, chunk, weight, demand, segment_of) for chunk in chunks)
+        for stops, segs in parts:
+            stop_scores += stops
+            segment_scores += segs
+    else:
+        initargs = (frozen, weight, demand, segment_of)
+        with multiprocessing.Pool(workers, _init_worker, initargs) as pool:
+            for stops, segs in pool.imap_unordered(_run_chunk, chunks):
+                stop_scores += stops
+                segment_scores += segs
+
+    if demand is None:
+        stop_scores /= 2
+        segment_scores /= 2
+
+    names = frozen.names
+    return (
+        {names[v]: float(x) for v, x in enumerate(stop_scores)},
+        {(names[a], names[b]): float(x) for (a, b), x in zip(segments, segment_scores)},
+    )
+
+
+def render_load(stop_scores, outfile, infile=None):
+    # Colour the tram map by stop score quartiles (LOAD_COLORS).
+    if infile is None:
+        infile = os.path.join(settings.BASE_DIR, 'tram/templates/tram/images/gbg_tramnet.svg')
+    values = np.array(list(stop_scores.values()))
+    limits = np.quantile(values, [0.25, 0.5, 0.75]) if len(values) else []
+
+    def colors(stop):
+        if stop not in stop_scores:
+            return "white"
+        return LOAD_COLORS[int(np.searchsorted(limits, stop_scores[stop], side="left"))]
+
+    os.makedirs(os.path.dirname(outfile), exist_ok=True)
+    color_svg_network(infile, outfile, colormap=colors)
+    return outfile
@@ -0,0 +1,218 @@
+# Timetable routing with the Connection Scan Algorithm (extra feature)
+#
+# Every trip is cut into connections (one per segment ridden), and all
+# connections are kept in one array sorted by departure time. A query
+# scans that array once, so no time-expanded graph is needed.
+# Times are minutes after midnight.
+
+import math
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+
+INF = math.inf
+
+# one ride on a single trip
+Leg = namedtuple("Leg", "line stops dep_time arr_time")
+
+
+def clock(minutes):
+    # Format minutes after midnight as HH:MM.
+    minutes = int(minutes)
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def parse_clock(text):
+    # Parse HH:MM into minutes after midnight.
+    hour, minute = map(int, text.strip().split(":"))
+    return hour * 60 + minute
+
+
+def line_runs(linedict, timedict):
+    # One run per line and direction: (line, stops, offsets), where
+    # offsets are minutes from the first stop, summed from timedict.
+    runs = []
+    for line, stops in linedict.items():
+        offsets = [0]
+        for s1, s2 in zip(stops, stops[1:]):
+            a, b = sorted([s1, s2])
+            offsets.append(offsets[-1] + timedict[a][b])
+        runs.append((line, stops, offsets))
+
+        total = offsets[-1]
+        runs.append((line, stops[::-1], [total - t for t in offsets[::-1]]))
+    return runs
+
+
+class Timetable:
+
+    def __init__(self, runs, first, last=None, headway=None):
+        # runs: (line, stops, offsets) as from line_runs().
+        # Every run starts at first and, with a headway, again every
+        # headway minutes up to and including last.
+        if headway is None or last is None:
+            starts = [first]
+        else:
+            starts = list(range(first, last + 1, headway))
+
+        self.stops = []
+        self.ids = {}
+        self.trip_line = []
+        self.trip_stops = []
+
+        conns = []
+        for line, stops, offsets in runs:
+            for s in stops:
+                if s not in self.ids:
+                    self.ids[s] = len(self.stops)
+                    self.stops.append(s)
+            for start in starts:
+                trip = len(self.trip_line)
+                self.trip_line.append(line)
+                self.trip_stops.append(stops)
+                for k in range(len(stops) - 1):
+                    conns.append((start + offsets[k], start + offsets[k + 1],
+                                  self.ids[stops[k]], self.ids[stops[k + 1]], trip, k))
+
+        # sorted by departure, then arrival; the sort is stable, so
+        # zero-minute segments of a trip keep their order
+        conns.sort(key=lambda c: (c[0], c[1]))
+
+        # parallel arrays, one entry per connection
+        self.dep_time = [c[0] for c in conns]
+        self.arr_time = [c[1] for c in conns]
+        self.dep_stop = [c[2] for c in conns]
+        self.arr_stop = [c[3] for c in conns]
+        self.trip = [c[4] for c in conns]
+        self.seq = [c[5] for c in conns]
+
+    def __len__(self):
+        return len(self.dep_time)
+
+    def earliest_arrival(self, source, target, depart, changetime=0):
+        # Leave source at depart or later and reach target as early as
+        # possible. Returns the list of legs, or None if target cannot
+        # be reached. Changing trips takes changetime minutes.
+        src = self.ids[source]
+        tgt = self.ids[target]
+        if src == tgt:
+            return []
+
+        n = len(self.stops)
+        arrival = [INF] * n
+        ready = [INF] * n
+        in_conn = [-1] * n
+        boarded = [-1] * len(self.trip_line)
+        arrival[src] = depart
+        ready[src] = depart
+
+        dep_time = self.dep_time
+        arr_time = self.arr_time
+        dep_stop = self.dep_stop
+        arr_stop = self.arr_stop
+        trips = self.trip
+
+        for c in range(bisect_left(dep_time, depart), len(dep_time)):
+            if arrival[tgt] <= dep_time[c]:
+                break
+            trip = trips[c]
+            if boarded[trip] == -1:
+                if ready[dep_stop[c]] > dep_time[c]:
+                    continue
+                boarded[trip] = c
+            a = arr_stop[c]
+            if arr_time[c] < arrival[a]:
+                arrival[a] = arr_time[c]
+                ready[a] = arr_time[c] + changetime
+                in_conn[a] = c
+
+        if in_conn[tgt] == -1:
+            return None
+
+        legs = []
+        stop = tgt
+        while stop != src:
+            c = in_conn[stop]
+            b = boarded[trips[c]]
+            stops = self.trip_stops[trips[c]][self.seq[b]:self.seq[c] + 2]
+            legs.append(Leg(self.trip_line[trips[c]], stops, dep_time[b], arr_time[c]))
+            stop = dep_stop[b]
+        legs.reverse()
+        return legs
+
+    def profile(self, source, target, start, end, changetime=0, until=None):
+        # All Pareto-optimal (departure, arrival) pairs from source to
+        # target for departures between start and end, ascending.
+        # Connections arriving after until are ignored.
+        src = self.ids[source]
+        tgt = self.ids[target]
+        n = len(self.stops)
+
+        # per stop, pairs with decreasing departure and arrival:
+        # negdeps holds -departure (ascending, for bisect)
+        negdeps = [[] for _ in range(n)]
+        arrivals = [[] for _ in range(n)]
+        trip_best = [INF] * len(self.trip_line)
+
+        dep_time = self.dep_time
+        arr_time = self.arr_time
+        dep_stop = self.dep_stop
+        arr_stop = self.arr_stop
+        trips = self.trip
+
+        lo = bisect_left(dep_time, start)
+        for c in range(len(dep_time) - 1, lo - 1, -1):
+            if until is not None and arr_time[c] > until:
+                continue
+            trip = trips[c]
+
+            # arrive with this connection, stay in the trip, or change
+            best = arr_time[c] if arr_stop[c] == tgt else INF
+            best = min(best, trip_best[trip])
+            x = arr_stop[c]
+            k = bisect_right(negdeps[x], -(arr_time[c] + changetime)) - 1
+            if k >= 0:
+                best = min(best, arrivals[x][k])
+
+            trip_best[trip] = best
+            if best == INF:
+                continue
+
+            y = dep_stop[c]
+            if not arrivals[y] or best < arrivals[y][-1]:
+                if negdeps[y] and negdeps[y][-1] == -dep_time[c]:
+                    arrivals[y][-1] = best
+                else:
+                    negdeps[y].append(-dep_time[c])
+                    arrivals[y].append(best)
+
+        pairs = [(-d, a) for d, a in zip(negdeps[src], arrivals[src]) if -d <= end]
+        pairs.reverse()
+        return pairs
+
+    def arrive_by(self, source, target, deadline, changetime=0, start=0):
+        # Leave source as late as possible and still reach target by
+        # deadline. Returns the list of legs, or None.
+        if source == target:
+            return []
+        pairs = self.profile(source, target, start, deadline, changetime, until=deadline)
+        if not pairs:
+            return None
+        depart = pairs[-1][0]
+        return self.earliest_arrival(source, target, depart, changetime)
+
+
+def journey_stops(legs):
+    # The stops passed on a journey, in order.
+    stops = []
+    for leg in legs:
+        stops.extend(leg.stops if not stops else leg.stops[1:])
+    return stops
+
+
+def journey_text(legs):
+    # One line description of a journey for the web page.
+    parts = [
+        f"line {leg.line} {leg.stops[0]} {clock(leg.dep_time)} - {leg.stops[-1]} {clock(leg.arr_time)}"
+        for leg in legs
+    ]
+    return ", then ".join(parts)
@@ -0,0 +1,160 @@
+# Vectorized geographic distances between tram stops (extra feature)
+
+import math
+
+import numpy as np
+
+EARTH_RADIUS = 6371.0  # km
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    # Haversine distance in km between points given in degrees.
+    # Works elementwise on floats or numpy arrays (with broadcasting).
+    phi1 = np.radians(lat1)
+    phi2 = np.radians(lat2)
+    dphi = np.radians(lat2 - lat1)
+    dlambda = np.radians(lon2 - lon1)
+
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2) ** 2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    return EARTH_RADIUS * c
+
+
+def scalar_haversine(lat1, lon1, lat2, lon2):
+    # Same formula with math on plain floats, which is faster than
+    # numpy for a single pair.
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = math.radians(lat2 - lat1)
+    dlambda = math.radians(lon2 - lon1)
+
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    return EARTH_RADIUS * c
+
+
+def condensed_index(i, j, n):
+    # Position of the pair (i, j), i != j, in a condensed matrix of n points.
+    if i > j:
+        i, j = j, i
+    return n * i - i * (i + 1) // 2 + (j - i - 1)
+
+
+class Stop:
+    # One stop of the network, parsed once: integer id (order in the
+    # network file), name, town and position in degrees, NaN when the
+    # position is missing. Slots leave out the per-record dict.
+    __slots__ = ("id", "name", "town", "lat", "lon")
+
+    def __init__(self, id, name, town, lat, lon):
+        self.id = id
+        self.name = name
+        self.town = town
+        self.lat = lat
+        self.lon = lon
+
+    def __repr__(self):
+        return f"Stop({self.id}, {self.name!r}, {self.town!r}, {self.lat}, {self.lon})"
+
+
+def stop_table(stopdict):
+    # {name: Stop} for every stop of stopdict, in the same order.
+    # A StopEntries view (trambin.py) is read from its arrays, without
+    # building the entries.
+    binary = getattr(stopdict, "binary", None)
+    if binary is not None:
+        towns = binary.towns()
+        lat = binary.positions[:, 0].tolist()
+        lon = binary.positions[:, 1].tolist()
+        return {name: Stop(i, name, towns[i], lat[i], lon[i]) for i, name in enumerate(stopdict)}
+    stops = {}
+    for i, (name, info) in enumerate(stopdict.items()):
+        position = info.get("position")
+        if position is None or len(position) != 2:
+            lat = lon = math.nan
+        else:
+            lat, lon = float(position[0]), float(position[1])
+        stops[name] = Stop(i, name, info.get("town", ""), lat, lon)
+    return stops
+
+
+class StopCoordinates:
+    # Stop positions parsed once into float64 arrays of degrees.
+    # Stops with bad position data get NaN and are listed in self.bad.
+
+    def __init__(self, stopdict):
+        stops = stop_table(stopdict)
+        self.names = list(stops)
+        self.ids = {name: i for i, name in enumerate(self.names)}
+        self.bad = {name for name, stop in stops.items() if stop.lat != stop.lat}
+        self.lat = np.array([stop.lat for stop in stops.values()], dtype=float)
+        self.lon = np.array([stop.lon for stop in stops.values()], dtype=float)
+
+        # condensed pairwise distances, see build_matrix()
+        self.matrix = None
+
+    @classmethod
+    def from_arrays(cls, names, lat, lon, matrix=None):
+        # Coordinates already in float arrays (NaN for a bad position),
+        # e.g. views into a memory-mapped file; nothing is copied.
+        coords = cls({})
+        coords.names = list(names)
+        coords.ids = {name: i for i, name in enumerate(coords.names)}
+        coords.lat = lat
+        coords.lon = lon
+        coords.bad = {name for name, x in zip(coords.names, lat.tolist()) if x != x}
+        coords.matrix = matrix
+        return coords
+
+    @classmethod
+    def from_stops(cls, stops):
+        # Coordinates of a stop table (see stop_table()), not parsed again.
+        lat = np.array([stop.lat for stop in stops.values()], dtype=float)
+        lon = np.array([stop.lon for stop in stops.values()], dtype=float)
+        return cls.from_arrays(list(stops), lat, lon)
+
+    def __len__(self):
+        return len(self.names)
+
+    def _ids(self, stops):
+        # Array of stop ids; None means all stops.
+        if stops is None:
+            return np.arange(len(self.names))
+        return np.array([self.ids[s] for s in stops], dtype=np.intp)
+
+    def distance(self, stop1, stop2):
+        # Distance in km between two stops, as a float.
+        i = self.ids[stop1]
+        j = self.ids[stop2]
+        if i == j:
+            return 0.0
+        if self.matrix is not None:
+            return float(self.matrix[condensed_index(i, j, len(self.names))])
+        return scalar_haversine(float(self.lat[i]), float(self.lon[i]),
+                                float(self.lat[j]), float(self.lon[j]))
+
+    def distances_from(self, stop, stops=None):
+        # One-to-many: distances from stop to each of stops (default all).
+        i = self.ids[stop]
+        js = self._ids(stops)
+        return haversine(self.lat[i], self.lon[i], self.lat[js], self.lon[js])
+
+    def distance_matrix(self, stops1=None, stops2=None):
+        # Many-to-many: array of shape (len(stops1), len(stops2)).
+        i = self._ids(stops1)[:, None]
+        j = self._ids(stops2)[None, :]
+        return haversine(self.lat[i], self.lon[i], self.lat[j], self.lon[j])
+
+    def build_matrix(self, dtype=np.float32):
+        # Precompute the condensed pairwise matrix of all stops.
+        # It holds n*(n-1)/2 values; rows are filled one at a time
+        # so the temporary arrays stay O(n).
+        n = len(self.names)
+        matrix = np.empty(n * (n - 1) // 2, dtype=dtype)
+        start = 0
+        for i in range(n - 1):
+            row = haversine(self.lat[i], self.lon[i], self.lat[i + 1:], self.lon[i + 1:])
+            matrix[start:start + len(row)] = row
+            start += len(row)
+        self.matrix = matrix
+        return matrix
@@ -1,4 +1,14 @@
+import hashlib
+import heapq
+import html
+import math
+import re
+import weakref
+from itertools import count
+
 import networkx as nx
+import numpy as np
+import graphviz
 from graphviz import Graph as GVGraph
 
 class Graph(nx.Graph):
@@ -45,6 +55,36 @@ class Graph(nx.Graph):
             self.add_node(v)
         self.nodes[v]["value"] = x
 
+    def weighted_adjacency(self, cost=None, weight=None):
+        # Return a function v -> iterable of (neighbor, edge cost) that
+        # reads the adjacency dicts in place (no copy of the graph).
+        # weight names an edge attribute; otherwise cost(u, v) is called
+        # per edge, and edges costing None are left out. Edges without
+        # the weight attribute fall back to cost(u, v) the same way.
+        adj = self._adj
+        if weight is not None:
+            def weighted(v):
+                for w, d in adj[v].items():
+                    c = d.get(weight)
+                    if c is None and cost is not None:
+                        c = cost(v, w)
+                    if c is not None:
+                        yield w, c
+            return weighted
+        if cost is None:
+            return lambda v: ((w, 1) for w in adj[v])
+
+        def costed(v):
+            for w in adj[v]:
+                c = cost(v, w)
+                if c is not None:
+                    yield w, c
+        return costed
+
+    def freeze(self, weights=("weight",)):
+        # Read-only compressed sparse row copy, see FrozenGraph.
+        return FrozenGraph.from_graph(self, weights)
+
 
 class WeightedGraph(Graph):
     # Graph where edges have a 'weight' attribute.
@@ -60,6 +100,237 @@ class WeightedGraph(Graph):
             return None
         return self[a][b].get("weight", None)
 
+    def k_shortest_paths(self, source, target, k, metric="weight"):
+        # Up to k loopless paths, cheapest first, see k_shortest_paths().
+        return k_shortest_paths(self, source, target, k, metric)
+
+
+class FrozenGraph:
+    # Read-only graph in compressed sparse row (CSR) form.
+    # Vertices are numbered 0..n-1 (names[i] <-> ids[name]); the
+    # neighbours of vertex i are indices[indptr[i]:indptr[i + 1]], and
+    # every edge attribute in weights is an array parallel to indices:
+    # integers if every edge has a whole number for it, else floats
+    # (NaN where an edge lacks it). Each undirected edge is stored
+    # once in each direction.
+    # It has the vertices()/edges()/weighted_adjacency() interface the
+    # routing functions below use, with flat arrays instead of
+    # dict-of-dicts, so it is small and cheap to scan.
+
+    def __init__(self, names, indptr, indices, weights):
+        self.names = list(names)
+        self.ids = {name: i for i, name in enumerate(self.names)}
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+
+    @classmethod
+    def from_graph(cls, graph, weights=("weight",)):
+        # Freeze graph; edges lacking an attribute get NaN for it.
+        names = list(graph.nodes())
+        ids = {name: i for i, name in enumerate(names)}
+        adj = graph._adj
+
+        indptr = np.zeros(len(names) + 1, dtype=np.int32)
+        for i, v in enumerate(names):
+            indptr[i + 1] = indptr[i] + len(adj[v])
+        indices = np.empty(indptr[-1], dtype=np.int32)
+        arrays = {attr: np.full(indptr[-1], np.nan) for attr in weights}
+
+        k = 0
+        for v in names:
+            for w, data in adj[v].items():
+                indices[k] = ids[w]
+                for attr in weights:
+                    value = data.get(attr)
+                    if value is not None:
+                        arrays[attr][k] = value
+                k += 1
+        for attr, values in arrays.items():
+            if np.isfinite(values).all() and np.array_equal(values, np.round(values)):
+                arrays[attr] = values.astype(np.int64)
+        return cls(names, indptr, indices, arrays)
+
+    def __len__(self):
+        return len(self.names)
+
+    def vertices(self):
+        return list(self.names)
+
+    def number_of_edges(self):
+        return len(self.indices) // 2
+
+    def _slice(self, v):
+        i = self.ids[v]
+        return int(self.indptr[i]), int(self.indptr[i + 1])
+
+    def neighbors(self, v):
+        start, end = self._slice(v)
+        return [self.names[j] for j in self.indices[start:end].tolist()]
+
+    def edge_id(self, a, b):
+        # Position of edge a -> b in indices and the weight arrays,
+        # or None if there is no such edge.
+        start, end = self._slice(a)
+        hits = np.flatnonzero(self.indices[start:end] == self.ids[b])
+        return start + int(hits[0]) if len(hits) else None
+
+    def has_edge(self, a, b):
+        return a in self.ids and b in self.ids and self.edge_id(a, b) is not None
+
+    def get_weight(self, a, b, weight="weight"):
+        # Returns None if there is no edge.
+        k = self.edge_id(a, b)
+        return None if k is None else self.weights[weight][k].item()
+
+    def __getitem__(self, v):
+        # networkx-style adjacency of v: {neighbour: {attribute: value}},
+        # built on request, so graph[a][b][weight] works as on a Graph.
+        start, end = self._slice(v)
+        values = {attr: array[start:end].tolist() for attr, array in self.weights.items()}
+        return {self.names[j]: {attr: values[attr][k] for attr in values}
+                for k, j in enumerate(self.indices[start:end].tolist())}
+
+    def edges(self):
+        # Every edge once, as (a, b) with id of a < id of b.
+        result = []
+        indptr = self.indptr.tolist()
+        indices = self.indices.tolist()
+        for i, name in enumerate(self.names):
+            for j in indices[indptr[i]:indptr[i + 1]]:
+                if i < j:
+                    result.append((name, self.names[j]))
+        return result
+
+    def views(self, weight=None):
+        # memoryviews of indptr, indices and the weight array (None
+        # without weight). Indexing and slicing them gives plain Python
+        # ints and floats, much faster than element-wise numpy indexing,
+        # and nothing is copied, so a mapped snapshot stays shared.
+        values = memoryview(self.weights[weight]) if weight is not None else None
+        return memoryview(self.indptr), memoryview(self.indices), values
+
+    def id_adjacency(self, weight=None):
+        # Function vertex id -> iterable of (neighbour id, edge cost),
+        # for routing on ids; without weight every edge costs 1.
+        indptr, indices, values = self.views(weight)
+        if weight is None:
+            return lambda i: ((j, 1) for j in indices[indptr[i]:indptr[i + 1]])
+        return lambda i: zip(indices[indptr[i]:indptr[i + 1]], values[indptr[i]:indptr[i + 1]])
+
+    def by_id(self):
+        # View of this graph with vertex ids instead of names, for
+        # running the routing functions without name lookups.
+        return FrozenIds(self)
+
+    def shortest_path(self, source, target, metric="weight", stats=None):
+        # shortest_path() run on vertex ids; same result as on names.
+        if source not in self.ids or target not in self.ids:
+            return None, None
+        path, cost = shortest_path(self.by_id(), self.ids[source], self.ids[target],
+                                   metric, stats)
+        if path is None:
+            return None, None
+        return [self.names[i] for i in path], cost
+
+    def weighted_adjacency(self, cost=None, weight=None):
+        # As Graph.weighted_adjacency(), on vertex names.
+        names = self.names
+        ids = self.ids
+        indptr, indices, _ = self.views()
+
+        def neighbors(v):
+            i = ids[v]
+            return [names[j] for j in indices[indptr[i]:indptr[i + 1]]]
+
+        if weight is not None and weight in self.weights:
+            values = self.views(weight)[2]
+            if not np.isnan(self.weights[weight]).any():
+                def weighted(v):
+                    i = ids[v]
+                    start, end = indptr[i], indptr[i + 1]
+                    return zip([names[j] for j in indices[start:end]], values[start:end])
+                return weighted
+
+            # some edges lack the attribute (NaN): as on a Graph, they
+            # fall back to cost(u, v), or are left out without it
+            def patched(v):
+                i = ids[v]
+                for k in range(indptr[i], indptr[i + 1]):
+                    w, c = names[indices[k]], values[k]
+                    if c != c:
+                        c = cost(v, w) if cost is not None else None
+                    if c is not None:
+                        yield w, c
+            return patched
+        if cost is None:
+            if weight is not None:
+                # no edge has the attribute
+                return lambda v: iter(())
+            return lambda v: ((w, 1) for w in neighbors(v))
+
+        def costed(v):
+            for w in neighbors(v):
+                c = cost(v, w)
+                if c is not None:
+                    yield w, c
+        return costed
+
+
+class MaskedGraph:
+    # View of a graph with some vertices and edges left out, for
+    # routing around them without copying the graph. Edges are
+    # undirected: masking (a, b) also masks (b, a).
+
+    def __init__(self, graph, vertices=(), edges=()):
+        self.graph = graph
+        self.masked_vertices = set(vertices)
+        self.masked_edges = set()
+        for a, b in edges:
+            self.masked_edges.add((a, b))
+            self.masked_edges.add((b, a))
+
+    def __len__(self):
+        return len(self.graph) - len(self.masked_vertices)
+
+    def vertices(self):
+        return [v for v in self.graph.vertices() if v not in self.masked_vertices]
+
+    def weighted_adjacency(self, cost=None, weight=None):
+        adjacency = self.graph.weighted_adjacency(cost, weight)
+        vertices = self.masked_vertices
+        edges = self.masked_edges
+        if not edges:
+            return lambda v: ((w, c) for w, c in adjacency(v) if w not in vertices)
+        return lambda v: ((w, c) for w, c in adjacency(v)
+                          if w not in vertices and (v, w) not in edges)
+
+
+class FrozenIds:
+    # A FrozenGraph seen with vertex ids 0..n-1 (see FrozenGraph.by_id).
+
+    def __init__(self, frozen):
+        self.frozen = frozen
+
+    def __len__(self):
+        return len(self.frozen)
+
+    def vertices(self):
+        return list(range(len(self.frozen)))
+
+    def weighted_adjacency(self, cost=None, weight=None):
+        if cost is None:
+            return self.frozen.id_adjacency(weight)
+        names = self.frozen.names
+        adjacency = self.frozen.id_adjacency()
+
+        def costed(i):
+            for j, _ in adjacency(i):
+                c = cost(names[i], names[j])
+                if c is not None:
+                    yield j, c
+        return costed
+
 
 # ---- helper for dijkstra ----
 
@@ -69,26 +340,420 @@ def costs2attributes(G, cost, attr="weight"):
         G[a][b][attr] = cost(a, b)
 
 
-def dijkstra(graph, source, cost=lambda u, v: 1):
-    # Returns dict mapping target -> path .
+def dijkstra_tree(graph, source, cost=None, weight=None, target=None, stats=None):
+    # Heap-based Dijkstra on the graph as it is.
+    # Returns (dist, pred): dist maps every settled vertex to its cost
+    # from source, pred maps vertices to their predecessor on a
+    # shortest path (use path_to() to build one).
+    # With a target the search stops as soon as target is settled, and
+    # pred only keeps the settled vertices.
+    # If a stats dict is given, stats["settled"] counts settled vertices.
+    adjacency = graph.weighted_adjacency(cost, weight)
+    tie = count()
 
-    # Do not modify the original graph
-    G = nx.Graph()
-    G.add_nodes_from(graph.nodes(data=True))
-    G.add_edges_from(graph.edges())
-    
-    costs2attributes(G, cost, attr="weight")
+    dist = {}
+    best = {source: 0}
+    pred = {source: None}
+    heap = [(0, next(tie), source)]
+
+    while heap:
+        d, _, v = heapq.heappop(heap)
+        if v in dist:
+            continue
+        dist[v] = d
+        if v == target:
+            # the rest of pred is tentative: keep the settled tree only
+            pred = {w: pred[w] for w in dist}
+            break
+        for w, c in adjacency(v):
+            nd = d + c
+            if w not in dist and (w not in best or nd < best[w]):
+                best[w] = nd
+                pred[w] = v
+                heapq.heappush(heap, (nd, next(tie), w))
+
+    if stats is not None:
+        stats["settled"] = len(dist)
+    return dist, pred
+
+
+def path_to(pred, target):
+    # Walk a predecessor map back from target; None if not reached.
+    if target not in pred:
+        return None
+    path = []
+    while target is not None:
+        path.append(target)
+        target = pred[target]
+    path.reverse()
+    return path
+
+
+def shortest_path(graph, source, target, metric="weight", stats=None):
+    # Bidirectional Dijkstra for one source -> target pair.
+    # metric is an edge attribute name or a cost function cost(u, v).
+    # Returns (path, cost), or (None, None) if target is unreachable.
+    # If a stats dict is given, stats["settled"] counts settled vertices.
+    if callable(metric):
+        adjacency = graph.weighted_adjacency(cost=metric)
+    else:
+        adjacency = graph.weighted_adjacency(weight=metric)
+
+    if source == target:
+        if stats is not None:
+            stats["settled"] = 1
+        return [source], 0
+
+    # index 0: search from source, index 1: search back from target
+    tie = count()
+    dist = ({}, {})
+    best = ({source: 0}, {target: 0})
+    pred = ({source: None}, {target: None})
+    heaps = ([(0, next(tie), source)], [(0, next(tie), target)])
+
+    mu = float("inf")
+    meet = None
+
+    while heaps[0] and heaps[1]:
+        # no path through unsettled vertices can beat mu any more
+        if heaps[0][0][0] + heaps[1][0][0] >= mu:
+            break
+
+        side = 0 if heaps[0][0][0] <= heaps[1][0][0] else 1
+        d, _, v = heapq.heappop(heaps[side])
+        if v in dist[side]:
+            continue
+        dist[side][v] = d
+
+        other = best[1 - side]
+        for w, c in adjacency(v):
+            nd = d + c
+            if w not in dist[side] and (w not in best[side] or nd < best[side][w]):
+                best[side][w] = nd
+                pred[side][w] = v
+                heapq.heappush(heaps[side], (nd, next(tie), w))
+            if w in other and nd + other[w] < mu:
+                mu = nd + other[w]
+                meet = (v, w) if side == 0 else (w, v)
+
+    if stats is not None:
+        stats["settled"] = len(dist[0]) + len(dist[1])
 
-    # networkx shortest_path
-    paths = nx.shortest_path(G, source=source, weight="weight")
+    if meet is None:
+        return None, None
+
+    # source ... a on the forward tree, b ... target on the backward tree
+    a, b = meet
+    path = path_to(pred[0], a)
+    while b is not None:
+        path.append(b)
+        b = pred[1][b]
+    return path, mu
+
+
+def astar_path(graph, source, target, metric="weight", heuristic=None, stats=None):
+    # A* search for one source -> target pair, guided by heuristic(v),
+    # a lower bound on the cost from v to target (it must never
+    # overestimate, but need not be consistent: a vertex is expanded
+    # again when a cheaper way to it turns up).
+    # metric and the result are as in shortest_path().
+    if callable(metric):
+        adjacency = graph.weighted_adjacency(cost=metric)
+    else:
+        adjacency = graph.weighted_adjacency(weight=metric)
+    if heuristic is None:
+        heuristic = lambda v: 0
+
+    tie = count()
+    h = {source: heuristic(source)}
+    g = {source: 0}
+    pred = {source: None}
+    heap = [(h[source], next(tie), 0, source)]
+    expanded = 0
+    found = False
+
+    while heap:
+        _, _, d, v = heapq.heappop(heap)
+        if d > g[v]:
+            continue
+        expanded += 1
+        if v == target:
+            found = True
+            break
+        for w, c in adjacency(v):
+            nd = d + c
+            if w not in g or nd < g[w]:
+                g[w] = nd
+                pred[w] = v
+                if w not in h:
+                    h[w] = heuristic(w)
+                heapq.heappush(heap, (nd + h[w], next(tie), nd, w))
+
+    if stats is not None:
+        stats["settled"] = expanded
+    if not found:
+        return None, None
+    return path_to(pred, target), g[target]
+
+
+class DynamicShortestPaths:
+    # Shortest path trees for a set of sources, kept up to date while
+    # edges close, open or change weight (update_edge). As in
+    # Ramalingam-Reps, only the part of a tree that an update can
+    # affect is searched again:
+    # - a cheaper or new edge starts a Dijkstra from its end point,
+    #   which only visits vertices that get strictly cheaper;
+    # - a dearer or closed tree edge cuts off the subtree below it;
+    #   its vertices are reattached from the rest of the tree by a
+    #   Dijkstra limited to the subtree.
+    # Updates to edges outside a tree cannot make it worse and are
+    # skipped for that tree.
+
+    def __init__(self, graph, sources=(), weight="weight"):
+        self.graph = graph
+        self.weight = weight
+        # source -> (dist, pred, children)
+        self.trees = {}
+        for source in sources:
+            self.add_source(source)
+
+    def add_source(self, source):
+        dist, pred = dijkstra_tree(self.graph, source, weight=self.weight)
+        pred = {v: pred[v] for v in dist}
+        children = {}
+        for v, p in pred.items():
+            if p is not None:
+                children.setdefault(p, set()).add(v)
+        self.trees[source] = (dist, pred, children)
+
+    def remove_source(self, source):
+        del self.trees[source]
+
+    def distance(self, source, target):
+        # Cost from source to target, or None if unreachable.
+        return self.trees[source][0].get(target)
+
+    def path(self, source, target):
+        # Shortest path from source to target, or None if unreachable.
+        return path_to(self.trees[source][1], target)
+
+    def update_edge(self, a, b, w):
+        # Set the weight of edge (a, b) to w, adding the edge if needed;
+        # w = None closes (removes) it. The graph is changed too.
+        # Returns {source: sorted targets whose path or cost changed}.
+        old = self.graph[a][b].get(self.weight) if self.graph.has_edge(a, b) else None
+        if w is None:
+            if old is not None:
+                self.graph.remove_edge(a, b)
+        else:
+            if not self.graph.has_edge(a, b):
+                self.graph.add_edge(a, b)
+            self.graph[a][b][self.weight] = w
+
+        changed = {}
+        if w == old:
+            return changed
+        adjacency = self.graph.weighted_adjacency(weight=self.weight)
+        for source, tree in self.trees.items():
+            if w is not None and (old is None or w < old):
+                touched = self._decrease(tree, adjacency, a, b, w)
+            else:
+                touched = self._increase(tree, adjacency, a, b)
+            if touched:
+                changed[source] = sorted(self._below(tree, touched), key=str)
+        return changed
+
+    def _attach(self, tree, v, p):
+        # Make p the parent of v in the tree (p None: detach v).
+        _, pred, children = tree
+        old = pred.get(v)
+        if old is not None:
+            children[old].discard(v)
+        if p is None:
+            pred.pop(v, None)
+        else:
+            pred[v] = p
+            children.setdefault(p, set()).add(v)
+
+    def _decrease(self, tree, adjacency, a, b, w):
+        # Dijkstra from the ends of the cheaper edge, through the
+        # vertices it makes strictly cheaper. Returns those vertices.
+        dist, pred, _ = tree
+        tie = count()
+        heap = []
+        for x, y in ((a, b), (b, a)):
+            if x in dist and dist[x] + w < dist.get(y, float("inf")):
+                heapq.heappush(heap, (dist[x] + w, next(tie), y, x))
+
+        touched = set()
+        while heap:
+            d, _, v, p = heapq.heappop(heap)
+            if d >= dist.get(v, float("inf")):
+                continue
+            dist[v] = d
+            self._attach(tree, v, p)
+            touched.add(v)
+            for u, c in adjacency(v):
+                if d + c < dist.get(u, float("inf")):
+                    heapq.heappush(heap, (d + c, next(tie), u, v))
+        return touched
+
+    def _increase(self, tree, adjacency, a, b):
+        # Re-route the subtree hanging below (a, b) if it is a tree
+        # edge. Returns the vertices of that subtree.
+        dist, pred, children = tree
+        if pred.get(b) == a:
+            top = b
+        elif pred.get(a) == b:
+            top = a
+        else:
+            return set()
+
+        affected = set()
+        stack = [top]
+        while stack:
+            v = stack.pop()
+            affected.add(v)
+            stack.extend(children.get(v, ()))
+        old = {v: (dist.pop(v), pred.get(v)) for v in affected}
+        for v in affected:
+            self._attach(tree, v, None)
+
+        # best way into the subtree from the rest of the tree
+        tie = count()
+        heap = []
+        for v in affected:
+            for u, c in adjacency(v):
+                if u in dist:
+                    heapq.heappush(heap, (dist[u] + c, next(tie), v, u))
+
+        while heap:
+            d, _, v, p = heapq.heappop(heap)
+            if v in dist:
+                continue
+            dist[v] = d
+            self._attach(tree, v, p)
+            for u, c in adjacency(v):
+                if u in affected and u not in dist:
+                    heapq.heappush(heap, (d + c, next(tie), u, v))
+
+        return {v for v in affected if (dist.get(v), pred.get(v)) != old[v]}
+
+    def _below(self, tree, vertices):
+        # vertices and everything below them in the tree: a new parent
+        # changes the route to the whole subtree.
+        children = tree[2]
+        result = set()
+        stack = list(vertices)
+        while stack:
+            v = stack.pop()
+            if v not in result:
+                result.add(v)
+                stack.extend(children.get(v, ()))
+        return result
+
+
+def k_shortest_paths(graph, source, target, k, metric="weight"):
+    # Yen's algorithm: up to k loopless source -> target paths as
+    # (path, cost) pairs, cheapest first.
+    # Each new path comes from a spur search: keep a prefix (the root)
+    # of an accepted path, mask the root's other vertices and the
+    # next edge of every accepted path sharing that root, and route
+    # from the root's last vertex. As in Lawler's variant, a path is
+    # only spurred from where it left its parent path, since earlier
+    # roots were already tried; identical spur searches are cached.
+    if callable(metric):
+        adjacency = graph.weighted_adjacency(cost=metric)
+    else:
+        adjacency = graph.weighted_adjacency(weight=metric)
+
+    path, cost = shortest_path(graph, source, target, metric)
+    if path is None or k < 1:
+        return []
+
+    accepted = [(path, cost, 0)]
+    seen = {tuple(path)}
+    candidates = []
+    tie = count()
+    spurs = {}
+
+    while len(accepted) < k:
+        path, _, deviation = accepted[-1]
+
+        # cost of every prefix of path
+        prefix = [0]
+        for a, b in zip(path, path[1:]):
+            prefix.append(prefix[-1] + dict(adjacency(a))[b])
+
+        for i in range(deviation, len(path) - 1):
+            root = path[:i + 1]
+            edges = frozenset((p[i], p[i + 1]) for p, _, _ in accepted
+                              if len(p) > i + 1 and p[:i + 1] == root)
+            vertices = frozenset(root[:-1])
+            key = (root[-1], vertices, edges)
+            if key not in spurs:
+                masked = MaskedGraph(graph, vertices, edges)
+                spurs[key] = shortest_path(masked, root[-1], target, metric)
+            spur, spur_cost = spurs[key]
+            if spur is None:
+                continue
+            candidate = root[:-1] + spur
+            if tuple(candidate) not in seen:
+                seen.add(tuple(candidate))
+                heapq.heappush(candidates, (prefix[i] + spur_cost, next(tie), candidate, i))
+
+        if not candidates:
+            break
+        cost, _, path, deviation = heapq.heappop(candidates)
+        accepted.append((path, cost, deviation))
+
+    return [(path, cost) for path, cost, _ in accepted]
+
+
+def dijkstra(graph, source, cost=lambda u, v: 1, weight=None):
+    # Returns dict mapping target -> path .
+    # weight: name of an edge attribute to use instead of cost.
+    dist, pred = dijkstra_tree(graph, source, cost, weight)
+    paths = {v: path_to(pred, v) for v in dist}
 
     # Optionally sort
     return dict(sorted(paths.items(), key=lambda kv: kv[0]))
 
 
-def visualize(graph, view="view", name="mygraph", nodecolors=None):
-    # Visualize a graph with graphviz.
-    dot = GVGraph(name)
+def geo_positions(graph, scale=100.0):
+    # Node positions (in inches, from the south-west corner) from
+    # vertex values with lat and lon attributes (stop records) or a
+    # "position" [lat, lon] (stop dicts); None if some vertex has none.
+    # Longitude is shrunk by cos(latitude) so distances look right.
+    coords = {}
+    for v in graph.vertices():
+        value = graph.get_vertex_value(v)
+        if hasattr(value, "lat"):
+            lat, lon = value.lat, value.lon
+        elif isinstance(value, dict) and len(value.get("position") or ()) == 2:
+            lat, lon = value["position"]
+        else:
+            return None
+        lat, lon = float(lat), float(lon)
+        if lat != lat or lon != lon:
+            return None
+        coords[v] = (lat, lon)
+    if not coords:
+        return None
+    lat0 = min(lat for lat, _ in coords.values())
+    lon0 = min(lon for _, lon in coords.values())
+    shrink = math.cos(math.radians(sum(lat for lat, _ in coords.values()) / len(coords)))
+    return {v: ((lon - lon0) * shrink * scale, (lat - lat0) * scale)
+            for v, (lat, lon) in coords.items()}
+
+
+def build_dot(graph, name="mygraph", nodecolors=None, positions=None):
+    # The graphviz graph of visualize(). With positions, nodes are
+    # pinned there and neato only draws the edges.
+    if positions is None:
+        dot = GVGraph(name)
+    else:
+        dot = GVGraph(name, engine="neato")
 
     nodecolors = nodecolors or {}
 
@@ -96,11 +761,104 @@ def visualize(graph, view="view", name="mygraph", nodecolors=None):
     for v in graph.vertices():
         label = str(v)
         color = nodecolors.get(label, "black")
-        dot.node(label, label=label, color=color)
+        if positions is None:
+            dot.node(label, label=label, color=color)
+        else:
+            x, y = positions[v]
+            dot.node(label, label=label, color=color, pos=f"{x:.3f},{y:.3f}!")
 
     # Add edges
     for a, b in graph.edges():
         dot.edge(str(a), str(b))
+    return dot
+
+
+# stroke colour of a node shape in graphviz SVG output
+SVG_NODE = re.compile(
+    r'<g id="[^"]*" class="node">\s*<title>(.*?)</title>\s*<(?:ellipse|polygon)[^>]*?stroke="([^"]*)"',
+    re.S)
+
+
+class CachedRendering:
+    # A graph laid out once (to SVG); colouring nodes afterwards only
+    # rewrites their stroke colours in the cached SVG text, so no
+    # Graphviz layout runs per picture.
+
+    def __init__(self, dot):
+        # dot: the graphviz graph to lay out, see build_dot()
+        self.dot = dot
+        self._svg = None
+        self._pieces = None
+
+    def svg(self):
+        # Laid-out SVG with every node black (the layout runs here, once).
+        if self._svg is None:
+            self._svg = self.dot.pipe(format="svg").decode("utf-8")
+        return self._svg
+
+    def _split(self):
+        # SVG text around the stroke colour of each node: text[0],
+        # colour of nodes[0], text[1], ...
+        if self._pieces is None:
+            svg = self.svg()
+            texts = []
+            nodes = []
+            start = 0
+            for match in SVG_NODE.finditer(svg):
+                texts.append(svg[start:match.start(2)])
+                nodes.append(html.unescape(match.group(1)))
+                start = match.end(2)
+            texts.append(svg[start:])
+            self._pieces = (texts, nodes)
+        return self._pieces
+
+    def colored(self, nodecolors=None):
+        # SVG text with nodes coloured as in visualize().
+        nodecolors = nodecolors or {}
+        texts, nodes = self._split()
+        parts = [texts[0]]
+        for node, text in zip(nodes, texts[1:]):
+            parts.append(nodecolors.get(node, "black"))
+            parts.append(text)
+        return "".join(parts)
+
+    def render(self, filename, nodecolors=None):
+        with open(filename, "w", encoding="utf-8") as f:
+            f.write(self.colored(nodecolors))
+        return filename
+
+
+# graph -> {(name, geo): (digest of the dot source, CachedRendering)}
+_renderings = weakref.WeakKeyDictionary()
+
+
+def cached_rendering(graph, name="mygraph", geo=True):
+    # The CachedRendering of graph, made on first use. With geo, nodes
+    # are pinned to their positions when all vertices have one.
+    # The dot source (vertices, edges and positions) is cheap to build
+    # next to a layout, and its hash decides whether the cached layout
+    # still fits: any change to the graph makes a new rendering.
+    positions = geo_positions(graph) if geo else None
+    dot = build_dot(graph, name, positions=positions)
+    digest = hashlib.sha256(dot.source.encode("utf-8")).hexdigest()
+    cache = _renderings.setdefault(graph, {})
+    key = (name, geo)
+    if key not in cache or cache[key][0] != digest:
+        cache[key] = (digest, CachedRendering(dot))
+    return cache[key][1]
+
+
+def visualize(graph, view="view", name="mygraph", nodecolors=None, geo=False):
+    # Visualize a graph with graphviz.
+    # geo: draw stops at their map positions, reusing one cached
+    # layout per graph (writes name.svg)
+    if geo:
+        filename = cached_rendering(graph, name).render(f"{name}.svg", nodecolors)
+        if view == "view":
+            graphviz.view(filename)
+        return filename
+
+    dot = build_dot(graph, name, nodecolors)
 
     # Render
     if view == "view":
@@ -110,12 +868,26 @@ def visualize(graph, view="view", name="mygraph", nodecolors=None):
     else:
         dot.render()
 
-def view_shortest(G, source, target, cost=lambda u, v: 1):
+
+def visualize_many(graph, highlights, name="mygraph", geo=True):
+    # Render one picture per nodecolors dict in highlights, all from
+    # the same cached layout. Returns the files (name_0.svg, ...).
+    rendering = cached_rendering(graph, name, geo)
+    return [rendering.render(f"{name}_{i}.svg", nodecolors)
+            for i, nodecolors in enumerate(highlights)]
+
+def view_shortest(G, source, target, cost=lambda u, v: 1, table=None, geo=False):
     # Print and visualize the shortest path
-    paths = dijkstra(G, source, cost)
-    path = paths[target]
-    print(path)
+    # table: an all-pairs table (see allpairs.py) to read the path and
+    # its cost from, instead of running dijkstra
+    # geo: draw on the cached map layout (see visualize())
+    if table is not None:
+        path = table.path(source, target)
+        print(path, table.distance(source, target))
+    else:
+        paths = dijkstra(G, source, cost)
+        path = paths[target]
+        print(path)
     colormap = {str(v): 'orange' for v in path}
     print(colormap)
-    visualize(G, view='view', nodecolors=colormap)
-
+    visualize(G, view='view', nodecolors=colormap, geo=geo)
@@ -0,0 +1,313 @@
+# Contraction Hierarchies for fast route queries (extra feature)
+#
+# Preprocessing contracts the stops one at a time, least important
+# first. When a stop is removed, a shortcut edge is added between two
+# of its neighbours unless a path at most as cheap avoids the stop (a
+# witness). Every stop then keeps only its upward edges: those to the
+# neighbours it still had when it was contracted, all of higher rank.
+#
+# A query runs Dijkstra upward from both ends; the cheapest stop
+# reached by both searches lies on a shortest path. Shortcuts remember
+# the stop they bypass, so the path unpacks back into real stops.
+#
+# The tram graph is undirected, so one upward graph serves both
+# searches. Hierarchies are stored with the sections of trambin.py:
+#   meta                 [number of stops, 1 if the costs are integers]
+#   stopoff, stopstr     string table of stop names, in rank order
+#   upptr, upto          upward edges of stop i: upto[upptr[i]:upptr[i + 1]]
+#   upcost, upmid        cost of each upward edge and the stop a
+#                        shortcut bypasses (-1 for a real edge)
+#   hash                 content_hash() of the network it was built from
+
+import heapq
+import os
+import weakref
+from itertools import count
+
+import numpy as np
+
+from .trambin import pack_strings, read_sections, write_sections
+
+INF = float("inf")
+
+# witness searches give up after settling this many stops; a missed
+# witness only adds a superfluous shortcut, never a wrong answer
+WITNESS_LIMIT = 200
+
+
+class ContractionHierarchy:
+
+    def __init__(self, names, upward, integer=True, content_hash=None):
+        # names: stops in rank order (rank = index)
+        # upward: per rank, a list of (higher rank, cost, bypassed rank or -1)
+        # content_hash: of the network it was built from, if known
+        self.names = names
+        self.content_hash = content_hash
+        self.ids = {name: i for i, name in enumerate(names)}
+        self.integer = integer
+        self.up = [[(w, c) for w, c, _ in edges] for edges in upward]
+        self.mid = {}
+        for v, edges in enumerate(upward):
+            for w, _, m in edges:
+                self.mid[(v, w)] = m
+                self.mid[(w, v)] = m
+
+    def __len__(self):
+        return len(self.names)
+
+    def _upward_search(self, heap, dist, pred, other, state, tie):
+        # Settle the next stop of one search and relax its upward edges.
+        # state = [mu, meeting stop]; tie numbers the heap entries
+        d, _, v = heapq.heappop(heap)
+        if v in dist:
+            return
+        dist[v] = d
+        if v in other and d + other[v] < state[0]:
+            state[0] = d + other[v]
+            state[1] = v
+        for w, c in self.up[v]:
+            nd = d + c
+            if w not in dist and (w not in pred or nd < pred[w][1]):
+                pred[w] = (v, nd)
+                heapq.heappush(heap, (nd, next(tie), w))
+
+    def shortest_path(self, source, target, stats=None):
+        # Returns (path, cost), or (None, None) if target is unreachable,
+        # like graphs.shortest_path().
+        s = self.ids.get(source)
+        t = self.ids.get(target)
+        if s is None or t is None:
+            return None, None
+        if s == t:
+            if stats is not None:
+                stats["settled"] = 1
+            return [source], 0
+
+        # all query state is local, so one hierarchy serves concurrent
+        # requests
+        tie = count()
+        dist = ({}, {})
+        pred = ({s: (None, 0)}, {t: (None, 0)})
+        heaps = ([(0, next(tie), s)], [(0, next(tie), t)])
+        state = [INF, None]
+
+        # an upward search can stop once its next key reaches mu
+        while True:
+            live = [k for k in (0, 1) if heaps[k] and heaps[k][0][0] < state[0]]
+            if not live:
+                break
+            side = min(live, key=lambda k: heaps[k][0][0])
+            self._upward_search(heaps[side], dist[side], pred[side], dist[1 - side], state, tie)
+
+        if stats is not None:
+            stats["settled"] = len(dist[0]) + len(dist[1])
+
+        mu, meet = state
+        if meet is None:
+            return None, None
+
+        # up from source to meet, then down from meet to target
+        up = [meet]
+        while pred[0][up[-1]][0] is not None:
+            up.append(pred[0][up[-1]][0])
+        up.reverse()
+        down = [meet]
+        while pred[1][down[-1]][0] is not None:
+            down.append(pred[1][down[-1]][0])
+
+        ranks = [up[0]]
+        for a, b in zip(up + down[1:], up[1:] + down[1:]):
+            ranks.extend(self.unpack(a, b)[1:])
+
+        if self.integer:
+            mu = int(mu)
+        return [self.names[r] for r in ranks], mu
+
+    def unpack(self, a, b):
+        # Ranks along the real edges that the edge (a, b) stands for.
+        path = [a]
+        stack = [(a, b)]
+        while stack:
+            u, w = stack.pop()
+            m = self.mid[(u, w)]
+            if m < 0:
+                path.append(w)
+            else:
+                stack.append((m, w))
+                stack.append((u, m))
+        return path
+
+    def save(self, path):
+        # Write the hierarchy as a sections file; returns its size.
+        upptr = np.zeros(len(self.names) + 1, dtype="<u4")
+        upto = []
+        upcost = []
+        upmid = []
+        for v, edges in enumerate(self.up):
+            for w, c in edges:
+                upto.append(w)
+                upcost.append(c)
+                upmid.append(self.mid[(v, w)])
+            upptr[v + 1] = len(upto)
+
+        stopoff, stopstr = pack_strings(self.names)
+        sections = [
+            ("meta", np.array([len(self.names), int(self.integer)], dtype="<u8")),
+            ("stopoff", stopoff),
+            ("stopstr", stopstr),
+            ("upptr", upptr),
+            ("upto", np.array(upto, dtype="<u4")),
+            ("upcost", np.array(upcost, dtype="<i8" if self.integer else "<f8")),
+            ("upmid", np.array(upmid, dtype="<i4")),
+        ]
+        if self.content_hash is not None:
+            sections.append(("hash", np.frombuffer(self.content_hash.encode("ascii"), dtype="u1")))
+        # write next to path and swap it in, so that a request never
+        # reads a half-written file
+        size = write_sections(path + ".tmp", sections)
+        os.replace(path + ".tmp", path)
+        return size
+
+    @classmethod
+    def load(cls, path):
+        # Read a hierarchy written by save(); no preprocessing is run.
+        with open(path, "rb") as f:
+            s = read_sections(f.read())
+        n, integer = s["meta"].tolist()
+
+        offsets = s["stopoff"].tolist()
+        blob = s["stopstr"].tobytes()
+        names = [blob[a:b].decode("utf-8") for a, b in zip(offsets, offsets[1:])]
+
+        upptr = s["upptr"].tolist()
+        edges = list(zip(s["upto"].tolist(), s["upcost"].tolist(), s["upmid"].tolist()))
+        upward = [edges[upptr[v]:upptr[v + 1]] for v in range(n)]
+        content_hash = s["hash"].tobytes().decode("ascii") if "hash" in s else None
+        return cls(names, upward, bool(integer), content_hash)
+
+
+def _witness_costs(adj, source, skip, targets, limit):
+    # Dijkstra from source in the remaining graph without skip, up to
+    # cost limit; returns the costs found for the stops in targets.
+    dist = {}
+    best = {source: 0}
+    heap = [(0, source)]
+    left = len(targets)
+    while heap and len(dist) < WITNESS_LIMIT:
+        d, v = heapq.heappop(heap)
+        if v in dist:
+            continue
+        if d > limit:
+            break
+        dist[v] = d
+        if v in targets:
+            left -= 1
+            if left == 0:
+                break
+        for w, (c, _) in adj[v].items():
+            nd = d + c
+            if w != skip and w not in dist and (w not in best or nd < best[w]):
+                best[w] = nd
+                heapq.heappush(heap, (nd, w))
+    return dist
+
+
+def _shortcuts(adj, v):
+    # Shortcuts (u, w, cost) needed if v is contracted now.
+    neighbors = list(adj[v].items())
+    needed = []
+    for i, (u, (cu, _)) in enumerate(neighbors):
+        later = {w: cu + cw for w, (cw, _) in neighbors[i + 1:]}
+        if not later:
+            continue
+        found = _witness_costs(adj, u, v, later, max(later.values()))
+        for w, via in later.items():
+            if found.get(w, INF) > via:
+                needed.append((u, w, via))
+    return needed
+
+
+def build_hierarchy(graph, weight="weight", content_hash=None):
+    # Contract all vertices of graph, with the edge attribute weight as
+    # cost, and return the ContractionHierarchy. content_hash is that
+    # of the network (see TramNetwork.content_hash()) and is saved with
+    # the hierarchy.
+    # Vertices are ordered by edge difference (shortcuts added minus
+    # edges removed) plus the number of already contracted neighbours,
+    # which spreads contraction evenly; priorities are updated lazily.
+    adj = {v: {} for v in graph.vertices()}
+    integer = True
+    for a, b in graph.edges():
+        if a == b:
+            continue
+        c = graph[a][b][weight]
+        integer = integer and float(c).is_integer()
+        adj[a][b] = (c, None)
+        adj[b][a] = (c, None)
+
+    contracted_neighbors = {v: 0 for v in adj}
+
+    def priority(v):
+        return len(_shortcuts(adj, v)) - len(adj[v]) + contracted_neighbors[v]
+
+    tie = count()
+    heap = [(priority(v), next(tie), v) for v in adj]
+    heapq.heapify(heap)
+
+    order = []
+    upward = {}
+    while heap:
+        _, _, v = heapq.heappop(heap)
+        p = priority(v)
+        if heap and p > heap[0][0]:
+            heapq.heappush(heap, (p, next(tie), v))
+            continue
+
+        for u, w, c in _shortcuts(adj, v):
+            if w not in adj[u] or c < adj[u][w][0]:
+                adj[u][w] = (c, v)
+                adj[w][u] = (c, v)
+
+        upward[v] = [(w, c, m) for w, (c, m) in adj[v].items()]
+        for w in adj[v]:
+            del adj[w][v]
+            contracted_neighbors[w] += 1
+        del adj[v]
+        order.append(v)
+
+    rank = {v: i for i, v in enumerate(order)}
+    edges = []
+    for v in order:
+        edges.append([(rank[w], c, -1 if m is None else rank[m]) for w, c, m in upward[v]])
+    return ContractionHierarchy(order, edges, integer, content_hash)
+
+
+# path -> (mtime, hierarchy, graphs already checked against it); only
+# the latest version of each file is kept
+_loaded = {}
+
+
+def load_hierarchy(graph, path, content_hash):
+    # The hierarchy for graph saved at path, or None if there is no
+    # such file, it is unreadable, was built from a network with
+    # another content hash or has other stops. Hierarchies are only
+    # built offline (manage.py build_hierarchies); a loaded one is kept
+    # in memory until the file changes, and each graph is checked
+    # against it once.
+    if not os.path.exists(path):
+        return None
+    mtime = os.path.getmtime(path)
+    if path not in _loaded or _loaded[path][0] != mtime:
+        try:
+            hierarchy = ContractionHierarchy.load(path)
+        except ValueError:
+            return None
+        _loaded[path] = (mtime, hierarchy, weakref.WeakSet())
+    _, hierarchy, checked = _loaded[path]
+    if hierarchy.content_hash != content_hash:
+        return None
+    if graph not in checked:
+        if len(hierarchy) != len(graph) or not all(v in hierarchy.ids for v in graph.vertices()):
+            return None
+        checked.add(graph)
+    return hierarchy
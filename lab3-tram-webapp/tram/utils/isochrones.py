@@ -0,0 +1,108 @@
+# Isochrones: everything reachable within a budget (extra feature)
+#
+# A multi-source Dijkstra on the frozen CSR graph (graphs.FrozenGraph)
+# that stops as soon as the next cost exceeds the budget. Results are
+# cost arrays indexed by stop id (frozen.names), inf where the budget
+# is not enough, so many results stack into one matrix.
+
+import heapq
+import multiprocessing
+import os
+
+import numpy as np
+from django.conf import settings
+
+from .color_tram_svg import color_svg_network
+
+# batches smaller than this run in the calling process
+POOL_MIN = 1000
+
+# queries per pool task
+QUERY_CHUNK = 128
+
+# (share of the budget, colour) bands for render_isochrone()
+BANDS = [(1 / 3, "darkgreen"), (2 / 3, "limegreen"), (1, "yellow")]
+
+
+def reachable_costs(frozen, origins, budget, weight="weight"):
+    # Cheapest cost from any of origins to every stop, as a float array;
+    # stops beyond budget get inf. Unknown origins are ignored.
+    n = len(frozen)
+    costs = np.full(n, np.inf)
+    adjacency = frozen.id_adjacency(weight)
+    dist = {}
+    heap = [(0, frozen.ids[o]) for o in origins if o in frozen.ids]
+    heapq.heapify(heap)
+
+    while heap:
+        d, i = heapq.heappop(heap)
+        if d > budget:
+            break
+        if i in dist:
+            continue
+        dist[i] = d
+        for j, c in adjacency(i):
+            if j not in dist and d + c <= budget:
+                heapq.heappush(heap, (d + c, j))
+
+    if dist:
+        costs[list(dist)] = list(dist.values())
+    return costs
+
+
+# the frozen network and weight of a pool worker, see _init_worker()
+_worker = {}
+
+
+def _init_worker(frozen, weight):
+    _worker["frozen"] = frozen
+    _worker["weight"] = weight
+
+
+def _run_chunk(queries):
+    return [reachable_costs(_worker["frozen"], origins, budget, _worker["weight"])
+            for origins, budget in queries]
+
+
+def isochrones(network, queries, weight="weight", workers=None):
+    # Costs for a batch of (origins, budget) queries as a matrix with
+    # one row per query (columns follow frozen.names), and the frozen
+    # graph used. Batches of POOL_MIN queries or more, or any batch
+    # when workers > 1 is given, are spread over a process pool; every
+    # worker gets the frozen network once, not once per query.
+    frozen = network.freeze()
+    queries = [(list(origins), budget) for origins, budget in queries]
+    if workers == 1 or (workers is None and len(queries) < POOL_MIN):
+        rows = [reachable_costs(frozen, origins, budget, weight) for origins, budget in queries]
+    else:
+        chunks = [queries[k:k + QUERY_CHUNK] for k in range(0, len(queries), QUERY_CHUNK)]
+        with multiprocessing.Pool(workers, _init_worker, (frozen, weight)) as pool:
+            rows = [row for chunk in pool.imap(_run_chunk, chunks) for row in chunk]
+
+    matrix = np.vstack(rows) if rows else np.empty((0, len(frozen)))
+    return matrix, frozen
+
+
+def reachable_stops(frozen, costs):
+    # {stop: cost} for the stops a cost array reaches.
+    return {frozen.names[i]: float(costs[i]) for i in np.flatnonzero(np.isfinite(costs))}
+
+
+def render_isochrone(frozen, costs, budget, outfile, infile=None):
+    # Colour the tram map by cost: bands of BANDS for reached stops,
+    # white for the rest. Returns outfile.
+    if infile is None:
+        infile = os.path.join(settings.BASE_DIR, 'tram/templates/tram/images/gbg_tramnet.svg')
+    reached = reachable_stops(frozen, costs)
+
+    def colors(stop):
+        if stop not in reached:
+            return "white"
+        for share, color in BANDS:
+            if reached[stop] <= share * budget:
+                return color
+        return "white"
+
+    os.makedirs(os.path.dirname(outfile), exist_ok=True)
+    color_svg_network(infile, outfile, colormap=colors)
+    return outfile
@@ -0,0 +1,140 @@
+# Round-based routing with transfer counts, in the style of RAPTOR (extra feature)
+#
+# Round k finds the cheapest way to every stop using k rides, that is
+# k - 1 changes between lines. A round scans each line (in each
+# direction) at most once, from the first stop improved in the round
+# before, so the work grows with the lines, not with a stop x line
+# expanded graph. A stop's cost is only kept in a round if it beats
+# every earlier round, which leaves the Pareto set of (cost, changes).
+#
+# Without timetables a ride costs the sum of its segments and every
+# change costs a fixed penalty (changetime minutes, or changedistance
+# km when routing by distance), as in specialized_transition_time().
+
+from collections import namedtuple
+
+INF = float("inf")
+
+# one ride on a line: the line and the stops passed, both ends included
+Ride = namedtuple("Ride", "line stops")
+
+# a Pareto-optimal way to a stop
+Journey = namedtuple("Journey", "cost transfers rides")
+
+# default change penalties per metric
+CHANGE = {"time": 10, "distance": 0.02}
+
+
+class Raptor:
+
+    def __init__(self, linedict, timedict, distance=None):
+        # distance(stop1, stop2): segment length in km, needed for
+        # routing by "distance"
+        self.routes = []
+        self.stop_routes = {}
+
+        for line, stops in linedict.items():
+            for seq in (stops, stops[::-1]):
+                times = [0]
+                km = [0.0]
+                for s1, s2 in zip(seq, seq[1:]):
+                    a, b = sorted([s1, s2])
+                    times.append(times[-1] + timedict[a][b])
+                    if distance is not None:
+                        km.append(km[-1] + distance(s1, s2))
+                r = len(self.routes)
+                self.routes.append((line, seq, {"time": times, "distance": km}))
+                for i, stop in enumerate(seq):
+                    self.stop_routes.setdefault(stop, []).append((r, i))
+
+    def rounds(self, source, metric="time", change=None, max_transfers=None):
+        # Labels per round: a list whose entry k maps stops improved in
+        # round k to (cost, route, board position, alight position).
+        if change is None:
+            change = CHANGE[metric]
+        if source not in self.stop_routes:
+            return [{source: (0, None, None, None)}]
+
+        best = {source: 0}
+        labels = [{source: (0, None, None, None)}]
+        marked = {source}
+        k = 0
+        while marked and (max_transfers is None or k <= max_transfers):
+            k += 1
+            previous = labels[-1]
+            penalty = change if k > 1 else 0
+
+            # earliest improved position on every route
+            queue = {}
+            for stop in marked:
+                for r, i in self.stop_routes[stop]:
+                    if i < queue.get(r, INF):
+                        queue[r] = i
+
+            current = {}
+            for r, first in queue.items():
+                line, seq, offsets = self.routes[r]
+                offset = offsets[metric]
+                board = None
+                boarded = INF
+                for i in range(first, len(seq)):
+                    stop = seq[i]
+                    if board is not None:
+                        cost = boarded + offset[i]
+                        if cost < best.get(stop, INF):
+                            best[stop] = cost
+                            current[stop] = (cost, r, board, i)
+                    # board here if that beats staying on
+                    if stop in previous:
+                        start = previous[stop][0] + penalty - offset[i]
+                        if start < boarded:
+                            boarded = start
+                            board = i
+
+            labels.append(current)
+            marked = set(current)
+        return labels
+
+    def pareto(self, source, metric="time", change=None, max_transfers=None):
+        # For every reachable stop, its Pareto set of (cost, transfers).
+        labels = self.rounds(source, metric, change, max_transfers)
+        result = {source: [(0, 0)]}
+        for k in range(1, len(labels)):
+            for stop, label in labels[k].items():
+                result.setdefault(stop, []).append((label[0], k - 1))
+        return result
+
+    def journeys(self, source, target, metric="time", change=None, max_transfers=None):
+        # Pareto set of journeys from source to target, fewest
+        # transfers first (so with decreasing cost).
+        if source == target:
+            return [Journey(0, 0, [])]
+        labels = self.rounds(source, metric, change, max_transfers)
+
+        result = []
+        for k in range(1, len(labels)):
+            if target in labels[k]:
+                result.append(Journey(labels[k][target][0], k - 1,
+                                      self._rides(labels, k, target)))
+        return result
+
+    def _rides(self, labels, k, stop):
+        # Walk the labels back from stop in round k.
+        rides = []
+        while k > 0:
+            _, r, board, alight = labels[k][stop]
+            line, seq, _ = self.routes[r]
+            rides.append(Ride(line, seq[board:alight + 1]))
+            # the boarding stop was reached in the round before
+            stop = seq[board]
+            k -= 1
+        rides.reverse()
+        return rides
+
+
+def journey_summary(journey, unit="minutes"):
+    # One line description, e.g. "21 minutes, 1 change: line 6, then line 2"
+    changes = "change" if journey.transfers == 1 else "changes"
+    cost = journey.cost if unit == "minutes" else f"{journey.cost:.2f}"
+    lines = ", then ".join(f"line {ride.line}" for ride in journey.rides)
+    return f"{cost} {unit}, {journey.transfers} {changes}: {lines}"
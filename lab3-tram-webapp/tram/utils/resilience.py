@@ -0,0 +1,229 @@
+# What-if analysis: the network without one segment or one stop (extra feature)
+#
+# Baseline costs and shortest path trees come from one all-pairs table
+# (allpairs.py). A scenario only changes the trees that use the removed
+# segment or stop, and in each of them only the subtree hanging below
+# it: as in DynamicShortestPaths (graphs.py), that subtree is searched
+# again from its boundary with the rest of the tree, with the segment
+# or stop masked out of the frozen CSR graph instead of copied away.
+# Scenarios run in a process pool; every worker gets the frozen network
+# and the baseline once.
+
+import heapq
+import multiprocessing
+from collections import namedtuple
+
+import numpy as np
+
+from .allpairs import build_all_pairs
+
+# scenarios per pool task
+SCENARIO_CHUNK = 16
+
+# what: ("segment", stop1, stop2) or ("stop", stop)
+# unreachable: origin-destination pairs (unordered) that lose every path
+# mean_increase: mean extra cost over the pairs still connected
+# max_increase: largest extra cost of any pair
+# sources: sources searched again
+Impact = namedtuple("Impact", "what unreachable mean_increase max_increase sources")
+
+# cost, pred: all-pairs matrices in the order of frozen.names
+# trees: preorder() of the trees in pred
+# children: children() of every stop over all trees
+# finite: reachable pairs in all, and per row and column of cost
+Baseline = namedtuple("Baseline", "cost pred trees children finite")
+
+
+def baseline(network, frozen, weight="weight"):
+    # The Baseline of network: everything scenario_impact() reads that
+    # does not depend on the scenario, computed once.
+    table = build_all_pairs(network, weight)
+    order = np.array([table.ids[name] for name in frozen.names])
+    position = np.empty(len(order), dtype=np.int32)
+    position[order] = np.arange(len(order))
+    cost = table.cost[np.ix_(order, order)]
+    pred = table.pred[np.ix_(order, order)].astype(np.int32)
+    pred = np.where(pred >= 0, position[np.maximum(pred, 0)], -1)
+    reached = np.isfinite(cost)
+    finite = (int(np.count_nonzero(reached)),
+              np.count_nonzero(reached, axis=1), np.count_nonzero(reached, axis=0))
+    return Baseline(cost, pred, preorder(pred), children(pred), finite)
+
+
+def children(pred):
+    # (ptr, sources, stops): the children of v over all trees are
+    # stops[ptr[v]:ptr[v + 1]], in the trees of sources[...] alike.
+    sources, stops = np.nonzero(pred >= 0)
+    parents = pred[sources, stops]
+    by_parent = np.argsort(parents, kind="stable")
+    ptr = np.zeros(len(pred) + 1, dtype=np.int64)
+    ptr[1:] = np.cumsum(np.bincount(parents, minlength=len(pred)))
+    return ptr, sources[by_parent].astype(np.int32), stops[by_parent].astype(np.int32)
+
+
+def preorder(pred):
+    # Preorder numbering of every shortest path tree, so that subtrees
+    # are slices: the subtree of v in the tree of s is
+    # order[s, start[s, v]:end[s, v]]. Unreachable vertices come last.
+    n = len(pred)
+    order = np.empty((n, n), dtype=np.int32)
+    start = np.zeros((n, n), dtype=np.int32)
+    end = np.zeros((n, n), dtype=np.int32)
+    for s in range(n):
+        children = [[] for _ in range(n)]
+        for v, p in enumerate(pred[s].tolist()):
+            if p >= 0:
+                children[p].append(v)
+        seen = []
+        first = [0] * n
+        last = [0] * n
+        stack = [(s, False)]
+        while stack:
+            v, done = stack.pop()
+            if done:
+                last[v] = len(seen)
+                continue
+            first[v] = len(seen)
+            seen.append(v)
+            stack.append((v, True))
+            stack.extend((c, False) for c in children[v])
+        reached = set(seen)
+        seen.extend(v for v in range(n) if v not in reached)
+        order[s] = seen
+        start[s] = first
+        end[s] = last
+    return order, start, end
+
+
+def repair(adjacency, cost_row, cut, blocked):
+    # New costs of the vertices in cut (a subtree cut off from the
+    # tree), entering it from the rest of the tree; blocked(u, v) tells
+    # whether edge u -> v is masked. Unreachable vertices are left out.
+    inside = set(cut)
+    heap = []
+    for v in cut:
+        for u, c in adjacency(v):
+            if u not in inside and not blocked(u, v) and cost_row[u] < np.inf:
+                heap.append((cost_row[u] + c, v))
+    heapq.heapify(heap)
+
+    dist = {}
+    while heap:
+        d, v = heapq.heappop(heap)
+        if v in dist:
+            continue
+        dist[v] = d
+        for u, c in adjacency(v):
+            if u in inside and u not in dist and not blocked(v, u):
+                heapq.heappush(heap, (d + c, u))
+    return dist
+
+
+def scenario_impact(frozen, base, scenario, weight="weight"):
+    # Impact of one scenario; ids in scenario are frozen stop ids.
+    cost, pred, (order, start, end), (child_ptr, child_source, child_stop), finite = base
+    n = len(frozen)
+    adjacency = frozen.id_adjacency(weight)
+    keep = np.ones(n, dtype=bool)
+
+    if scenario[0] == "segment":
+        _, a, b = scenario
+        what = ("segment", frozen.names[a], frozen.names[b])
+        masked = {(a, b), (b, a)}
+
+        def blocked(u, v):
+            return (u, v) in masked
+
+        # sources whose tree uses the segment, and the end below it
+        cuts = {s: [b] for s in np.flatnonzero(pred[:, b] == a).tolist()}
+        cuts.update({s: [a] for s in np.flatnonzero(pred[:, a] == b).tolist()})
+    else:
+        _, v = scenario
+        what = ("stop", frozen.names[v])
+        keep[v] = False
+
+        def blocked(u, w):
+            return u == v or w == v
+
+        # the children of v in a tree head the subtrees to repair
+        # (together: a new path may run through another child's subtree)
+        cuts = {}
+        span = slice(child_ptr[v], child_ptr[v + 1])
+        for s, c in zip(child_source[span].tolist(), child_stop[span].tolist()):
+            if s != v:
+                cuts.setdefault(s, []).append(c)
+
+    lost = 0
+    delta = 0.0
+    worst = 0.0
+    for s, tops in cuts.items():
+        cut = [t for top in tops
+               for t in order[s, start[s, top]:end[s, top]].tolist() if keep[t]]
+        new = repair(adjacency, cost[s], cut, blocked)
+        for t in cut:
+            if t in new:
+                extra = new[t] - cost[s, t]
+                delta += extra
+                worst = max(worst, extra)
+            elif cost[s, t] < np.inf:
+                lost += 1
+
+    # pairs still connected, counted in both directions like lost: the
+    # reachable pairs without row and column of a removed stop, less
+    # the pairs of a stop with itself
+    reachable, rows, columns = finite
+    if not keep.all():
+        reachable -= int(rows[v]) + int(columns[v]) - 1
+    connected = reachable - int(np.count_nonzero(keep)) - lost
+    mean = delta / connected if connected > 0 else 0.0
+    return Impact(what, lost // 2, float(mean), float(worst), len(cuts))
+
+
+# frozen network, baseline and weight of a pool worker
+_worker = {}
+
+
+def _init_worker(frozen, base, weight):
+    _worker["frozen"] = frozen
+    _worker["base"] = base
+    _worker["weight"] = weight
+
+
+def _run_chunk(scenarios):
+    return [scenario_impact(_worker["frozen"], _worker["base"], scenario, _worker["weight"])
+            for scenario in scenarios]
+
+
+def resilience(network, stops=False, weight="weight", workers=None):
+    # Impact of removing every segment (or with stops, every stop) of
+    # network, most critical first: most pairs cut off, then largest
+    # mean increase.
+    frozen = network.freeze()
+    base = baseline(network, frozen, weight)
+
+    if stops:
+        scenarios = [("stop", v) for v in range(len(frozen))]
+    else:
+        ids = frozen.ids
+        scenarios = [("segment", ids[a], ids[b]) for a, b in frozen.edges()]
+
+    if workers == 1:
+        impacts = [scenario_impact(frozen, base, scenario, weight) for scenario in scenarios]
+    else:
+        chunks = [scenarios[k:k + SCENARIO_CHUNK]
+                  for k in range(0, len(scenarios), SCENARIO_CHUNK)]
+        with multiprocessing.Pool(workers, _init_worker, (frozen, base, weight)) as pool:
+            impacts = [impact for chunk in pool.imap(_run_chunk, chunks) for impact in chunk]
+
+    impacts.sort(key=lambda i: (-i.unreachable, -i.mean_increase, -i.max_increase))
+    return impacts
+
+
+def write_report(impacts, out, unit="minutes", top=None):
+    # Ranked table of impacts, as from resilience().
+    print(f"{'rank':>4}  {'removed':60} {'cut pairs':>9} {'mean +':>9} {'max +':>8}", file=out)
+    for rank, impact in enumerate(impacts[:top], 1):
+        removed = " - ".join(impact.what[1:])
+        print(f"{rank:4}  {removed[:60]:60} {impact.unreachable:9} "
+              f"{impact.mean_increase:9.4f} {impact.max_increase:8.2f}", file=out)
+    print(f"(mean + and max + in {unit}; cut pairs lose every connection)", file=out)
@@ -0,0 +1,363 @@
+# Shared read-only snapshot of the built tram network (extra feature)
+#
+# Under a prefork server (gunicorn, uwsgi) every worker would otherwise
+# read the network file and build its own TramNetwork: networkx dicts,
+# line and name indexes, distance tables. write_snapshot() stores all of
+# that, already built, as one trambin file (see trambin.py): the
+# sections of the network file, then
+#   node                 trambin stop id of every graph vertex, in graph order
+#   indptr, indices      CSR adjacency of the graph (graphs.FrozenGraph)
+#   w_time, w_dist       edge minutes ("weight") and km ("distance"),
+#                        integer arrays when all whole (FrozenGraph)
+#   geo                  condensed stop distance matrix (geo.StopCoordinates),
+#                        up to DISTANCE_MATRIX_LIMIT stops
+#   linebits             line bitset of every stop id (build_line_index()),
+#                        as little endian 64-bit words
+#   lineord              line table ids in numerical line order
+#   normoff, normstr     normalized names of the stop table (build_name_index())
+#   exactoff, exactstr, exactptr, exactids
+#                        distinct normalized names, sorted, and the stop ids
+#                        of name i: exactids[exactptr[i]:exactptr[i + 1]]
+#   gramoff, gramstr, gramptr, gramids
+#                        the same for the trigrams of the names
+#   hash                 content_hash() of the network
+#   apw_cost, apw_pred, apd_cost, apd_pred, ap_int
+#                        all-pairs tables by time and km (allpairs.py), with
+#                        compact costs, and whether the costs are integers;
+#                        only for networks up to ALLPAIRS_LIMIT stops
+#
+# NetworkSnapshot memory-maps the file, so workers share its pages and
+# memory stays flat as workers are added; attaching parses no JSON and
+# builds no graph. Only the timetable and RAPTOR routers still need the
+# line and time dicts, which are made on their first use.
+
+import logging
+import os
+from bisect import bisect_left
+from collections.abc import Mapping, Sequence
+
+import numpy as np
+
+from .graphs import FrozenGraph
+from .geo import Stop, StopCoordinates
+from .trambin import TramBinary, pack_strings, tram_sections, write_sections
+from .allpairs import AllPairs, build_all_pairs
+from .trams import (
+    TramNetwork,
+    readTramNetwork,
+    TRAM_FILE,
+    TRAM_BIN_FILE,
+    TRAM_SNAPSHOT_FILE,
+    ALLPAIRS_LIMIT,
+    ALLPAIRS_DIR,
+    DISTANCE_MATRIX_LIMIT,
+)
+from . import allpairs
+
+logger = logging.getLogger(__name__)
+
+# all-pairs section prefix per metric
+ALLPAIRS_SECTIONS = {"weight": "apw", "distance": "apd"}
+
+
+def _little_endian(array):
+    # array as stored in the file; integer weights stay integers
+    return array.astype(array.dtype.newbyteorder("<"))
+
+
+def _postings(prefix, items):
+    # Sections for sorted (key, ids) pairs, see the file layout above.
+    offsets, blob = pack_strings([key for key, _ in items])
+    ptr = np.zeros(len(items) + 1, dtype="<u4")
+    ptr[1:] = np.cumsum([len(ids) for _, ids in items])
+    ids = [i for _, posting in items for i in posting]
+    return [
+        (prefix + "off", offsets),
+        (prefix + "str", blob),
+        (prefix + "ptr", ptr),
+        (prefix + "ids", np.array(ids, dtype="<u4")),
+    ]
+
+
+def write_snapshot(network, path):
+    # Write network (a TramNetwork) and its indexes to path; returns the
+    # file size. The file is replaced in one step, so workers still
+    # using an older snapshot keep a consistent view of it.
+    names, sections = tram_sections(network.tramdict)
+    ids = {name: i for i, name in enumerate(names)}
+    frozen = network.freeze()
+
+    lineindex = network.lineindex
+    line_ids = {line: i for i, line in enumerate(network.linedict)}
+    words = max(1, -(-len(lineindex["lines"]) // 64))
+    bits = np.zeros((len(names), words), dtype="<u8")
+    for stop, b in lineindex["bits"].items():
+        bits[ids[stop]] = np.frombuffer(b.to_bytes(8 * words, "little"), dtype="<u8")
+
+    nameindex = network.nameindex
+    exact = [(key, [ids[stop] for stop in stops])
+             for key, stops in sorted(nameindex["exact"].items())]
+    grams = [(key, sorted(posting)) for key, posting in sorted(nameindex["grams"].items())]
+    normoff, normstr = pack_strings(nameindex["normed"])
+
+    sections += [
+        ("node", np.array([ids[v] for v in frozen.names], dtype="<u4")),
+        ("indptr", frozen.indptr.astype("<i4")),
+        ("indices", frozen.indices.astype("<i4")),
+        ("w_time", _little_endian(frozen.weights["weight"])),
+        ("w_dist", _little_endian(frozen.weights["distance"])),
+        ("linebits", bits.ravel()),
+        ("lineord", np.array([line_ids[line] for line in lineindex["lines"]], dtype="<u4")),
+        ("normoff", normoff),
+        ("normstr", normstr),
+    ]
+    coords = network.coords
+    if len(coords) <= DISTANCE_MATRIX_LIMIT:
+        if coords.matrix is None:
+            coords.build_matrix()
+        sections.append(("geo", coords.matrix.astype("<f4")))
+    sections += _postings("exact", exact)
+    sections += _postings("gram", grams)
+    sections.append(("hash", np.frombuffer(network.content_hash().encode("ascii"), dtype="u1")))
+
+    if len(frozen) <= ALLPAIRS_LIMIT:
+        # built on the frozen graph, so rows follow the node section
+        pred_type = "<i2" if len(frozen) < 2 ** 15 else "<i4"
+        integer = []
+        for metric, prefix in ALLPAIRS_SECTIONS.items():
+            table = build_all_pairs(frozen, metric)
+            sections.append((prefix + "_cost", table.compact_cost().ravel()))
+            sections.append((prefix + "_pred", table.pred.astype(pred_type).ravel()))
+            integer.append(table.integer)
+        sections.append(("ap_int", np.array(integer, dtype="u1")))
+
+    partial = path + ".tmp"
+    size = write_sections(partial, sections)
+    os.replace(partial, path)
+    return size
+
+
+class _StringTable(Sequence):
+    # A trambin string table as a sequence, decoded on access.
+
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self.blob[self.offsets[i]:self.offsets[i + 1]].tobytes().decode("utf-8")
+
+
+class _Postings:
+    # Sorted keys and their id lists, looked up by binary search; get()
+    # works like dict.get() on the index it was written from.
+
+    def __init__(self, sections, prefix, convert):
+        self.keys = _StringTable(sections[prefix + "off"], sections[prefix + "str"])
+        self.ptr = sections[prefix + "ptr"]
+        self.ids = sections[prefix + "ids"]
+        self.convert = convert
+
+    def get(self, key, default=None):
+        k = bisect_left(self.keys, key)
+        if k == len(self.keys) or self.keys[k] != key:
+            return default
+        return self.convert(self.ids[self.ptr[k]:self.ptr[k + 1]].tolist())
+
+
+class _LineBits:
+    # stop -> line bitset, as lineindex["bits"] of a TramNetwork.
+
+    def __init__(self, words, stop_ids):
+        self.words = words
+        self.stop_ids = stop_ids
+
+    def get(self, stop, default=0):
+        i = self.stop_ids.get(stop)
+        if i is None:
+            return default
+        return int.from_bytes(self.words[i].tobytes(), "little")
+
+
+class _StopRecords(Mapping):
+    # Read-only stop table: {stop: geo.Stop}, records made from the
+    # mapped arrays when a stop is looked up.
+
+    def __init__(self, binary, names, stop_ids):
+        self.binary = binary
+        self.names = names
+        self.stop_ids = stop_ids
+        self.towns = _StringTable(binary.sections["townoff"], binary.sections["townstr"])
+
+    def __len__(self):
+        return self.binary.n_stops
+
+    def __iter__(self):
+        return iter(self.names[:self.binary.n_stops])
+
+    def __contains__(self, stop):
+        return self.stop_ids.get(stop, self.binary.n_stops) < self.binary.n_stops
+
+    def __getitem__(self, stop):
+        if stop not in self:
+            raise KeyError(stop)
+        i = self.stop_ids[stop]
+        lat, lon = self.binary.positions[i].tolist()
+        return Stop(i, stop, self.towns[i], lat, lon)
+
+
+class NetworkSnapshot(FrozenGraph):
+    # Read-only TramNetwork-compatible view of a snapshot file: a
+    # FrozenGraph over the mapped CSR arrays, with the indexes that
+    # TramNetwork keeps (stops, lineindex, nameindex, coords) as
+    # views of the file too, so most queries are TramNetwork's own.
+
+    def __init__(self, path):
+        self.path = path
+        self.binary = TramBinary(path)
+        s = self.binary.sections
+        names = self.binary.names
+        super().__init__([names[i] for i in s["node"].tolist()], s["indptr"], s["indices"],
+                         {"weight": s["w_time"], "distance": s["w_dist"]})
+
+        n_stops = self.binary.n_stops
+        self.stop_ids = self.binary.stop_ids
+        self.stops = _StopRecords(self.binary, names, self.stop_ids)
+        # the network dictionaries as views of the file (see trambin.py);
+        # timetable() and raptor() read lines and times from them
+        self.tramdict = self.binary.tramdict()
+        self.stopdict = self.tramdict["stops"]
+        self.linedict = self.tramdict["lines"]
+        self.timedict = self.tramdict["times"]
+
+        positions = self.binary.positions
+        self.coords = StopCoordinates.from_arrays(names[:n_stops], positions[:, 0],
+                                                  positions[:, 1], s.get("geo"))
+
+        self.line_names = self.binary.line_names()
+        self.line_ids = {line: i for i, line in enumerate(self.line_names)}
+        self.lineindex = {
+            "lines": [self.line_names[i] for i in s["lineord"].tolist()],
+            "bits": _LineBits(s["linebits"].reshape(len(names), -1), self.stop_ids),
+        }
+
+        self.nameindex = {
+            "names": names[:n_stops],
+            "normed": _StringTable(s["normoff"], s["normstr"]),
+            "exact": _Postings(s, "exact", lambda ids: [names[i] for i in ids]),
+            "grams": _Postings(s, "gram", set),
+        }
+
+        self._hash = s["hash"].tobytes().decode("ascii")
+        self._tables = {}
+        self._timetables = {}
+        self._speed = None
+        self._raptor = None
+
+    # queries that only read the attributes above, as in TramNetwork
+    position = TramNetwork.position
+    geo_distance = TramNetwork.geo_distance
+    max_speed = TramNetwork.max_speed
+    distance_heuristic = TramNetwork.distance_heuristic
+    time_heuristic = TramNetwork.time_heuristic
+    content_hash = TramNetwork.content_hash
+    lines_via_stop = TramNetwork.lines_via_stop
+    lines_between_stops = TramNetwork.lines_between_stops
+    timetable = TramNetwork.timetable
+    hierarchy = TramNetwork.hierarchy
+    raptor = TramNetwork.raptor
+    all_stops = TramNetwork.all_stops
+    extreme_positions = TramNetwork.extreme_positions
+    resolve_stop_name = TramNetwork.resolve_stop_name
+    k_shortest_paths = TramNetwork.k_shortest_paths
+
+    def transition_time(self, stop1, stop2):
+        # Return travel time in minutes, or None if not adjacent.
+        if not self.has_edge(stop1, stop2):
+            return None
+        minutes = self.get_weight(stop1, stop2, "weight")
+        if isinstance(minutes, float) and minutes.is_integer():
+            return int(minutes)
+        return minutes
+
+    def freeze(self, weights=("weight", "distance")):
+        # Already frozen.
+        return self
+
+    def all_pairs(self, metric="weight"):
+        # The stored all-pairs table for metric, or as TramNetwork does
+        # for snapshots of networks too large to store one.
+        prefix = ALLPAIRS_SECTIONS[metric]
+        s = self.binary.sections
+        if prefix + "_cost" not in s:
+            return allpairs.load_all_pairs(ALLPAIRS_DIR, metric, self.content_hash())
+        if metric not in self._tables:
+            n = len(self.names)
+            integer = bool(s["ap_int"][list(ALLPAIRS_SECTIONS).index(metric)])
+            self._tables[metric] = AllPairs(self.names, s[prefix + "_cost"].reshape(n, n),
+                                            s[prefix + "_pred"].reshape(n, n), integer)
+        return self._tables[metric]
+
+    def stops_on_line(self, line):
+        # Return all stops on a line.
+        stops = self.binary.line_stops(self.line_ids[line]).tolist()
+        return [self.binary.stop_name(i) for i in stops]
+
+    def all_lines(self):
+        # Return all line numbers, sorted.
+        return list(self.lineindex["lines"])
+
+
+# the snapshot this process uses, see shared_network()
+_attached = {}
+
+# without a usable snapshot: the network read from the network files,
+# keyed on their modification times, and the (path, reason) pairs
+# already logged
+_fallback = {}
+_reported = set()
+
+
+def _mtime(path):
+    return os.path.getmtime(path) if os.path.exists(path) else None
+
+
+def _fallback_network(path, reason):
+    # readTramNetwork(), once per process and again only when the
+    # network files change; logs why the snapshot is not used once.
+    if (path, reason) not in _reported:
+        _reported.add((path, reason))
+        logger.warning("tram snapshot %s is %s, reading the network file instead "
+                       "(run manage.py build_snapshot)", path, reason)
+    key = (_mtime(TRAM_FILE), _mtime(TRAM_BIN_FILE))
+    if key not in _fallback:
+        network = readTramNetwork()
+        _fallback.clear()
+        _fallback[key] = network
+    return _fallback[key]
+
+
+def shared_network(path=TRAM_SNAPSHOT_FILE):
+    # The network for serving requests: the snapshot at path if it is
+    # at least as new as the network file, attached once per process;
+    # otherwise a TramNetwork read from the network file, also kept
+    # for the process.
+    if not os.path.exists(path):
+        return _fallback_network(path, "missing")
+    if os.path.exists(TRAM_FILE) and os.path.getmtime(path) < os.path.getmtime(TRAM_FILE):
+        return _fallback_network(path, "older than the network file")
+    key = (path, os.path.getmtime(path))
+    if key not in _attached:
+        try:
+            snapshot = NetworkSnapshot(path)
+        except ValueError:
+            # older format version, until build_snapshot is run again
+            return _fallback_network(path, "in an older format")
+        _attached.clear()
+        _attached[key] = snapshot
+    return _attached[key]
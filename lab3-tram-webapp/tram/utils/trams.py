@@ -1,7 +1,13 @@
+import hashlib
 import json
-import math
 import os
 from .graphs import WeightedGraph
+from .geo import StopCoordinates, haversine, stop_table
+from .trambin import StopEntries, TramBinary, stop_entries
+from .connections import Timetable, line_runs
+from .hierarchy import load_hierarchy
+from .raptor import Raptor
+from . import allpairs
 from django.conf import settings
 
 
@@ -9,20 +15,63 @@ from django.conf import settings
 # TRAM_FILE = os.path.join(settings.BASE_DIR, 'static/tramnetwork.json')
 TRAM_FILE = os.path.join(settings.BASE_DIR, "static", "tramnetwork.json")
 
+# binary copy written by Lab 1 init, used when present (see trambin.py)
+TRAM_BIN_FILE = os.path.join(settings.BASE_DIR, "static", "tramnetwork.bin")
+
+# prebuilt network shared by server workers, written by
+# "python manage.py build_snapshot" (see snapshot.py)
+TRAM_SNAPSHOT_FILE = os.path.join(settings.BASE_DIR, "static", "tramnetwork.snap")
+
+# above this many stops geo_distance() computes each distance instead
+# of keeping the condensed matrix (n * (n - 1) / 2 float32 values)
+DISTANCE_MATRIX_LIMIT = 5000
+
+# contraction hierarchies per routing metric (see hierarchy.py),
+# built by "python manage.py build_hierarchies"
+HIERARCHY_FILES = {
+    "weight": os.path.join(settings.BASE_DIR, "static", "hierarchy_time.bin"),
+    "distance": os.path.join(settings.BASE_DIR, "static", "hierarchy_geo.bin"),
+}
+
+# all-pairs tables, one file per metric and network version (see
+# allpairs.py), built by "python manage.py build_allpairs"; used for
+# networks up to ALLPAIRS_LIMIT stops
+ALLPAIRS_DIR = os.path.join(settings.BASE_DIR, "static", "cache")
+ALLPAIRS_LIMIT = 5000
+
+# service used for timetable routing: the first run of every line
+# leaves at TIMETABLE_FIRST (as in tramlines.txt), then every
+# TIMETABLE_HEADWAY minutes until TIMETABLE_LAST
+TIMETABLE_FIRST = 10 * 60
+TIMETABLE_LAST = 20 * 60
+TIMETABLE_HEADWAY = 10
+
 class TramNetwork(WeightedGraph):
 
     def __init__(self, tramdict):
         super().__init__()
 
-        self.tramdict = tramdict
+        # The stop records below are the only per-stop objects kept.
+        # stopdict is a view of the stop table in the arrays of the
+        # binary format (see trambin.py), either the mapped file or the
+        # JSON dicts packed once here; content_hash() and the snapshot
+        # rebuild the entries exactly as in the file only when they
+        # read them.
         self.stopdict = tramdict["stops"]
+        if not isinstance(self.stopdict, StopEntries):
+            self.stopdict = stop_entries(self.stopdict)
         self.linedict = tramdict["lines"]
         self.timedict = tramdict["times"]
+        self.tramdict = {"stops": self.stopdict, "lines": self.linedict, "times": self.timedict}
+
+        # stop records with the positions parsed (see geo.Stop), as
+        # the vertex values
+        self.stops = stop_table(self.stopdict)
 
         # Add all stops as vertices
-        for stop_name, info in self.stopdict.items():
+        for stop_name, stop in self.stops.items():
             self.add_vertex(stop_name)
-            self.set_vertex_value(stop_name, info)
+            self.set_vertex_value(stop_name, stop)
 
         # Add edges between adjacent stops
         for line, stops in self.linedict.items():
@@ -33,44 +82,142 @@ class TramNetwork(WeightedGraph):
                 # If the edge already exists, keep the smallest value
                 old = self.get_weight(s1, s2)
                 if old is None or minutes < old:
-                    self.set_weight(s1, s2, minutes)          
+                    self.set_weight(s1, s2, minutes)
+
+        # stop -> line bitset, built once for the line queries
+        self.lineindex = build_line_index(self.linedict)
+
+        # stop coordinates as float arrays; for networks of at most
+        # DISTANCE_MATRIX_LIMIT stops the pairwise distance matrix is
+        # filled on the first geo_distance() call
+        self.coords = StopCoordinates.from_stops(self.stops)
+
+        # geographic length of every edge, so routing by distance can
+        # read an edge attribute instead of calling geo_distance();
+        # one vectorized haversine over the edge endpoints
+        edges = list(self.edges())
+        ids = self.coords.ids
+        i = [ids[a] for a, _ in edges]
+        j = [ids[b] for _, b in edges]
+        lat, lon = self.coords.lat, self.coords.lon
+        km = haversine(lat[i], lon[i], lat[j], lon[j])
+        for (a, b), d in zip(edges, km.tolist()):
+            self[a][b]["distance"] = d
+
+        # normalized names and trigrams for resolve_stop_name()
+        self.nameindex = build_name_index(self.stops)
+
+        # connection arrays, built on the first timetable() call
+        self._timetables = {}
+
+        # (max speed, 0-minute length), see max_speed()
+        self._speed = None
+
+        # see content_hash()
+        self._hash = None
+
+        # line scanning router, built on the first raptor() call
+        self._raptor = None
 
 
     def position(self, stop):
-        # Return (lat, lon) as floats.
-        lat_str, lon_str = self.stopdict[stop]["position"]
-        return float(lat_str), float(lon_str)
+        # Return (lat, lon) as floats (NaN if the stop has no position).
+        stop = self.stops[stop]
+        return stop.lat, stop.lon
 
     def transition_time(self, stop1, stop2):
         # Return travel time in minutes, or None if not adjacent.
-        if not self.has_edge(stop1, stop2):
-            return None
-        a, b = sorted([stop1, stop2])
-        return self.timedict[a][b]
+        # the edge weight, without building a timedict entry
+        return self.get_weight(stop1, stop2)
 
     def geo_distance(self, stop1, stop2):
         # Return geographic distance in kilometers.
-        lat1, lon1 = self.position(stop1)
-        lat2, lon2 = self.position(stop2)
-
-        R = 6371.0  # Earth radius
-
-        p1 = math.radians(lat1)
-        p2 = math.radians(lat2)
-        dp = math.radians(lat2 - lat1)
-        dl = math.radians(lon2 - lon1)
-
-        a = (
-            math.sin(dp / 2) ** 2
-            + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
-        )
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-        return R * c
+        if self.coords.matrix is None and len(self.coords) <= DISTANCE_MATRIX_LIMIT:
+            self.coords.build_matrix()
+        return self.coords.distance(stop1, stop2)
+
+    def max_speed(self):
+        # Highest speed (km per minute) over edges with a positive time,
+        # and the total length of edges that take 0 minutes.
+        # Computed once; the network does not change after loading.
+        if self._speed is None:
+            speed = 0.0
+            free = 0.0
+            for a, b in self.edges():
+                minutes = self.transition_time(a, b)
+                km = self[a][b]["distance"]
+                if minutes > 0:
+                    speed = max(speed, km / minutes)
+                else:
+                    free += km
+            self._speed = (speed, free)
+        return self._speed
+
+    def distance_heuristic(self, target):
+        # A* lower bound for routing by "distance": the straight line.
+        # The small margin absorbs float32 rounding in the distance matrix.
+        return lambda v: self.coords.distance(v, target) * (1 - 1e-6)
+
+    def time_heuristic(self, target):
+        # A* lower bound for routing by time: straight-line distance at
+        # the highest speed seen on any edge. 0-minute edges may cover
+        # some distance for free, so their total length is taken off.
+        speed, free = self.max_speed()
+        if speed == 0:
+            return lambda v: 0
+        return lambda v: max(0.0, self.coords.distance(v, target) - free) / speed * (1 - 1e-6)
+
+    def freeze(self, weights=("weight", "distance")):
+        # Read-only CSR copy with time ("weight") and km ("distance")
+        # arrays, for routing without the networkx dicts.
+        return super().freeze(weights)
+
+    def content_hash(self):
+        # SHA-256 of the stops, lines and times, identifying this
+        # version of the network (e.g. for cached tables).
+        if self._hash is None:
+            # the dictionaries may be views of a binary file (trambin.py)
+            data = json.dumps([dict(self.stopdict), dict(self.linedict), dict(self.timedict)],
+                              sort_keys=True, ensure_ascii=False)
+            self._hash = hashlib.sha256(data.encode("utf-8")).hexdigest()
+        return self._hash
+
+    def all_pairs(self, metric="weight"):
+        # All-pairs costs and predecessors for metric ("weight" for
+        # time, "distance" for km) of this network version; None until
+        # manage.py build_allpairs has been run.
+        return allpairs.load_all_pairs(ALLPAIRS_DIR, metric, self.content_hash())
 
     def lines_via_stop(self, stop):
         # Return all line numbers passing this stop.
-        result = [line for line, stops in self.linedict.items() if stop in stops]
-        return sorted(result, key=int)
+        return lines_from_bits(self.lineindex, self.lineindex["bits"].get(stop, 0))
+
+    def lines_between_stops(self, stop1, stop2):
+        # Return all line numbers passing both stops.
+        bits = self.lineindex["bits"]
+        return lines_from_bits(self.lineindex, bits.get(stop1, 0) & bits.get(stop2, 0))
+
+    def timetable(self, first=TIMETABLE_FIRST, last=TIMETABLE_LAST, headway=TIMETABLE_HEADWAY):
+        # Scheduled departures of all lines in both directions, for
+        # Connection Scan routing (see connections.py).
+        key = (first, last, headway)
+        if key not in self._timetables:
+            runs = line_runs(self.linedict, self.timedict)
+            self._timetables[key] = Timetable(runs, first, last, headway)
+        return self._timetables[key]
+
+    def hierarchy(self, metric="weight"):
+        # Contraction hierarchy for routing by metric ("weight" for
+        # time, "distance" for km), loaded from disk when up to date;
+        # None until manage.py build_hierarchies has been run.
+        return load_hierarchy(self, HIERARCHY_FILES[metric], self.content_hash())
+
+    def raptor(self):
+        # Round-based router over the lines, for (cost, changes)
+        # trade-offs (see raptor.py).
+        if self._raptor is None:
+            self._raptor = Raptor(self.linedict, self.timedict, self.geo_distance)
+        return self._raptor
 
     def stops_on_line(self, line):
         # Return all stops on a line.
@@ -78,7 +225,7 @@ class TramNetwork(WeightedGraph):
 
     def all_stops(self):
         # Return all stop names, sorted.
-        return sorted(self.stopdict.keys())
+        return sorted(self.stops)
 
     def all_lines(self):
         # Return all line numbers, sorted.
@@ -87,36 +234,25 @@ class TramNetwork(WeightedGraph):
     def extreme_positions(self):
         # Return (min_lon, min_lat, max_lon, max_lat).
         # Used by tramviz.py for drawing.
-        lats = []
-        lons = []
-        for stop in self.stopdict:
-            lat, lon = self.position(stop)
-            lats.append(lat)
-            lons.append(lon)
+        # Stops without a position are left out.
+        lats = [stop.lat for stop in self.stops.values() if stop.lat == stop.lat]
+        lons = [stop.lon for stop in self.stops.values() if stop.lon == stop.lon]
         return min(lons), min(lats), max(lons), max(lats)
     
     def resolve_stop_name(self, raw):
         # exact key
-        if raw in self.stopdict:
+        if raw in self.stops:
             return raw
 
         norm = normalize_stop_name(raw)
 
         # exact normalized matches
-        exact_matches = []
-        for real in self.stopdict.keys():
-            if normalize_stop_name(real) == norm:
-                exact_matches.append(real)
-
+        exact_matches = self.nameindex["exact"].get(norm, [])
         if len(exact_matches) == 1:
             return exact_matches[0]
 
         # substring matches
-        substring_matches = []
-        for real in self.stopdict.keys():
-            if norm in normalize_stop_name(real):
-                substring_matches.append(real)
-
+        substring_matches = find_substring_matches(self.nameindex, norm)
         if len(substring_matches) == 1:
             return substring_matches[0]
 
@@ -131,11 +267,98 @@ def normalize_stop_name(name):
     return s
 
 
-def readTramNetwork():
-    # Read tramnetwork.json and return a TramNetwork object.
+def build_name_index(stops):
+    # Normalized names of stops (a stop table or stopdict), computed once:
+    # "exact" maps a normalized name to its stops,
+    # "grams" maps a trigram to the ids of the names containing it.
+    names = list(stops)
+    normed = [normalize_stop_name(name) for name in names]
+    exact = {}
+    grams = {}
+    for i, norm in enumerate(normed):
+        exact.setdefault(norm, []).append(names[i])
+        for k in range(len(norm) - 2):
+            grams.setdefault(norm[k:k + 3], set()).add(i)
+    return {"names": names, "normed": normed, "exact": exact, "grams": grams}
+
+
+def find_substring_matches(nameindex, norm, limit=2):
+    # Stops whose normalized name contains norm, at most limit of them
+    # (two are enough to know that a name is ambiguous).
+    names = nameindex["names"]
+    normed = nameindex["normed"]
+
+    if len(norm) < 3:
+        # too short for trigrams: scan the precomputed names
+        candidates = range(len(names))
+    else:
+        postings = []
+        for k in range(len(norm) - 2):
+            posting = nameindex["grams"].get(norm[k:k + 3])
+            if not posting:
+                return []
+            postings.append(posting)
+        postings.sort(key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates &= posting
+            if not candidates:
+                return []
+        candidates = sorted(candidates)
+
+    result = []
+    for i in candidates:
+        if norm in normed[i]:
+            result.append(names[i])
+            if len(result) >= limit:
+                break
+    return result
+
+
+def build_line_index(linedict):
+    # Map each stop to a bitset (an int) of the lines passing it.
+    # Bit i stands for lines[i], sorted numerically.
+    lines = sorted(linedict.keys(), key=int)
+    bits = {}
+    for i, line in enumerate(lines):
+        bit = 1 << i
+        for stop in linedict[line]:
+            bits[stop] = bits.get(stop, 0) | bit
+    return {"lines": lines, "bits": bits}
+
+
+def lines_from_bits(lineindex, bits):
+    # Decode a line bitset into the sorted list of line numbers.
+    lines = lineindex["lines"]
+    result = []
+    while bits:
+        low = bits & -bits
+        result.append(lines[low.bit_length() - 1])
+        bits ^= low
+    return result
+
+
+def load_tram_network():
+    # Load the network dictionaries, preferring the memory-mapped
+    # binary file unless tramnetwork.json is newer.
+    if os.path.exists(TRAM_BIN_FILE) and (
+            not os.path.exists(TRAM_FILE)
+            or os.path.getmtime(TRAM_BIN_FILE) >= os.path.getmtime(TRAM_FILE)):
+        try:
+            # views of the mapped file, see TramBinary.tramdict()
+            return TramBinary(TRAM_BIN_FILE).tramdict()
+        except ValueError:
+            # older format version: read the JSON file instead
+            if not os.path.exists(TRAM_FILE):
+                raise
+
     with open(TRAM_FILE, encoding="utf-8") as f:
-        data = json.load(f)
-    return TramNetwork(data)
+        return json.load(f)
+
+
+def readTramNetwork():
+    # Read the tram network and return a TramNetwork object.
+    return TramNetwork(load_tram_network())
 
 
 def specialize_stops_to_lines(network):
@@ -1,19 +1,40 @@
 # visualization of shortest path in Lab 3, modified to work with Django
 
 from .trams import (
-    readTramNetwork,
     specialize_stops_to_lines,
-    specialized_transition_time,
-    specialized_geo_distance,
+    ALLPAIRS_LIMIT,
 )
-from .graphs import dijkstra
+from .snapshot import shared_network
+from .graphs import shortest_path
 from .color_tram_svg import color_svg_network
+from .connections import clock, parse_clock, journey_stops, journey_text
+from .raptor import journey_summary
 import os
 from django.conf import settings
 from django.core.files.storage import default_storage
 
-def show_shortest(dep, dest):
-    network = readTramNetwork()
+# RAPTOR journeys by time and by km per (network version, dep, dest);
+# the oldest pair is dropped once OPTIONS_CACHE_SIZE pairs are kept
+OPTIONS_CACHE_SIZE = 1024
+_options = {}
+
+
+def route_options(network, dep, dest):
+    # (journeys by time, journeys by km) from dep to dest, see
+    # Raptor.journeys(); each pair is searched once.
+    key = (network.content_hash(), dep, dest)
+    if key not in _options:
+        if len(_options) >= OPTIONS_CACHE_SIZE:
+            del _options[next(iter(_options))]
+        raptor = network.raptor()
+        _options[key] = (raptor.journeys(dep, dest, "time"),
+                         raptor.journeys(dep, dest, "distance"))
+    return _options[key]
+
+
+def show_shortest(dep, dest, depart=None):
+    # depart: optional departure time (HH:MM) for a timetable route
+    network = shared_network()
     
     # resolve user-typed names to real stop names
     real_dep = network.resolve_stop_name(dep)
@@ -51,34 +72,34 @@ def show_shortest(dep, dest):
     # Specialise stops to (stop, line) graph
     spec_network = specialize_stops_to_lines(network)
 
-    # Quickest path (by time)
-    paths_time = dijkstra(
-        spec_network,
-        real_dep,
-        cost=lambda a, b: specialized_transition_time(spec_network, a, b)
-    )
-    quickest = paths_time.get(real_dest, [])
+    # The specialized costs are the stored edge attributes as long as
+    # line changes cost nothing, so the searches read those directly:
+    # "weight" is specialized_transition_time, "distance" is
+    # specialized_geo_distance.
+
+    # Without line specialization the stop graph is routed with
+    # precomputed all-pairs tables (see allpairs.py), or, for networks
+    # too large for those, contraction hierarchies (see hierarchy.py).
+    # Both are built offline; until they are, the search runs here.
+    def route(metric):
+        if spec_network is network:
+            if len(network) <= ALLPAIRS_LIMIT:
+                table = network.all_pairs(metric)
+            else:
+                table = network.hierarchy(metric)
+            if table is not None:
+                return table.shortest_path(real_dep, real_dest)
+        return shortest_path(spec_network, real_dep, real_dest, metric)
 
-    # compute total travel time
-    total_minutes = 0
-    for a, b in zip(quickest, quickest[1:]):
-        t = specialized_transition_time(spec_network, a, b)
-        if t:
-            total_minutes += t
+    # Quickest path (by time)
+    quickest, total_minutes = route("weight")
+    quickest = quickest or []
+    total_minutes = total_minutes or 0
 
     # Shortest path (by geographic distance)
-    paths_geo = dijkstra(
-        spec_network,
-        real_dep,
-        cost=lambda a, b: specialized_geo_distance(spec_network, a, b)
-    )
-    shortest = paths_geo.get(real_dest, [])
-
-    # compute total km
-    total_km = 0.0
-    for a, b in zip(shortest, shortest[1:]):
-        total_km += specialized_geo_distance(spec_network, a, b)
-
+    shortest, total_km = route("distance")
+    shortest = shortest or []
+    total_km = total_km or 0.0
 
     # build output texts
     time_text = (
@@ -91,6 +112,28 @@ def show_shortest(dep, dest):
         f", {total_km:.2f} km"
     )
 
+    # Trade-offs between cost and line changes, when there are any
+    by_time, by_distance = route_options(network, real_dep, real_dest)
+    if len(by_time) > 1:
+        time_text += ". Options: " + "; ".join(journey_summary(j) for j in by_time)
+    if len(by_distance) > 1:
+        dist_text += ". Options: " + "; ".join(journey_summary(j, "km") for j in by_distance)
+
+    # Earliest arrival when leaving at the given time
+    if depart:
+        legs = network.timetable().earliest_arrival(real_dep, real_dest, parse_clock(depart))
+        if legs is None:
+            time_text += f". No departure after {depart} reaches {real_dest}"
+        elif legs:
+            # the map shows this journey, so the text describes it too
+            quickest = journey_stops(legs)
+            arrival = legs[-1].arr_time
+            time_text = (
+                f"Quickest leaving {depart}: " + ", ".join(quickest) +
+                f", arriving {clock(arrival)}, {arrival - parse_clock(depart)} minutes" +
+                ". Scheduled: " + journey_text(legs)
+            )
+
     # Define stop-coloring rules for SVG
     def colors(stop):
         if stop in quickest and stop in shortest:
@@ -118,3 +161,18 @@ def show_shortest(dep, dest):
 
     # return the path texts to be shown in the web page
     return time_text, dist_text, outfile
+
+
+def show_alternatives(dep, dest, k):
+    # Up to k quickest loopless routes, as texts for the web page.
+    network = shared_network()
+    real_dep = network.resolve_stop_name(dep)
+    real_dest = network.resolve_stop_name(dest)
+    if real_dep is None or real_dest is None:
+        return []
+
+    spec_network = specialize_stops_to_lines(network)
+    return [
+        ", ".join(path) + f", {minutes} minutes"
+        for path, minutes in spec_network.k_shortest_paths(real_dep, real_dest, k, "weight")
+    ]
@@ -1,7 +1,7 @@
 from django.shortcuts import render
 from .forms import RouteForm
 
-from .utils.tramviz import show_shortest
+from .utils.tramviz import show_shortest, show_alternatives
 
 def tram_net(request):
     return render(request, 'tram/home.html', {})
@@ -12,7 +12,11 @@ def find_route(request):
         form = RouteForm(request.POST)
         if form.is_valid():
             route = form.data
-            timepath, geopath, outfile = show_shortest(route['dep'], route['dest'])
+            depart = form.cleaned_data.get('depart')
+            depart = depart.strftime("%H:%M") if depart else None
+            timepath, geopath, outfile = show_shortest(route['dep'], route['dest'], depart)
+            k = form.cleaned_data.get('k')
+            alternatives = show_alternatives(route['dep'], route['dest'], k) if k else []
             return render(
                 request,
                 'tram/show_route.html',
@@ -21,6 +25,7 @@ def find_route(request):
                     'timepath': timepath,
                     'geopath': geopath,
                     'shortest_path_svg': outfile,
+                    'alternatives': alternatives,
                 }
             )
     else: